@@ -0,0 +1,67 @@
+"""Run the I/O throughput probe over a file or disk image.
+
+Without --target a test file of --size-mb random bytes is written to a
+temporary directory first. Runs sequential and random reads (and writes to
+a scratch file with --writes) for every --block-sizes x --queue-depths
+combination and prints MB/s, IOPS and latency percentiles.
+
+    python benchmarks/bench_io_probe.py --size-mb 512 --writes
+    python benchmarks/bench_io_probe.py --target disk.img --output io.json
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import io_probe  # noqa: E402
+
+
+def write_target(path, size_mb):
+    # Random data: a sparse or zero file would be read from no disk at all
+    chunk = os.urandom(io_probe.MB)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(chunk)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", help="file or image to read (default: a new test file)")
+    parser.add_argument("--size-mb", type=int, default=256,
+                        help="size of the generated test file and of the write scratch file")
+    parser.add_argument("--block-sizes", default="4,64,1024",
+                        help="comma-separated block sizes in KB")
+    parser.add_argument("--queue-depths", default="1,4,16",
+                        help="comma-separated numbers of requests in flight")
+    parser.add_argument("--seconds", type=float, default=2.0, help="duration of each test")
+    parser.add_argument("--writes", action="store_true",
+                        help="also test writes, to a scratch file next to the target")
+    parser.add_argument("--output", help="write all results to this JSON file")
+    args = parser.parse_args(argv)
+
+    tests = io_probe.READ_TESTS + (io_probe.WRITE_TESTS if args.writes else ())
+    with tempfile.TemporaryDirectory() as directory:
+        target = args.target
+        if target is None:
+            target = os.path.join(directory, "target.bin")
+            write_target(target, args.size_mb)
+        results = []
+        for block_kb in (int(text) for text in args.block_sizes.split(",")):
+            for queue_depth in (int(text) for text in args.queue_depths.split(",")):
+                probe = io_probe.IOProbe(target, block_kb * io_probe.KB, queue_depth,
+                                         args.seconds,
+                                         scratch_dir=None if args.target else directory,
+                                         scratch_size=args.size_mb * io_probe.MB)
+                results.extend(probe.run(tests))
+        print(io_probe.format_results(results))
+        if args.output:
+            io_probe.save_report(args.output, results, target=args.target,
+                                 seconds=args.seconds)
+            print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark the layout health analyzer over a fleet.
+
+Times check_topology() on a fake WMI fleet of --disks x --partitions, then
+writes --images disk images (every third one with a misaligned partition,
+every fifth one with fragmented free space) and times check_images() on
+them. Prints the fleet summary; --output writes the image report as JSON.
+
+    python benchmarks/bench_layout_health.py --disks 512 --partitions 128 --images 500
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "fakes"))
+
+from fake_wmi import FakeWmiBackend  # noqa: E402
+import layout_health  # noqa: E402
+import partition_writer  # noqa: E402
+from topology import TopologyLoader  # noqa: E402
+
+MB = partition_writer.MB
+
+
+def write_images(directory, count):
+    for number in range(count):
+        path = os.path.join(directory, f"disk{number:05}.img")
+        layout = partition_writer.provision(path, 4096, "gpt", [512] * 4)
+        if number % 5 == 0:
+            layout.delete_partition(2)
+        if number % 3 == 0:
+            # Move the last partition 63 sectors in, as old partitioning tools did
+            offset, size, part_type, guid, bootable = layout.partitions[-1]
+            layout.partitions[-1] = (offset + 63 * 512, size - 63 * 512, part_type, guid,
+                                     bootable)
+        layout.save()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--disks", type=int, default=512)
+    parser.add_argument("--partitions", type=int, default=128)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", help="write the image fleet report to this JSON file")
+    args = parser.parse_args(argv)
+
+    topology = TopologyLoader(FakeWmiBackend.fleet(args.disks, args.partitions)).load()
+    start = time.perf_counter()
+    report = layout_health.check_topology(topology)
+    elapsed = time.perf_counter() - start
+    summary = report.summary()
+    print(f"WMI fleet: {summary['disks']:,} disks, {summary['partitions']:,} partitions "
+          f"in {elapsed * 1000:.1f} ms, {summary['partitions'] / elapsed:,.0f} partitions/s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_images(directory, args.images)
+        start = time.perf_counter()
+        report = layout_health.check_images(directory, ("*.img",), workers=args.workers)
+        elapsed = time.perf_counter() - start
+        print(f"Images: {len(report.disks):,} in {elapsed:.3f}s, "
+              f"{len(report.disks) / elapsed:,.0f} images/s")
+        print(f"  {report.summary()}")
+        expected = len(range(0, args.images, 3))
+        assert report.summary()["misaligned"] == expected, report.summary()
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report.to_dict(), f, indent=2)
+            print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
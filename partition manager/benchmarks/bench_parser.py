@@ -0,0 +1,73 @@
+"""Microbenchmark for diskpart_parser.
+
+Parses every fixture in benchmarks/fixtures repeatedly, then streams a
+synthetic ``list volume`` with --volumes rows through the parser one line at
+a time, and reports lines and records parsed per second.
+
+    python benchmarks/bench_parser.py --volumes 200000
+"""
+import argparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import diskpart_parser  # noqa: E402
+
+FIXTURES = {
+    "list_disk.txt": diskpart_parser.parse_disks,
+    "list_partition_gpt.txt": diskpart_parser.parse_partitions,
+    "list_partition_mbr.txt": diskpart_parser.parse_partitions,
+    "list_volume.txt": diskpart_parser.parse_volumes,
+    "detail_disk.txt": diskpart_parser.parse_disk_detail,
+    "detail_partition_gpt.txt": diskpart_parser.parse_partition_detail,
+    "detail_partition_mbr.txt": diskpart_parser.parse_partition_detail,
+}
+
+
+def volume_lines(count):
+    yield ""
+    yield "  Volume ###  Ltr  Label        Fs     Type        Size     Status     Info"
+    yield "  ----------  ---  -----------  -----  ----------  -------  ---------  --------"
+    for number in range(count):
+        yield (f"  Volume {number:<3}       {'LUN' + str(number):<11}  NTFS   "
+               f"Partition   {(number % 9000) + 10:>4} GB  Healthy")
+    yield ""
+
+
+def bench_fixtures(repeat):
+    texts = {}
+    for name in FIXTURES:
+        with open(os.path.join(HERE, "fixtures", name)) as f:
+            texts[name] = f.read()
+    lines = sum(text.count("\n") for text in texts.values()) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for name, parse in FIXTURES.items():
+            parse(texts[name])
+    elapsed = time.perf_counter() - start
+    print(f"fixtures: {repeat} x {len(texts)} files, {lines / elapsed:,.0f} lines/s")
+
+
+def bench_stream(count):
+    start = time.perf_counter()
+    records = sum(1 for _ in diskpart_parser.iter_volumes(volume_lines(count)))
+    elapsed = time.perf_counter() - start
+    assert records == count, records
+    print(f"list volume stream: {count:,} rows in {elapsed:.3f}s, "
+          f"{records / elapsed:,.0f} records/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--volumes", type=int, default=100000)
+    args = parser.parse_args(argv)
+    bench_fixtures(args.repeat)
+    bench_stream(args.volumes)
+
+
+if __name__ == "__main__":
+    main()
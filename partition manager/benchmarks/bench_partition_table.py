@@ -0,0 +1,88 @@
+"""Benchmark for the raw partition table reader.
+
+Writes --images sparse disk images (GPT with --partitions entries, and every
+fourth one MBR) into a temporary directory, then reads them back one at a
+time and with scan_images() over a process pool, and reports images per
+second. Also checks that a damaged primary GPT is read from the backup.
+
+    python benchmarks/bench_partition_table.py --images 2000 --workers 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import partition_table  # noqa: E402
+import partition_writer  # noqa: E402
+
+SECTOR = 512
+
+
+def write_image(path, size, style, partitions):
+    """Equal partitions, the last one taking whatever is left."""
+    size_mb = size // partition_writer.MB
+    sizes = [(size_mb - 2) // partitions] * (partitions - 1) + [None]
+    partition_writer.provision(path, size_mb, style, sizes)
+
+
+def make_images(directory, count, partitions, size):
+    for number in range(count):
+        path = os.path.join(directory, f"disk{number:05}.img")
+        if number % 4 == 3:
+            write_image(path, size, "mbr", min(partitions, 4))
+        else:
+            write_image(path, size, "gpt", partitions)
+
+
+def check_backup(directory, partitions, size):
+    path = os.path.join(directory, "damaged.bin")
+    write_image(path, size, "gpt", partitions)
+    with open(path, "r+b") as f:
+        f.seek(SECTOR + 40)
+        f.write(b"\xff")
+    layout = partition_table.read_layout(path)
+    assert layout.used_backup and len(layout.partitions) == partitions, layout
+    os.remove(path)
+    print("damaged primary GPT: read from backup")
+
+
+def bench_serial(directory):
+    paths = list(partition_table.iter_images(directory, ("*.img",)))
+    start = time.perf_counter()
+    partitions = sum(len(partition_table.read_layout(path).partitions) for path in paths)
+    elapsed = time.perf_counter() - start
+    print(f"serial: {len(paths):,} images, {partitions:,} partitions in {elapsed:.3f}s, "
+          f"{len(paths) / elapsed:,.0f} images/s")
+
+
+def bench_pool(directory, workers):
+    start = time.perf_counter()
+    results = list(partition_table.scan_images(directory, ("*.img",), workers=workers))
+    elapsed = time.perf_counter() - start
+    errors = [path for path, layout, error in results if error]
+    assert not errors, errors[:5]
+    print(f"process pool ({workers or os.cpu_count()} workers): {len(results):,} images "
+          f"in {elapsed:.3f}s, {len(results) / elapsed:,.0f} images/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=1000)
+    parser.add_argument("--partitions", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    size = args.size_mb * 1024 * 1024
+    with tempfile.TemporaryDirectory() as directory:
+        make_images(directory, args.images, args.partitions, size)
+        check_backup(directory, args.partitions, size)
+        bench_serial(directory)
+        bench_pool(directory, args.workers)
+
+
+if __name__ == "__main__":
+    main()
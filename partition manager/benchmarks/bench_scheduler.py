@@ -0,0 +1,138 @@
+"""Benchmark the job scheduler under a mixed load.
+
+Queues --mutations changes and --reads probes per disk on --disks disks, with
+each job sleeping to stand in for diskpart or WMI, and runs them three ways:
+one at a time, on a plain thread pool (what the GUI did before) and on
+jobs.JobScheduler. Reports the total time, the latency of interactive reads
+and how often two jobs touched the same disk while it was being changed.
+
+    python benchmarks/bench_scheduler.py --disks 8 --mutations 4 --reads 8
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from jobs import BACKGROUND, INTERACTIVE, JobScheduler  # noqa: E402
+
+
+class Workload:
+    """Records when each job touched which disk, to detect overlaps."""
+
+    def __init__(self, mutation_ms, read_ms):
+        self.mutation = mutation_ms / 1000
+        self.read = read_ms / 1000
+        self.lock = threading.Lock()
+        self.mutating = {}
+        self.conflicts = 0
+        self.latencies = []
+
+    def mutate(self, disk):
+        with self.lock:
+            if self.mutating.get(disk):
+                self.conflicts += 1
+            self.mutating[disk] = self.mutating.get(disk, 0) + 1
+        time.sleep(self.mutation)
+        with self.lock:
+            self.mutating[disk] -= 1
+
+    def probe(self, disk, queued, interactive):
+        with self.lock:
+            if self.mutating.get(disk):
+                self.conflicts += 1
+        time.sleep(self.read)
+        if interactive:
+            with self.lock:
+                self.latencies.append(time.perf_counter() - queued)
+
+
+def jobs_for(disks, mutations, reads):
+    """(kind, disk, interactive) in submission order, interleaved across disks."""
+    jobs = []
+    for round_ in range(max(mutations, reads)):
+        for disk in range(disks):
+            if round_ < mutations:
+                jobs.append(("mutate", disk, True))
+            if round_ < reads:
+                # Most reads are background refreshes; a few are clicks
+                jobs.append(("probe", disk, round_ % 4 == 0))
+    return jobs
+
+
+def run_serial(workload, jobs):
+    # Every job is queued at the start, as with the other runners
+    queued = time.perf_counter()
+    for kind, disk, interactive in jobs:
+        if kind == "mutate":
+            workload.mutate(disk)
+        else:
+            workload.probe(disk, queued, interactive)
+
+
+def run_pool(workload, jobs, workers):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for kind, disk, interactive in jobs:
+            if kind == "mutate":
+                futures.append(pool.submit(workload.mutate, disk))
+            else:
+                futures.append(pool.submit(workload.probe, disk, time.perf_counter(),
+                                           interactive))
+        wait(futures)
+
+
+def run_scheduler(workload, jobs, workers):
+    scheduler = JobScheduler(max_reads=workers, max_mutations=workers)
+    submitted = []
+    for kind, disk, interactive in jobs:
+        if kind == "mutate":
+            submitted.append(scheduler.submit(workload.mutate, disk, disk=disk,
+                                              mutates=True))
+        else:
+            priority = INTERACTIVE if interactive else BACKGROUND
+            submitted.append(scheduler.submit(workload.probe, disk, time.perf_counter(),
+                                              interactive, disk=disk, priority=priority))
+    while not all(job.done() for job in submitted):
+        time.sleep(0.005)
+    scheduler.shutdown(wait=True)
+
+
+def report(name, workload, elapsed):
+    latencies = sorted(workload.latencies) or [0]
+    p95 = latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0]
+    print(f"{name:<10} {elapsed:7.3f}s  interactive read p50 "
+          f"{statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  "
+          f"same-disk conflicts {workload.conflicts}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--disks", type=int, default=8)
+    parser.add_argument("--mutations", type=int, default=3)
+    parser.add_argument("--reads", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mutation-ms", type=float, default=20)
+    parser.add_argument("--read-ms", type=float, default=5)
+    parser.add_argument("--skip-serial", action="store_true")
+    args = parser.parse_args(argv)
+    jobs = jobs_for(args.disks, args.mutations, args.reads)
+    print(f"{len(jobs)} jobs on {args.disks} disks, {args.workers} workers")
+    runs = [("pool", lambda w: run_pool(w, jobs, args.workers)),
+            ("scheduler", lambda w: run_scheduler(w, jobs, args.workers))]
+    if not args.skip_serial:
+        runs.insert(0, ("serial", lambda w: run_serial(w, jobs)))
+    for name, run in runs:
+        workload = Workload(args.mutation_ms, args.read_ms)
+        start = time.perf_counter()
+        run(workload)
+        report(name, workload, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark the layout simulator and planner.
+
+For disks with --partitions partitions, times simulating a fixed operation
+sequence and planning a handful of typical target layouts: grow the last
+partition, shrink the first, drop one partition and give the rest of the
+disk to the last, and add a partition in the free space.
+
+    python benchmarks/bench_simulator.py --partitions 4,32,128
+"""
+import argparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from diskpart_batch import Operation  # noqa: E402
+from simulator import MB, SimDisk, plan, plan_cost  # noqa: E402
+
+GB = 1024 * MB
+
+
+def fleet_disk(partitions):
+    """A GPT disk of 4-7 GB partitions, each half full, with 64 GB free at the end."""
+    layout = []
+    offset = MB
+    for index in range(partitions):
+        size = (4 + index % 4) * GB
+        layout.append((offset, size, size // 2))
+        offset += size
+    return SimDisk(offset + 64 * GB, "gpt", layout)
+
+
+def targets(disk):
+    sizes = [size // MB for _, size, _ in disk.partitions]
+    yield "grow last", sizes[:-1] + [sizes[-1] + 1024]
+    yield "shrink first", [sizes[0] - 1024] + sizes[1:]
+    yield "drop one, rest", sizes[:-2] + [None]
+    if len(sizes) < 128:
+        yield "add partition", sizes + [8192]
+
+
+def rate(func, seconds):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--partitions", default="4,32,128",
+                        help="comma-separated partition counts")
+    parser.add_argument("--seconds", type=float, default=0.5,
+                        help="time spent on each measurement")
+    args = parser.parse_args(argv)
+    for partitions in (int(text) for text in args.partitions.split(",")):
+        disk = fleet_disk(partitions)
+        print(f"{partitions} partitions")
+        sequence = [Operation("extend", 0, partitions, 1024),
+                    Operation("shrink", 0, 1, 1024),
+                    Operation("delete", 0, 2),
+                    Operation("create", 0, size_mb=512)]
+        per_second = rate(lambda: disk.simulate(sequence), args.seconds)
+        print(f"  {'simulate 4 operations':<24} {per_second:10,.0f}/s")
+        for name, sizes in targets(disk):
+            operations = plan(disk, sizes)
+            per_second = rate(lambda: plan(disk, sizes), args.seconds)
+            print(f"  {'plan ' + name:<24} {per_second:10,.0f}/s  "
+                  f"{len(operations)} operations, cost {plan_cost(operations)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Startup benchmark with import-time budgets.
+
+Imports each entry point --runs times in a fresh interpreter, takes the
+median cumulative import time reported by ``-X importtime`` and compares
+it with its budget. Also checks that the headless entry points never load
+GUI or Windows-only modules. Exits with 1 if any check fails, so it can
+guard against startup regressions in CI.
+
+    python benchmarks/bench_startup.py --runs 7 --budget cli=40
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from profile_imports import ROOT, import_timings, module_time  # noqa: E402
+
+# Milliseconds of import time per entry point
+BUDGETS = {
+    "partition_core": 40,
+    "cli": 50,
+    "partition_manager": 100,
+}
+
+# Modules that must not be imported by an entry point at startup
+FORBIDDEN = {
+    "partition_core": ("tkinter", "wmi", "win32api", "win32file", "pythoncom",
+                       "ctypes", "multiprocessing"),
+    "cli": ("tkinter", "wmi", "win32api", "win32file", "pythoncom", "ctypes",
+            "multiprocessing", "partition_manager"),
+    "partition_manager": ("wmi", "win32api", "win32file", "pythoncom", "ctypes"),
+}
+
+
+def loaded_modules(module, python=sys.executable):
+    code = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    result = subprocess.run([python, "-c", code], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    return set(result.stdout.split())
+
+
+def measure(module, runs):
+    samples = [module_time(import_timings(module), module) / 1000 for _ in range(runs)]
+    return statistics.median(samples), min(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="override a budget, e.g. cli=40")
+    args = parser.parse_args(argv)
+    budgets = dict(BUDGETS)
+    for override in args.budget:
+        module, _, ms = override.partition("=")
+        budgets[module] = float(ms)
+
+    failed = False
+    for module, budget in budgets.items():
+        median, best = measure(module, args.runs)
+        status = "ok" if median <= budget else "OVER BUDGET"
+        failed |= median > budget
+        print(f"{module:<20} median {median:6.1f} ms  best {best:6.1f} ms  "
+              f"budget {budget:5.0f} ms  {status}")
+        leaked = sorted(set(FORBIDDEN.get(module, ())) & loaded_modules(module))
+        if leaked:
+            failed = True
+            print(f"{'':<20} imports {', '.join(leaked)} at startup")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""Benchmark suite over simulated disk fleets, with baselines.
+
+For each --fleets entry (DISKSxPARTITIONS) a fake WMI provider and a fake
+diskpart describe the same fleet, with optional latency injected into every
+WMI query and diskpart command. Measured per fleet:
+
+  session_cmds_per_s      PartitionManager commands/s on a persistent session
+  per_call_cmds_per_s     the same, one diskpart process per call
+  session_start_ms        starting diskpart and reading its banner
+  refresh_cold_ms         refresh_disk_list() with an empty topology cache
+  refresh_warm_ms         refresh_disk_list() served from the cache
+  partitions_cold_ms      refresh_partition_list() after its disk changed
+  partitions_warm_ms      refresh_partition_list() of a cached disk
+  refresh_peak_kb         tracemalloc peak of a cold refresh
+  parse_peak_kb           tracemalloc peak of listing every disk's partitions
+
+The GUI runs headless on fakes/fake_tk.py widgets, so everything works on a
+Linux CI box without a display. Latencies are medians of --repeat runs.
+
+    python benchmarks/bench_suite.py --output results.json
+    python benchmarks/bench_suite.py --baseline results.json --threshold 0.25
+
+With --baseline the run is compared against an earlier --output file and the
+script exits with status 1 if any metric got worse by more than --threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "fakes"))
+
+from fake_diskpart import fleet_state, save_state  # noqa: E402
+from fake_tk import FakeRoot, FakeScrollbar, FakeTreeview  # noqa: E402
+from fake_wmi import FakeWmiBackend  # noqa: E402
+from dispatcher import TkDispatcher  # noqa: E402
+import diskpart_parser  # noqa: E402
+from partition_core import PartitionManager  # noqa: E402
+from partition_manager import PartitionManagerGUI  # noqa: E402
+from topology import TopologyLoader  # noqa: E402
+from topology_cache import TopologyCache  # noqa: E402
+from tree_sync import TreeRows  # noqa: E402
+
+FAKE_DISKPART = [sys.executable, os.path.join(ROOT, "fakes", "fake_diskpart.py")]
+DEFAULT_FLEETS = "1x4,64x32,512x128"
+
+# Differences smaller than this are noise whatever the ratio, by unit suffix
+NOISE_FLOOR = {"_ms": 0.5, "_kb": 64}
+
+
+def parse_fleet(text):
+    disks, _, partitions = text.lower().partition("x")
+    return int(disks), int(partitions or 1)
+
+
+def median_ms(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def peak_kb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+class HeadlessGui:
+    """A PartitionManagerGUI wired to fake widgets, WMI and Tk loop."""
+
+    def __init__(self, backend):
+        self.root = FakeRoot()
+        gui = self.gui = PartitionManagerGUI.__new__(PartitionManagerGUI)
+        gui.root = self.root
+        gui.topology_cache = TopologyCache(TopologyLoader(backend), ttl=3600)
+        # Poll quickly so the numbers measure the work, not the poll interval
+        gui.dispatcher = TkDispatcher(self.root, poll_ms=1)
+        gui.disk_rows = TreeRows(FakeTreeview(), FakeScrollbar())
+        gui.part_rows = TreeRows(FakeTreeview(), FakeScrollbar())
+        gui._partitions = {}
+        gui._partitions_disk = None
+
+    def wait(self):
+        if not self.root.pump(lambda: not self.gui.dispatcher.busy):
+            raise RuntimeError("Timed out waiting for the dispatcher")
+
+    def refresh_cold(self):
+        self.gui.topology_cache.invalidate()
+        self.gui.refresh_disk_list()
+        self.wait()
+
+    def refresh_warm(self):
+        self.gui.refresh_disk_list()
+        self.wait()
+
+    def partitions(self, disk, cold):
+        if cold:
+            self.gui.topology_cache.invalidate_disk(disk)
+        self.gui.refresh_partition_list(disk)
+        self.wait()
+
+    def close(self):
+        self.gui.dispatcher.shutdown()
+
+
+def bench_commands(disks, commands, per_call):
+    """Commands/s for partition listings spread over the fleet."""
+    pm = PartitionManager(persistent=not per_call, diskpart_cmd=FAKE_DISKPART)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start_ms = None
+            if not per_call:
+                start = time.perf_counter()
+                pm.session.start()
+                start_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            for call in range(commands):
+                records = pm.partition_records(call % disks)
+                if not records:
+                    raise RuntimeError(f"No partitions listed for disk {call % disks}")
+            elapsed = time.perf_counter() - start
+    finally:
+        pm.close()
+    # select + list partition per call
+    return 2 * commands / elapsed, start_ms
+
+
+def run_fleet(disks, partitions, args):
+    state = fleet_state(disks, partitions)
+    backend = FakeWmiBackend(state, latency=args.wmi_latency / 1000)
+    fd, state_path = tempfile.mkstemp(prefix="bench_fleet_", suffix=".json")
+    os.close(fd)
+    save_state(state_path, state)
+    os.environ["FAKE_DISKPART_STATE"] = state_path
+    os.environ["FAKE_DISKPART_COMMAND_DELAY"] = str(args.diskpart_latency / 1000)
+    results = {}
+    try:
+        results["session_cmds_per_s"], results["session_start_ms"] = bench_commands(
+            disks, args.commands, per_call=False)
+        results["per_call_cmds_per_s"], _ = bench_commands(
+            disks, args.per_call_commands, per_call=True)
+
+        headless = HeadlessGui(backend)
+        try:
+            results["refresh_cold_ms"] = median_ms(headless.refresh_cold, args.repeat)
+            results["refresh_warm_ms"] = median_ms(headless.refresh_warm, args.repeat)
+            last = disks - 1
+            results["partitions_cold_ms"] = median_ms(
+                lambda: headless.partitions(last, cold=True), args.repeat)
+            results["partitions_warm_ms"] = median_ms(
+                lambda: headless.partitions(last, cold=False), args.repeat)
+            if not args.skip_memory:
+                results["refresh_peak_kb"] = peak_kb(headless.refresh_cold)
+        finally:
+            headless.close()
+
+        if not args.skip_memory:
+            # Parse the output of every disk's partition list on one session
+            pm = PartitionManager(persistent=True, diskpart_cmd=FAKE_DISKPART)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    outputs = [pm.list_partitions(disk) for disk in range(disks)]
+            finally:
+                pm.close()
+            results["parse_peak_kb"] = peak_kb(
+                lambda: [diskpart_parser.parse_partitions(output) for output in outputs])
+    finally:
+        os.remove(state_path)
+    return results
+
+
+def compare(baseline, current, threshold):
+    """Print each metric against the baseline; return the regressed ones."""
+    regressions = []
+    for fleet, metrics in current.items():
+        before = baseline.get(fleet, {})
+        for name, value in metrics.items():
+            old = before.get(name)
+            if old is None or value is None:
+                print(f"  {fleet:<10} {name:<22} {value:12.2f}   (no baseline)")
+                continue
+            higher_is_better = name.endswith("_per_s")
+            change = (value - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            floor = next((f for suffix, f in NOISE_FLOOR.items() if name.endswith(suffix)), 0)
+            regressed = worse > threshold and abs(value - old) > floor
+            if regressed:
+                regressions.append((fleet, name, old, value))
+            print(f"  {fleet:<10} {name:<22} {value:12.2f}   was {old:12.2f}  "
+                  f"{change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fleets", default=DEFAULT_FLEETS,
+                        help=f"comma-separated DISKSxPARTITIONS (default {DEFAULT_FLEETS})")
+    parser.add_argument("--wmi-latency", type=float, default=0,
+                        help="milliseconds added to every WMI query")
+    parser.add_argument("--diskpart-latency", type=float, default=0,
+                        help="milliseconds added to every diskpart command")
+    parser.add_argument("--commands", type=int, default=200,
+                        help="partition listings on the persistent session")
+    parser.add_argument("--per-call-commands", type=int, default=10,
+                        help="partition listings with one process per call")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-memory", action="store_true")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this earlier --output file")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="relative change counted as a regression (default 0.25)")
+    args = parser.parse_args(argv)
+
+    fleets = [parse_fleet(text) for text in args.fleets.split(",") if text.strip()]
+    results = {}
+    for disks, partitions in fleets:
+        name = f"{disks}x{partitions}"
+        print(f"{name}: {disks} disks x {partitions} partitions", flush=True)
+        results[name] = run_fleet(disks, partitions, args)
+        for metric, value in results[name].items():
+            print(f"  {metric:<22} {value:12.2f}", flush=True)
+
+    if args.output:
+        document = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {"wmi_latency_ms": args.wmi_latency,
+                         "diskpart_latency_ms": args.diskpart_latency,
+                         "commands": args.commands, "repeat": args.repeat},
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline} ({baseline.get('created', 'unknown date')}), "
+              f"threshold {args.threshold:.0%}")
+        regressions = compare(baseline["results"], results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""Benchmark Treeview refreshes for a large fleet.
+
+Times filling the disk list of a --disks x --partitions fleet, refreshing it
+after a few disks changed, and showing the partitions of every disk in turn.
+Each is measured for the old clear-and-reinsert approach and for TreeRows,
+in full and windowed mode. Runs against a real ttk.Treeview when a display
+is available, otherwise against fakes/fake_tk.FakeTreeview.
+
+    python benchmarks/bench_tree_sync.py --disks 1000 --partitions 8
+"""
+import argparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "fakes"))
+
+from fake_tk import FakeScrollbar, FakeTreeview  # noqa: E402
+from fake_wmi import FakeWmiBackend  # noqa: E402
+from topology import TopologyLoader  # noqa: E402
+from tree_sync import TreeRows  # noqa: E402
+
+
+def make_widgets(real):
+    if real:
+        import tkinter as tk
+        from tkinter import ttk
+        root = real
+        tree = ttk.Treeview(root, columns=("a", "b", "c", "d"), show="headings")
+        scrollbar = ttk.Scrollbar(root, orient=tk.VERTICAL, command=tree.yview)
+        return tree, scrollbar
+    return FakeTreeview(), FakeScrollbar()
+
+
+def disk_rows(topology):
+    return [(disk.index, (round(disk.size / 1024 ** 3, 2), disk.interface))
+            for disk in topology]
+
+
+def partition_rows(disk):
+    return [(p.offset, (round(p.size / 1024 ** 3, 2), "Unknown", "NTFS", "None"))
+            for p in disk.partitions]
+
+
+def rebuild(tree, rows):
+    tree.delete(*tree.get_children())
+    for iid, values in rows:
+        tree.insert("", "end", iid=iid, values=values)
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<34} {elapsed * 1000:9.1f} ms")
+    return elapsed
+
+
+def run(topology, changed, real, virtual_above):
+    disks = list(topology)
+    before = disk_rows(topology)
+    after = list(before)
+    for position in range(0, len(after), max(1, len(after) // max(1, changed))):
+        iid, (size, interface) = after[position]
+        after[position] = (iid, (size + 1, interface))
+
+    tree, _ = make_widgets(real)
+    part, _ = make_widgets(real)
+    print("clear and reinsert")
+    timed("fill disk list", rebuild, tree, before)
+    timed("refresh disk list", rebuild, tree, after)
+    timed("show partitions of every disk",
+          lambda: [rebuild(part, partition_rows(disk)) for disk in disks])
+    report_calls(tree, part)
+
+    for mode, threshold in (("TreeRows", 10 ** 9), ("TreeRows windowed", virtual_above)):
+        tree, scrollbar = make_widgets(real)
+        part, _ = make_widgets(real)
+        rows = TreeRows(tree, scrollbar, virtual_above=threshold)
+        part_rows = TreeRows(part)
+        print(mode)
+        timed("fill disk list", rows.set_rows, before)
+        timed("refresh disk list", rows.set_rows, after)
+        # The GUI clears the partition list when another disk is selected
+        timed("show partitions of every disk",
+              lambda: [(part_rows.clear(), part_rows.set_rows(partition_rows(disk)))
+                       for disk in disks])
+        report_calls(tree, part)
+
+
+def report_calls(tree, part):
+    if isinstance(tree, FakeTreeview):
+        print(f"  treeview calls: disks {dict(tree.calls)}, partitions {dict(part.calls)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--disks", type=int, default=1000)
+    parser.add_argument("--partitions", type=int, default=8)
+    parser.add_argument("--changed", type=int, default=10,
+                        help="disks whose row changes between refreshes")
+    parser.add_argument("--virtual-above", type=int, default=500)
+    parser.add_argument("--fake", action="store_true",
+                        help="use FakeTreeview even if a display is available")
+    args = parser.parse_args(argv)
+
+    real = None
+    if not args.fake:
+        try:
+            import tkinter as tk
+            real = tk.Tk()
+        except Exception:
+            real = None
+    print(f"{args.disks} disks x {args.partitions} partitions, "
+          f"{'ttk.Treeview' if real else 'FakeTreeview'}")
+    topology = TopologyLoader(FakeWmiBackend.fleet(args.disks, args.partitions)).load()
+    run(topology, args.changed, real, args.virtual_above)
+
+
+if __name__ == "__main__":
+    main()
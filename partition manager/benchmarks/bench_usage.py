@@ -0,0 +1,108 @@
+"""Benchmark the volume usage analyzer on a generated directory tree.
+
+Builds a tree of --files sparse files spread over --fanout ** --depth leaf
+folders (or reuses --tree if it already exists), then times a serial
+os.walk + lstat baseline against VolumeAnalyzer with each --workers count,
+without a cache and again with a warm UsageCache. The operating system's
+own caches are warm for every run after the first.
+
+    python benchmarks/bench_usage.py --files 200000
+    python benchmarks/bench_usage.py --files 2000000 --tree /tmp/usage-tree
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from usage import UsageCache, VolumeAnalyzer  # noqa: E402
+
+
+def generate(root, files, fanout, depth):
+    """Create ``files`` sparse files of up to 64 MB under ``root``."""
+    leaves = [root]
+    for _ in range(depth):
+        leaves = [os.path.join(parent, f"d{index}") for parent in leaves
+                  for index in range(fanout)]
+    sizes = random.Random(0)
+    for number in range(files):
+        folder = leaves[number % len(leaves)]
+        if number < len(leaves):
+            os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"f{number}.bin"), "wb") as f:
+            f.truncate(int(sizes.paretovariate(1.2) * 4096) % (64 << 20))
+
+
+def walk(root):
+    total = files = 0
+    for folder, _, names in os.walk(root):
+        for name in names:
+            total += os.lstat(os.path.join(folder, name)).st_size
+            files += 1
+    return total, files
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200000)
+    parser.add_argument("--fanout", type=int, default=16)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--workers", default="1,4,8,16",
+                        help="comma-separated worker counts")
+    parser.add_argument("--tree", help="generate the tree here and keep it")
+    parser.add_argument("--skip-memory", action="store_true")
+    args = parser.parse_args(argv)
+
+    root = args.tree or tempfile.mkdtemp(prefix="bench_usage_")
+    os.makedirs(root, exist_ok=True)
+    try:
+        if not os.listdir(root):
+            print(f"Generating {args.files:,} files in {root}", flush=True)
+            _, seconds = timed(lambda: generate(root, args.files, args.fanout, args.depth))
+            print(f"  took {seconds:.1f} s")
+
+        (total, files), seconds = timed(lambda: walk(root))
+        print(f"{'os.walk + lstat':<22} {seconds:8.2f} s  {files / seconds:12,.0f} files/s  "
+              f"{total / 2**30:.1f} GB")
+        for workers in (int(text) for text in args.workers.split(",")):
+            report, seconds = timed(lambda: VolumeAnalyzer(workers=workers).scan(root))
+            if (report.bytes, report.files) != (total, files):
+                raise RuntimeError(f"Analyzer found {report.files} files, "
+                                   f"{report.bytes} bytes; expected {files}, {total}")
+            print(f"{f'{workers} workers':<22} {seconds:8.2f} s  "
+                  f"{files / seconds:12,.0f} files/s")
+            cache = UsageCache()
+            VolumeAnalyzer(workers=workers, cache=cache).scan(root)
+            report, seconds = timed(lambda: VolumeAnalyzer(workers=workers, cache=cache).scan(root))
+            print(f"{f'{workers} workers, cached':<22} {seconds:8.2f} s  "
+                  f"{files / seconds:12,.0f} files/s  "
+                  f"{report.cached}/{report.directories} folders from cache")
+
+        if not args.skip_memory:
+            tracemalloc.start()
+            try:
+                VolumeAnalyzer().scan(root)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            print(f"Peak memory of a scan: {peak / 2**20:.1f} MB "
+                  f"({peak / files:.1f} bytes per file)")
+    finally:
+        if not args.tree:
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
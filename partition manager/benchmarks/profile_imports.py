@@ -0,0 +1,81 @@
+"""Import-time profile of a module, from ``python -X importtime``.
+
+Imports the module in a fresh interpreter and lists the imports that cost
+the most, by cumulative time (everything they import) and by self time.
+
+    python benchmarks/profile_imports.py partition_manager --top 25
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+class ImportTiming:
+    __slots__ = ("name", "depth", "self_us", "cumulative_us")
+
+    def __init__(self, name, depth, self_us, cumulative_us):
+        self.name = name
+        self.depth = depth
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+
+
+def parse_importtime(text):
+    """Parse ``-X importtime`` stderr into ImportTiming records."""
+    timings = []
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue    # the header line
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped) - 1) // 2
+        timings.append(ImportTiming(stripped, depth, int(fields[0]), int(fields[1])))
+    return timings
+
+
+def import_timings(module, python=sys.executable):
+    """Import ``module`` in a fresh interpreter and return its timings."""
+    result = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def module_time(timings, module):
+    """Cumulative import time of ``module`` in microseconds."""
+    for timing in reversed(timings):
+        if timing.name == module:
+            return timing.cumulative_us
+    raise KeyError(module)
+
+
+def print_profile(module, timings, top):
+    total = module_time(timings, module)
+    print(f"{module}: {total / 1000:.1f} ms, {len(timings)} modules imported")
+    print(f"\n{'cumulative':>12} {'self':>9}  module (by cumulative)")
+    for timing in sorted(timings, key=lambda t: t.cumulative_us, reverse=True)[:top]:
+        print(f"{timing.cumulative_us / 1000:>10.1f}ms {timing.self_us / 1000:>7.1f}ms  "
+              f"{'  ' * timing.depth}{timing.name}")
+    print(f"\n{'self':>12}  module (by self time)")
+    for timing in sorted(timings, key=lambda t: t.self_us, reverse=True)[:top]:
+        print(f"{timing.self_us / 1000:>10.1f}ms  {timing.name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("module", nargs="?", default="partition_manager")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+    print_profile(args.module, import_timings(args.module), args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""Notice disk changes as they happen and batch them per disk.
+
+Event sources report ChangeEvents from their own threads. A source has
+two methods::
+
+    start(emit)   begin calling emit(event) for every change
+    stop()
+
+WmiEventSource listens for WMI instance events on Win32_DiskDrive and
+Win32_Volume, FileEventSource follows a JSON-lines file, and ManualSource
+lets the application (or a test) report changes itself. ChangeWatcher
+coalesces events from all sources: once no new event has arrived for
+``debounce`` seconds it hands one ChangeSet to its callback, naming only
+the disks that were touched.
+"""
+import json
+import os
+import threading
+import time
+
+DISK_ADDED = "disk_added"
+DISK_REMOVED = "disk_removed"
+DISK_CHANGED = "disk_changed"
+VOLUME_CHANGED = "volume_changed"
+
+
+class ChangeEvent:
+    __slots__ = ("kind", "disk", "volume", "source")
+
+    def __init__(self, kind, disk=None, volume=None, source=None):
+        self.kind = kind
+        self.disk = None if disk is None else int(disk)
+        self.volume = volume
+        self.source = source
+
+    def __repr__(self):
+        return f"ChangeEvent({self.kind!r}, disk={self.disk!r}, volume={self.volume!r})"
+
+
+class ChangeSet:
+    """Changes collected in one debounce window."""
+
+    def __init__(self):
+        self.disks = set()
+        self.volumes = set()
+        # A disk appeared or went away, or a change could not be tied to a
+        # disk: the disk list itself has to be re-read
+        self.full = False
+        self.events = 0
+
+    def add(self, event):
+        self.events += 1
+        if event.kind in (DISK_ADDED, DISK_REMOVED):
+            self.full = True
+        if event.disk is not None:
+            self.disks.add(event.disk)
+        elif event.volume is not None:
+            self.volumes.add(event.volume)
+        else:
+            self.full = True
+
+    def __bool__(self):
+        return self.events > 0
+
+    def __repr__(self):
+        return (f"ChangeSet(disks={sorted(self.disks)}, volumes={sorted(self.volumes)}, "
+                f"full={self.full})")
+
+
+class ChangeWatcher:
+    """Run event sources and deliver debounced ChangeSets.
+
+    ``on_changes(change_set)`` is called on the watcher's thread once
+    ``debounce`` seconds pass without a new event, or at the latest
+    ``max_delay`` seconds after the first event of a burst.
+    """
+
+    def __init__(self, sources, on_changes, debounce=0.5, max_delay=3.0,
+                 clock=time.monotonic):
+        self.sources = list(sources)
+        self.on_changes = on_changes
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._pending = ChangeSet()
+        self._first = self._last = None
+        self._running = False
+        self._thread = None
+
+    def emit(self, event):
+        """Report a change. Safe to call from any thread."""
+        with self._cond:
+            now = self.clock()
+            if not self._pending:
+                self._first = now
+            self._last = now
+            self._pending.add(event)
+            self._cond.notify()
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="pm-change-watcher")
+        self._thread.start()
+        for source in self.sources:
+            source.start(self.emit)
+
+    def stop(self):
+        for source in self.sources:
+            source.stop()
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _due(self):
+        """Seconds until the pending changes are due, or None if there are none."""
+        if not self._pending:
+            return None
+        deadline = min(self._last + self.debounce, self._first + self.max_delay)
+        return deadline - self.clock()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    wait = self._due()
+                    if wait is not None and wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                if not self._running:
+                    return
+                changes, self._pending = self._pending, ChangeSet()
+            try:
+                self.on_changes(changes)
+            except Exception as e:
+                print(f"Error handling disk changes: {e}")
+
+
+class ManualSource:
+    """A source the application fires itself, e.g. after it changed a disk."""
+
+    def __init__(self):
+        self._emit = None
+
+    def start(self, emit):
+        self._emit = emit
+
+    def stop(self):
+        self._emit = None
+
+    def fire(self, kind, disk=None, volume=None):
+        emit = self._emit
+        if emit is not None:
+            emit(ChangeEvent(kind, disk, volume, source="app"))
+
+
+class FileEventSource:
+    """Follow a file of JSON lines like {"kind": "disk_changed", "disk": 2}.
+
+    Lines already in the file when the source starts are skipped. Meant for
+    tests and for scripts that want to tell a running GUI about changes.
+    """
+
+    def __init__(self, path, interval=0.25):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, emit):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._follow, args=(emit,), daemon=True,
+                                        name="pm-file-events")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _follow(self, emit):
+        position = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        partial = ""
+        while not self._stop.wait(self.interval):
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                continue
+            if size < position:
+                position, partial = 0, ""     # truncated or replaced
+            if size == position:
+                continue
+            with open(self.path) as f:
+                f.seek(position)
+                partial += f.read()
+                position = f.tell()
+            *lines, partial = partial.split("\n")
+            for line in lines:
+                try:
+                    data = json.loads(line)
+                    emit(ChangeEvent(data["kind"], data.get("disk"), data.get("volume"),
+                                     source="file"))
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+
+class WmiEventSource:
+    """WMI instance creation, deletion and modification events.
+
+    Each query is watched on its own thread with its own COM apartment and
+    WMI connection. WMI polls for intrinsic events every ``within`` seconds.
+    Volumes are named by drive letter, or by DeviceID if they have none;
+    the disk of a letterless volume is looked up in MSFT_Partition.
+    """
+
+    # Win32_Volume is modified whenever its free space changes; only a new
+    # size, letter or file system is a layout change
+    VOLUME_MODIFIED = (" AND (TargetInstance.Capacity <> PreviousInstance.Capacity"
+                       " OR TargetInstance.DriveLetter <> PreviousInstance.DriveLetter"
+                       " OR TargetInstance.FileSystem <> PreviousInstance.FileSystem)")
+
+    QUERIES = (
+        ("__InstanceCreationEvent", "Win32_DiskDrive", DISK_ADDED, ""),
+        ("__InstanceDeletionEvent", "Win32_DiskDrive", DISK_REMOVED, ""),
+        ("__InstanceModificationEvent", "Win32_DiskDrive", DISK_CHANGED, ""),
+        ("__InstanceCreationEvent", "Win32_Volume", VOLUME_CHANGED, ""),
+        ("__InstanceDeletionEvent", "Win32_Volume", VOLUME_CHANGED, ""),
+        ("__InstanceModificationEvent", "Win32_Volume", VOLUME_CHANGED, VOLUME_MODIFIED),
+    )
+
+    def __init__(self, within=2, timeout_ms=500):
+        self.within = within
+        self.timeout_ms = timeout_ms
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self, emit):
+        self._stop.clear()
+        try:
+            import pythoncom  # noqa: F401
+            import wmi  # noqa: F401
+        except ImportError as e:
+            print(f"Disk change notifications are not available: {e}")
+            return
+        for event_class, target, kind, condition in self.QUERIES:
+            query = (f"SELECT * FROM {event_class} WITHIN {self.within} "
+                     f"WHERE TargetInstance ISA '{target}'{condition}")
+            thread = threading.Thread(target=self._watch, args=(query, kind, emit),
+                                      daemon=True, name=f"pm-wmi-{event_class}")
+            self._threads.append(thread)
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self, query, kind, emit):
+        try:
+            import pythoncom
+            import wmi
+            pythoncom.CoInitialize()
+            watcher = wmi.WMI().watch_for(raw_wql=query)
+        except Exception as e:
+            print(f"Disk change notifications are not available: {e}")
+            return
+        try:
+            while not self._stop.is_set():
+                try:
+                    instance = watcher(timeout_ms=self.timeout_ms)
+                except wmi.x_wmi_timed_out:
+                    continue
+                if kind == VOLUME_CHANGED:
+                    letter = getattr(instance, "DriveLetter", None)
+                    if letter:
+                        emit(ChangeEvent(kind, volume=letter, source="wmi"))
+                        continue
+                    # Not in the Win32_LogicalDisk topology; find its disk instead
+                    device_id = getattr(instance, "DeviceID", None)
+                    emit(ChangeEvent(kind, _disk_of_volume(wmi, device_id),
+                                     volume=device_id, source="wmi"))
+                else:
+                    emit(ChangeEvent(kind, getattr(instance, "Index", None), source="wmi"))
+        finally:
+            pythoncom.CoUninitialize()
+
+
+def _disk_of_volume(wmi, device_id):
+    """Disk number of the partition with ``device_id`` among its access paths."""
+    if not device_id:
+        return None
+    try:
+        storage = wmi.WMI(namespace="root/Microsoft/Windows/Storage")
+        partitions = storage.query("SELECT DiskNumber, AccessPaths FROM MSFT_Partition")
+    except Exception:
+        return None
+    for partition in partitions:
+        if device_id in (partition.AccessPaths or ()):
+            return partition.DiskNumber
+    return None
@@ -0,0 +1,432 @@
+"""Apply a declarative partition layout plan without the GUI.
+
+    python cli.py plan.json [--dry-run | --check] [--json] [--diskpart CMD]
+
+A plan lists the layout each disk should end up with::
+
+    {
+      "disks": [
+        {"disk": 1, "style": "gpt",
+         "partitions": [{"size_mb": 102400}, {"size_mb": 51200}, {}]},
+        {"disk": [2, 3, 4], "partitions": [{}], "wipe": true}
+      ]
+    }
+
+``disk`` is a disk number or a list of them. ``partitions`` is the full,
+ordered list of partitions; an entry without ``size_mb`` takes the rest of
+the free space and may only come last. The current layout is read with
+diskpart, exact partition sizes from the disk's partition table (or from
+the image given with --image), and only the operations needed to reach
+the plan are run: shrink
+or extend partitions whose size differs, create missing ones and, with
+``"prune": true``, delete extra ones. A change that would destroy data
+(converting a disk that has partitions, or a partition that cannot be
+resized in place) is a conflict unless the disk has ``"wipe": true``, in
+which case all its partitions are deleted and the layout is created anew.
+An MBR extended partition is never deleted or resized; diskpart shows it as
+partition 0, which cannot be selected. If the partition table cannot be
+read, sizes are compared with diskpart's rounded ones, and a disk is never
+wiped because of a size that could only be compared that way.
+
+Exit codes: 0 done or nothing to do, 1 an operation failed, 2 the plan is
+invalid, 3 a disk has conflicts, 4 --check found pending changes.
+
+This module must not import tkinter, wmi or the GUI so that it starts fast
+on hosts without a desktop session.
+"""
+import argparse
+import contextlib
+import io
+import json
+import shlex
+import sys
+
+from diskpart_batch import OperationBatch
+import diskpart_parser
+from diskpart_parser import size_precision
+from diskpart_session import DiskpartSessionError, command_failed
+from extents import ExtentIndex, MB
+from partition_core import PartitionManager
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INVALID = 2
+EXIT_CONFLICT = 3
+EXIT_CHANGES = 4
+
+
+class PlanError(ValueError):
+    pass
+
+
+class DiskPlan:
+    __slots__ = ("disk", "style", "sizes", "prune", "wipe")
+
+    def __init__(self, disk, style=None, sizes=(), prune=False, wipe=False):
+        self.disk = disk
+        self.style = style
+        self.sizes = list(sizes)
+        self.prune = prune
+        self.wipe = wipe
+
+
+def load_plan(data):
+    """Validate a parsed JSON plan and return a list of DiskPlan."""
+    if not isinstance(data, dict) or not isinstance(data.get("disks"), list):
+        raise PlanError("The plan must be an object with a 'disks' list")
+    plans = []
+    seen = set()
+    for number, entry in enumerate(data["disks"], 1):
+        where = f"disks[{number - 1}]"
+        if not isinstance(entry, dict) or "disk" not in entry:
+            raise PlanError(f"{where}: every entry needs a 'disk'")
+        disks = entry["disk"] if isinstance(entry["disk"], list) else [entry["disk"]]
+        style = entry.get("style")
+        if style is not None and style not in ("gpt", "mbr"):
+            raise PlanError(f"{where}: style must be 'gpt' or 'mbr'")
+        sizes = []
+        partitions = entry.get("partitions", [])
+        for position, partition in enumerate(partitions):
+            size = partition.get("size_mb") if isinstance(partition, dict) else None
+            if size is None:
+                if position != len(partitions) - 1:
+                    raise PlanError(f"{where}: only the last partition may omit size_mb")
+            elif not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+                raise PlanError(f"{where}: size_mb must be a positive integer")
+            sizes.append(size)
+        if style == "mbr" and len(sizes) > 4:
+            raise PlanError(f"{where}: an MBR disk holds at most 4 primary partitions")
+        for disk in disks:
+            if not isinstance(disk, int) or isinstance(disk, bool) or disk < 0:
+                raise PlanError(f"{where}: disk numbers must be non-negative integers")
+            if disk in seen:
+                raise PlanError(f"{where}: disk {disk} appears more than once")
+            seen.add(disk)
+            plans.append(DiskPlan(disk, style, sizes, bool(entry.get("prune")),
+                                  bool(entry.get("wipe"))))
+    return plans
+
+
+def read_listing(pm, commands, parser):
+    """Run ``commands`` and parse the last one's output with ``parser``.
+
+    Unlike PartitionManager's listing methods this raises if diskpart
+    cannot be run or a command fails, instead of returning nothing.
+    """
+    outputs = pm.run_diskpart_script(commands)
+    if len(outputs) < len(commands) or command_failed(commands[-1], outputs[-1]):
+        raise DiskpartSessionError(outputs[-1].strip() if outputs else "no output")
+    return parser(outputs[-1])
+
+
+def is_extended(record):
+    """True for the container of an MBR disk's logical partitions."""
+    return record.number == 0 or record.type.lower() == "extended"
+
+
+def exact_extents(partitions, layout):
+    """Map partition number to its exact (offset, size) from ``layout``.
+
+    ``layout`` is the topology.DiskNode read from the partition table. The
+    rounded ``list partition`` offset and size must point at exactly one
+    partition of it; partitions that do not are left out.
+    """
+    exact = {}
+    for record in partitions:
+        matches = [p for p in layout.partitions
+                   if abs(p.offset - record.offset) < size_precision(record.offset)
+                   and abs(p.size - record.size) < size_precision(record.size)]
+        if len(matches) == 1:
+            exact[record.number] = (matches[0].offset, matches[0].size)
+    return exact
+
+
+class DiskDiff:
+    """What has to happen to one disk, as OperationBatch operations."""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.batch = None
+        self.conflicts = []
+        self.error = None
+        self.result = None
+
+    @property
+    def changes(self):
+        return self.batch is not None and len(self.batch.operations) > 0
+
+    @property
+    def status(self):
+        if self.error:
+            return "error"
+        if self.conflicts:
+            return "conflict"
+        if self.result is not None:
+            return "applied" if self.result.ok else "failed"
+        return "planned" if self.changes else "unchanged"
+
+
+def diff_disk(pm, plan, disk_record, partitions, layout=None, layout_error=None):
+    """Compare ``plan`` with the disk's current layout and queue the changes.
+
+    ``layout`` is the disk's topology.DiskNode from the partition table, for
+    exact sizes; without it the rounded ``list partition`` sizes are used
+    and ``layout_error`` says why.
+    """
+    diff = DiskDiff(plan)
+    batch = diff.batch = OperationBatch(pm)
+    disk = plan.disk
+    style = "gpt" if disk_record.gpt else "mbr"
+    convert = plan.style is not None and plan.style != style
+    partitions = sorted(partitions, key=lambda p: p.offset)
+    # diskpart cannot select the extended partition; leave it out of the
+    # plan and refuse anything that would have to remove it
+    extended = [p for p in partitions if is_extended(p)]
+    partitions = [p for p in partitions if not is_extended(p)]
+
+    if convert and extended:
+        diff.conflicts.append("converting needs an empty disk but it has an MBR "
+                              "extended partition, which cannot be deleted by number")
+        return diff
+    if convert and partitions:
+        diff.conflicts.append(f"converting to {plan.style.upper()} needs an empty "
+                              f"disk but it has {len(partitions)} partitions")
+    elif len(partitions) > len(plan.sizes) and not plan.prune:
+        diff.conflicts.append(f"{len(partitions) - len(plan.sizes)} partitions are not "
+                              f"in the plan; set prune to delete them")
+    keep = partitions[:len(plan.sizes)]
+    if not diff.conflicts:
+        # Delete pruned partitions first, from the highest number down, so
+        # the kept ones keep their numbers and can grow into the space
+        for partition in reversed(partitions[len(keep):]):
+            batch.delete_partition(disk, partition.number)
+        approximate = _resize(diff, plan, disk_record, keep, partitions, layout)
+        if diff.conflicts and approximate and plan.wipe:
+            # A rounded size must not be the reason to destroy a disk
+            batch.operations.clear()
+            diff.error = ("not wiping: exact partition sizes are needed to decide, "
+                          f"but {layout_error or 'the partition table does not match'}")
+            return diff
+    if diff.conflicts:
+        batch.operations.clear()
+        if not plan.wipe:
+            return diff
+        if extended:
+            diff.conflicts.append("wiping needs the MBR extended partition deleted, "
+                                  "which diskpart cannot select by number")
+            return diff
+        # Start over: delete everything and create the planned layout
+        diff.conflicts = []
+        for partition in reversed(partitions):
+            batch.delete_partition(disk, partition.number)
+        keep = []
+    if convert:
+        batch.convert_disk(disk, plan.style)
+    for size in plan.sizes[len(keep):]:
+        batch.create_partition(disk, size)
+    return diff
+
+
+def _resize(diff, plan, disk_record, partitions, listed, layout):
+    """Queue shrinks and extends to bring ``partitions`` to the planned sizes.
+
+    Returns True if a size had to be taken from the rounded ``list
+    partition`` output because ``layout`` was missing or did not have it.
+    """
+    batch = diff.batch
+    end = disk_record.size
+    if disk_record.gpt:
+        end -= 33 * 512
+    rounded = ExtentIndex(((p.offset, p.size) for p in listed), end)
+    exact, index = {}, None
+    if layout is not None:
+        # Also counts what list partition rounds away or WMI hides
+        index = ExtentIndex.from_disk(layout)
+        if index is not None:
+            exact = exact_extents(listed, layout)
+    approximate = False
+    for partition, size_mb in zip(partitions, plan.sizes):
+        if partition.number in exact:
+            offset, size = exact[partition.number]
+            free, slack, tolerance = index.free_after(offset), 0, MB
+        else:
+            # Offsets and sizes are rounded, so a difference or a gap
+            # smaller than the rounding may not really be there
+            approximate = True
+            size = partition.size
+            free = rounded.free_after(partition.offset)
+            slack = size_precision(partition.offset) + size_precision(partition.size)
+            tolerance = size_precision(partition.size)
+        if size_mb is None:
+            if partition is partitions[-1] and free > slack:
+                batch.extend_partition(plan.disk, partition.number)
+            continue
+        difference = size_mb * MB - size
+        if abs(difference) < tolerance:
+            continue
+        if difference < 0:
+            batch.shrink_partition(plan.disk, partition.number, -difference // MB)
+        elif difference // MB <= free // MB:
+            batch.extend_partition(plan.disk, partition.number, difference // MB)
+        else:
+            diff.conflicts.append(f"partition {partition.number} cannot grow by "
+                                  f"{difference // MB} MB; there is not enough free "
+                                  f"space after it")
+    return approximate
+
+
+def plan_changes(pm, plans, images=None):
+    """Read the current layout and return a DiskDiff for every DiskPlan.
+
+    ``images`` maps disk numbers to image files to read the partition
+    table from instead of the disk, e.g. for a fake diskpart.
+    """
+    images = images or {}
+    records = {record.number: record
+               for record in read_listing(pm, ["list disk"], diskpart_parser.parse_disks)}
+    diffs = []
+    for plan in plans:
+        record = records.get(plan.disk)
+        if record is None:
+            diff = DiskDiff(plan)
+            diff.error = f"disk {plan.disk} not found"
+            diffs.append(diff)
+            continue
+        if record.dynamic:
+            diff = DiskDiff(plan)
+            diff.error = f"disk {plan.disk} is dynamic"
+            diffs.append(diff)
+            continue
+        partitions = read_listing(pm, [f"select disk {plan.disk}", "list partition"],
+                                  diskpart_parser.parse_partitions)
+        layout = layout_error = None
+        if any(size is not None for size in plan.sizes):
+            try:
+                layout = pm.probe_layout(images.get(plan.disk, plan.disk)).disk
+            except (OSError, ValueError) as e:
+                layout_error = f"cannot read the partition table ({e})"
+        diffs.append(diff_disk(pm, plan, record, partitions, layout, layout_error))
+    return diffs
+
+
+def _operation_dict(operation, status=None):
+    data = {"kind": operation.kind}
+    if operation.partition is not None:
+        data["partition"] = operation.partition
+    if operation.size_mb is not None:
+        data["size_mb"] = operation.size_mb
+    if operation.type_to is not None:
+        data["style"] = operation.type_to
+    if status is not None:
+        data["status"] = status
+    return data
+
+
+def report(diffs, dry_run):
+    disks = []
+    for diff in diffs:
+        entry = {"disk": diff.plan.disk, "status": diff.status}
+        if diff.error:
+            entry["error"] = diff.error
+        if diff.conflicts:
+            entry["conflicts"] = diff.conflicts
+        if diff.result is not None:
+            entry["operations"] = [_operation_dict(r.operation, r.status)
+                                   for r in diff.result]
+        elif diff.batch is not None:
+            entry["operations"] = [_operation_dict(op) for op in diff.batch.operations]
+            if dry_run and diff.changes:
+                entry["script"] = diff.batch.script()
+        disks.append(entry)
+    return {"dry_run": dry_run, "disks": disks}
+
+
+def print_report(data, out):
+    for entry in data["disks"]:
+        out.write(f"Disk {entry['disk']}: {entry['status']}\n")
+        if entry.get("error"):
+            out.write(f"  error: {entry['error']}\n")
+        for conflict in entry.get("conflicts", []):
+            out.write(f"  conflict: {conflict}\n")
+        for operation in entry.get("operations", []):
+            details = " ".join(f"{key}={value}" for key, value in operation.items()
+                               if key != "kind")
+            out.write(f"  {operation['kind']} {details}".rstrip() + "\n")
+
+
+def exit_code(diffs, check):
+    if any(diff.error for diff in diffs):
+        return EXIT_INVALID
+    if any(diff.conflicts for diff in diffs):
+        return EXIT_CONFLICT
+    if any(diff.result is not None and not diff.result.ok for diff in diffs):
+        return EXIT_FAILED
+    if check and any(diff.changes for diff in diffs):
+        return EXIT_CHANGES
+    return EXIT_OK
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("plan", help="JSON plan file, or - for stdin")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="show the operations without running them")
+    parser.add_argument("--check", action="store_true",
+                        help="like --dry-run, but exit with 4 if changes are pending")
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    parser.add_argument("--diskpart", default="diskpart",
+                        help="diskpart command line (default: diskpart)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="echo diskpart output on stderr")
+    parser.add_argument("--image", action="append", default=[], metavar="DISK=PATH",
+                        help="read disk DISK's partition table from an image "
+                             "file instead of the drive, for testing")
+    args = parser.parse_args(argv)
+    dry_run = args.dry_run or args.check
+
+    try:
+        if args.plan == "-":
+            data = json.load(sys.stdin)
+        else:
+            with open(args.plan) as f:
+                data = json.load(f)
+        plans = load_plan(data)
+        images = {}
+        for item in args.image:
+            disk, _, path = item.partition("=")
+            if not path:
+                raise ValueError(f"--image {item!r} is not DISK=PATH")
+            images[int(disk)] = path
+    except (OSError, ValueError) as e:
+        sys.stderr.write(f"Invalid plan: {e}\n")
+        return EXIT_INVALID
+
+    # PartitionManager prints diskpart output; keep stdout for the report
+    echo = sys.stderr if args.verbose else io.StringIO()
+    pm = PartitionManager(persistent=True, diskpart_cmd=shlex.split(args.diskpart))
+    try:
+        with contextlib.redirect_stdout(echo):
+            diffs = plan_changes(pm, plans, images)
+            if not dry_run and not any(diff.error or diff.conflicts for diff in diffs):
+                for diff in diffs:
+                    if diff.changes:
+                        # One batch per disk: a failure on one disk does not
+                        # skip the work planned for the others
+                        diff.result = diff.batch.run()
+    except Exception as e:
+        sys.stderr.write(f"diskpart failed: {e}\n")
+        return EXIT_FAILED
+    finally:
+        pm.close()
+
+    data = report(diffs, dry_run)
+    if args.json:
+        json.dump(data, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        print_report(data, sys.stdout)
+    return exit_code(diffs, args.check)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
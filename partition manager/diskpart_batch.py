@@ -0,0 +1,203 @@
+from diskpart_session import command_failed
+
+
+class Operation:
+    """One queued change. Partition numbers are resolved when it runs."""
+
+    def __init__(self, kind, disk, partition=None, size_mb=None, type_to=None):
+        self.kind = kind
+        self.disk = int(disk)
+        self.partition = None if partition is None else int(partition)
+        self.size_mb = None if size_mb is None else int(size_mb)
+        self.type_to = type_to
+
+    def __repr__(self):
+        args = [f"disk={self.disk}"]
+        if self.partition is not None:
+            args.append(f"partition={self.partition}")
+        if self.size_mb is not None:
+            args.append(f"size_mb={self.size_mb}")
+        if self.type_to is not None:
+            args.append(f"type_to={self.type_to!r}")
+        return f"Operation({self.kind!r}, {', '.join(args)})"
+
+
+class Step:
+    """A diskpart command in the plan and the operations that produced it."""
+
+    def __init__(self, disk, partition, command, operations):
+        self.disk = disk
+        self.partition = partition
+        self.command = command
+        self.operations = operations
+        self.commands = []
+
+    def __repr__(self):
+        return f"Step({self.command!r}, operations={len(self.operations)})"
+
+
+class OperationResult:
+    def __init__(self, operation, status, output):
+        self.operation = operation
+        self.status = status    # "ok", "failed" or "skipped"
+        self.output = output
+
+    @property
+    def ok(self):
+        return self.status == "ok"
+
+    def __repr__(self):
+        return f"OperationResult({self.operation!r}, {self.status!r})"
+
+
+class BatchResult:
+    def __init__(self, results, output):
+        self.results = results
+        self.output = output
+
+    @property
+    def ok(self):
+        return all(result.ok for result in self.results)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+
+class OperationBatch:
+    """Queue PartitionManager operations and run them as one diskpart script.
+
+    Operations on the same disk keep their queued order, since creating or
+    deleting a partition renumbers the ones after it. Disks are independent,
+    so the plan groups work by disk, emits each ``select`` only when the
+    selection actually changes and merges adjacent shrinks or extends of the
+    same partition into a single command. Like ``diskpart /s``, the run stops
+    at the first failing command; later operations are reported as skipped.
+    """
+
+    def __init__(self, pm):
+        self.pm = pm
+        self.operations = []
+
+    def __len__(self):
+        return len(self.operations)
+
+    def _add(self, operation):
+        self.operations.append(operation)
+        return operation
+
+    def create_partition(self, disk_number, size_mb=None):
+        # Without a size diskpart uses the largest free area
+        if size_mb is not None and int(size_mb) <= 0:
+            raise ValueError("Size must be a positive number")
+        return self._add(Operation("create", disk_number, size_mb=size_mb))
+
+    def delete_partition(self, disk_number, partition_number):
+        return self._add(Operation("delete", disk_number, partition_number))
+
+    def extend_partition(self, disk_number, partition_number, size_mb=None):
+        if size_mb is not None and int(size_mb) <= 0:
+            raise ValueError("Size must be a positive number")
+        return self._add(Operation("extend", disk_number, partition_number, size_mb))
+
+    def shrink_partition(self, disk_number, partition_number, size_mb):
+        if int(size_mb) <= 0:
+            raise ValueError("Size must be a positive number")
+        return self._add(Operation("shrink", disk_number, partition_number, size_mb))
+
+    def convert_disk(self, disk_number, type_to):
+        if type_to not in ['gpt', 'mbr']:
+            raise ValueError("Type must be 'gpt' or 'mbr'")
+        return self._add(Operation("convert", disk_number, type_to=type_to))
+
+    def _merge(self, steps, operation):
+        """Fold ``operation`` into the previous step when diskpart allows it."""
+        if not steps:
+            return False
+        last = steps[-1]
+        first = last.operations[0]
+        if (first.kind != operation.kind or first.disk != operation.disk
+                or first.partition != operation.partition):
+            return False
+        if operation.kind == "shrink":
+            total = sum(op.size_mb for op in last.operations) + operation.size_mb
+            last.command = f"shrink desired={total}"
+        elif operation.kind == "extend":
+            # A plain "extend" takes all the space after the partition
+            # and absorbs any sized extend next to it.
+            sizes = [op.size_mb for op in last.operations] + [operation.size_mb]
+            if None in sizes:
+                last.command = "extend"
+            else:
+                last.command = f"extend size={sum(sizes)}"
+        else:
+            return False
+        last.operations.append(operation)
+        return True
+
+    def plan(self):
+        """Return the list of Steps the batch will run, without running it."""
+        steps = []
+        ordered = sorted(self.operations, key=lambda op: op.disk)
+        for operation in ordered:
+            if self._merge(steps, operation):
+                continue
+            if operation.kind == "create":
+                command = ("create partition primary" if operation.size_mb is None
+                           else f"create partition primary size={operation.size_mb}")
+            elif operation.kind == "delete":
+                command = "delete partition"
+            elif operation.kind == "extend":
+                command = ("extend" if operation.size_mb is None
+                           else f"extend size={operation.size_mb}")
+            elif operation.kind == "shrink":
+                command = f"shrink desired={operation.size_mb}"
+            else:
+                command = f"convert {operation.type_to}"
+            steps.append(Step(operation.disk, operation.partition, command, [operation]))
+
+        selected_disk = selected_partition = None
+        for step in steps:
+            if step.disk != selected_disk:
+                step.commands.append(f"select disk {step.disk}")
+                selected_disk, selected_partition = step.disk, None
+            if step.partition is not None and step.partition != selected_partition:
+                step.commands.append(f"select partition {step.partition}")
+                selected_partition = step.partition
+            step.commands.append(step.command)
+            if step.operations[0].kind in ("create", "delete", "convert"):
+                # These change or clear diskpart's partition selection
+                selected_partition = None
+        return steps
+
+    def script(self):
+        """Return the planned diskpart commands as a flat list."""
+        return [command for step in self.plan() for command in step.commands]
+
+    def run(self):
+        """Run the whole plan in one diskpart process and map results back."""
+        steps = self.plan()
+        commands = [command for step in steps for command in step.commands]
+        outputs = self.pm.run_diskpart_script(commands) if commands else []
+
+        by_operation = {}
+        position = 0
+        for step in steps:
+            count = len(step.commands)
+            step_outputs = outputs[position:position + count]
+            position += count
+            if not step_outputs:
+                status = "skipped"
+            elif command_failed(step.commands[len(step_outputs) - 1], step_outputs[-1]):
+                status = "failed"
+            else:
+                status = "ok"
+            output = "\n".join(step_outputs)
+            for operation in step.operations:
+                by_operation[id(operation)] = OperationResult(operation, status, output)
+
+        results = [by_operation[id(op)] for op in self.operations]
+        self.operations = []
+        return BatchResult(results, "\n".join(outputs))
@@ -0,0 +1,310 @@
+"""Parse diskpart output into compact records.
+
+Every parser accepts either the text returned by PartitionManager or any
+iterable of lines (an open file, a pipe, a generator) and works one line at
+a time, so a ``list volume`` from a host with thousands of LUNs is never
+held in memory as a whole. Sizes are normalized to bytes.
+"""
+import io
+
+UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3,
+         "TB": 1024 ** 4, "PB": 1024 ** 5}
+
+# Named GPT attribute bits, as shown in the "Attrib" line of detail partition
+GPT_ATTRIBUTES = (
+    (0, "required"),
+    (1, "no_block_io"),
+    (2, "legacy_bios_bootable"),
+    (60, "read_only"),
+    (61, "shadow_copy"),
+    (62, "hidden"),
+    (63, "no_drive_letter"),
+)
+
+
+def parse_size(text):
+    """Convert a diskpart size such as '475 GB' or '1024 KB' to bytes."""
+    value, _, unit = text.strip().partition(" ")
+    if not value:
+        return 0
+    return int(float(value) * UNITS[unit.strip().upper() or "B"])
+
+
+def size_precision(size):
+    """Display unit of a size parsed from a table: diskpart shows '475 GB'.
+
+    Sizes and offsets are rounded to the nearest unit, so the exact value
+    is within half of it.
+    """
+    for unit in (1024 ** 4, 1024 ** 3, 1024 ** 2, 1024):
+        if size >= 10 * unit:
+            return unit
+    return 1
+
+
+def _yes(text):
+    return text.strip().lower() == "yes"
+
+
+def _lines(source):
+    if isinstance(source, str):
+        return io.StringIO(source)
+    return source
+
+
+class Record:
+    __slots__ = ()
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class DiskRecord(Record):
+    __slots__ = ("number", "status", "size", "free", "dynamic", "gpt", "selected")
+
+    def __init__(self, number, status, size, free, dynamic, gpt, selected=False):
+        self.number = number
+        self.status = status
+        self.size = size
+        self.free = free
+        self.dynamic = dynamic
+        self.gpt = gpt
+        self.selected = selected
+
+
+class PartitionRecord(Record):
+    __slots__ = ("number", "type", "size", "offset", "selected")
+
+    def __init__(self, number, type, size, offset, selected=False):
+        self.number = number
+        self.type = type
+        self.size = size
+        self.offset = offset
+        self.selected = selected
+
+
+class VolumeRecord(Record):
+    __slots__ = ("number", "letter", "label", "fs", "type", "size", "status",
+                 "info", "selected")
+
+    def __init__(self, number, letter, label, fs, type, size, status, info,
+                 selected=False):
+        self.number = number
+        self.letter = letter
+        self.label = label
+        self.fs = fs
+        self.type = type
+        self.size = size
+        self.status = status
+        self.info = info
+        self.selected = selected
+
+
+class DiskDetail(Record):
+    __slots__ = ("model", "disk_id", "type", "status", "path", "target",
+                 "lun_id", "location_path", "read_only", "boot_disk",
+                 "pagefile_disk", "hibernation_disk", "crashdump_disk",
+                 "clustered", "volumes")
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.volumes = []
+
+
+class PartitionDetail(Record):
+    __slots__ = ("number", "type", "hidden", "required", "active",
+                 "attributes", "offset", "volumes")
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.volumes = []
+
+    @property
+    def gpt(self):
+        """True if the partition type is a GPT GUID rather than an MBR byte."""
+        return self.type is not None and len(self.type) > 2
+
+    @property
+    def gpt_flags(self):
+        """Names of the GPT attribute bits set on this partition."""
+        if not self.attributes:
+            return ()
+        return tuple(name for bit, name in GPT_ATTRIBUTES if self.attributes >> bit & 1)
+
+
+def iter_table(source):
+    """Yield (selected, cells) for every row of every table in ``source``.
+
+    diskpart tables are fixed width; the dashed line under each header gives
+    the column spans, so cells that contain spaces (labels, models) are
+    split correctly. Anything outside a table is skipped.
+    """
+    spans = None
+    for line in _lines(source):
+        line = line.rstrip("\r\n")
+        stripped = line.strip()
+        if not stripped:
+            spans = None
+            continue
+        if stripped.startswith("--"):
+            spans = []
+            start = None
+            for i, char in enumerate(line):
+                if char == "-" and start is None:
+                    start = i
+                elif char != "-" and start is not None:
+                    spans.append((start, i))
+                    start = None
+            if start is not None:
+                spans.append((start, None))
+            continue
+        if spans is None:
+            continue
+        # Each cell runs from the end of the previous column, so right
+        # aligned sizes wider than their dashes are still captured whole.
+        # A name such as "Volume 1000" that outgrows the first column pushes
+        # the whole row right; shift the spans by the overflow.
+        first, first_end = spans[0]
+        word, _, rest = line[first:].partition(" ")
+        digits = len(rest) - len(rest.lstrip("0123456789"))
+        shift = max(0, first + len(word) + 1 + digits - first_end)
+        cells = []
+        previous = first
+        for start, end in spans:
+            end = None if end is None else end + shift
+            cells.append(line[previous:end].strip())
+            previous = end
+        yield line.startswith("*"), cells
+
+
+def _number(cell):
+    return int(cell.split()[-1])
+
+
+def iter_disks(source):
+    """Yield a DiskRecord for each row of ``list disk`` output."""
+    for selected, cells in iter_table(source):
+        if len(cells) >= 6 and cells[0].startswith("Disk"):
+            yield DiskRecord(_number(cells[0]), cells[1], parse_size(cells[2]),
+                             parse_size(cells[3]), cells[4] == "*",
+                             cells[5] == "*", selected)
+
+
+def iter_partitions(source):
+    """Yield a PartitionRecord for each row of ``list partition`` output."""
+    for selected, cells in iter_table(source):
+        if len(cells) >= 4 and cells[0].startswith("Partition"):
+            yield PartitionRecord(_number(cells[0]), cells[1], parse_size(cells[2]),
+                                  parse_size(cells[3]), selected)
+
+
+def iter_volumes(source):
+    """Yield a VolumeRecord for each row of ``list volume`` output."""
+    for selected, cells in iter_table(source):
+        if len(cells) >= 8 and cells[0].startswith("Volume"):
+            yield VolumeRecord(_number(cells[0]), cells[1], cells[2], cells[3],
+                               cells[4], parse_size(cells[5]), cells[6],
+                               cells[7], selected)
+
+
+def parse_disks(source):
+    return list(iter_disks(source))
+
+
+def parse_partitions(source):
+    return list(iter_partitions(source))
+
+
+def parse_volumes(source):
+    return list(iter_volumes(source))
+
+
+_DISK_KEYS = {
+    "disk id": "disk_id",
+    "type": "type",
+    "status": "status",
+    "path": "path",
+    "target": "target",
+    "lun id": "lun_id",
+    "location path": "location_path",
+    "read-only": "read_only",
+    "boot disk": "boot_disk",
+    "pagefile disk": "pagefile_disk",
+    "hibernation file disk": "hibernation_disk",
+    "crashdump disk": "crashdump_disk",
+    "clustered disk": "clustered",
+}
+_DISK_FLAGS = ("read_only", "boot_disk", "pagefile_disk", "hibernation_disk",
+               "crashdump_disk", "clustered")
+
+
+def _detail_lines(source):
+    """Split ``detail`` output into key/value lines and the volume table.
+
+    Yields (key, value) for each "Key : Value" line, (None, line) for other
+    text before the table, and finally ("volumes", iterator) for the rest.
+    """
+    lines = iter(_lines(source))
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith("Volume ###"):
+            yield "volumes", _chain(line, lines)
+            return
+        key, sep, value = stripped.partition(":")
+        if sep:
+            yield key.strip().lower(), value.strip()
+        elif stripped:
+            yield None, stripped
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+def parse_disk_detail(source):
+    """Parse ``detail disk`` output into a DiskDetail."""
+    detail = DiskDetail()
+    for key, value in _detail_lines(source):
+        if key == "volumes":
+            detail.volumes = list(iter_volumes(value))
+        elif key in _DISK_KEYS:
+            name = _DISK_KEYS[key]
+            setattr(detail, name, _yes(value) if name in _DISK_FLAGS else value)
+        elif key is None and detail.model is None and not value.endswith("."):
+            # The model name is the first free-standing line; diskpart's
+            # "Disk N is now the selected disk." lines end with a period.
+            detail.model = value
+    return detail
+
+
+def parse_partition_detail(source):
+    """Parse ``detail partition`` output into a PartitionDetail."""
+    detail = PartitionDetail()
+    for key, value in _detail_lines(source):
+        if key == "volumes":
+            detail.volumes = list(iter_volumes(value))
+        elif key == "type":
+            detail.type = value
+        elif key == "hidden":
+            detail.hidden = _yes(value)
+        elif key == "required":
+            detail.required = _yes(value)
+        elif key == "active":
+            detail.active = _yes(value)
+        elif key == "attrib":
+            detail.attributes = int(value, 16)
+        elif key == "offset in bytes":
+            detail.offset = int(value)
+        elif key is None and value.startswith("Partition ") and value[10:].isdigit():
+            detail.number = int(value[10:])
+    return detail
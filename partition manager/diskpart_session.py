@@ -0,0 +1,200 @@
+import codecs
+import locale
+import queue
+import subprocess
+import threading
+
+import metrics
+from progress import ProgressParser
+
+PROMPT = "DISKPART> "
+
+# Text diskpart prints when a command fails. In script mode (/s) diskpart
+# stops at the first failing command; the session does the same so a failed
+# "select" can never leave a later command running against the wrong disk.
+ERROR_MARKERS = (
+    "is not valid",
+    "are not valid",
+    "There is no disk selected",
+    "There is no partition selected",
+    "There is no volume selected",
+    "Virtual Disk Service error",
+    "DiskPart has encountered an error",
+    "is not recognized",
+    "is too big",
+    "cannot be shrunk",
+)
+
+
+class DiskpartSessionError(RuntimeError):
+    pass
+
+
+def command_failed(command, output):
+    """Return True if ``output`` shows that ``command`` did not succeed."""
+    if command.strip().lower().startswith("select"):
+        return "is now the selected" not in output
+    return any(marker in output for marker in ERROR_MARKERS)
+
+
+class DiskpartSession:
+    """A long-lived diskpart process driven over stdin/stdout pipes.
+
+    Starting diskpart and letting it enumerate disks is far slower than most
+    commands, so the process is kept open and reused. The end of each
+    command's output is found by waiting for the next prompt. If diskpart
+    exits or stops answering, the process is discarded and a new one is
+    started on the next call.
+    """
+
+    def __init__(self, command=None, timeout=600, encoding=None):
+        self.command = list(command or ["diskpart"])
+        self.timeout = timeout
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.restarts = 0
+        self._proc = None
+        self._chunks = None
+        self._buffer = ""
+        self._decoder = None
+        self._crashed = False
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        with self._lock:
+            self._ensure_started()
+
+    def _ensure_started(self):
+        if self.alive:
+            return
+        if self._proc is not None or self._crashed:
+            self._discard()
+            self.restarts += 1
+            self._crashed = False
+        # Timed until the first prompt: diskpart enumerates disks at startup
+        with metrics.timer("diskpart.spawn"):
+            self._proc = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                bufsize=0,
+                creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+            )
+            self._chunks = queue.Queue()
+            self._buffer = ""
+            # Keeps a multibyte character split across two reads in one piece
+            self._decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+            threading.Thread(target=self._pump, args=(self._proc.stdout, self._chunks),
+                             daemon=True).start()
+            try:
+                # Swallow the banner printed before the first prompt
+                self._read_until_prompt()
+            except DiskpartSessionError:
+                self._discard()
+                self._crashed = True
+                raise
+
+    def _pump(self, stream, chunks):
+        # Runs on a daemon thread so reads can time out and so a dead
+        # process is noticed instead of blocking forever.
+        while True:
+            try:
+                data = stream.read(4096)
+            except (OSError, ValueError):
+                data = b""
+            chunks.put(data)
+            if not data:
+                return
+
+    def _read_until_prompt(self, on_text=None):
+        while PROMPT not in self._buffer:
+            try:
+                data = self._chunks.get(timeout=self.timeout)
+            except queue.Empty:
+                raise DiskpartSessionError(
+                    f"diskpart did not answer within {self.timeout} seconds")
+            if not data:
+                raise DiskpartSessionError("diskpart exited unexpectedly")
+            text = self._decoder.decode(data)
+            if on_text is not None:
+                on_text(text)
+            self._buffer += text
+        output, _, self._buffer = self._buffer.partition(PROMPT)
+        return output.strip("\r\n")
+
+    def _send(self, command):
+        try:
+            self._proc.stdin.write((command + "\n").encode(self.encoding))
+            self._proc.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise DiskpartSessionError(f"Could not write to diskpart: {e}")
+
+    def execute(self, commands, on_progress=None):
+        """Run ``commands`` in order and return a list with each one's output.
+
+        Like ``diskpart /s``, execution stops at the first command that fails;
+        the returned list then ends with the failing command's output. If
+        ``on_progress`` is given it is called with a progress.ProgressEvent
+        as each command reports progress, on the calling thread.
+        """
+        parser = ProgressParser(on_progress) if on_progress is not None else None
+        if any(command.strip().lower() == "exit" for command in commands):
+            raise DiskpartSessionError("'exit' is handled by DiskpartSession.close()")
+        outputs = []
+        with self._lock:
+            self._ensure_started()
+            try:
+                for command in commands:
+                    verb = command.split(None, 1)[0].lower() if command.strip() else ""
+                    with metrics.timer(f"diskpart.command.{verb}"):
+                        self._send(command)
+                        if parser is not None:
+                            parser.start(command)
+                            output = self._read_until_prompt(parser.feed)
+                        else:
+                            output = self._read_until_prompt()
+                    outputs.append(output)
+                    if command_failed(command, output):
+                        break
+            except DiskpartSessionError:
+                self._discard()
+                self._crashed = True
+                raise
+        return outputs
+
+    def _discard(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        for stream in (proc.stdin, proc.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def close(self, timeout=5):
+        """Ask diskpart to exit, killing it if it does not within ``timeout``."""
+        with self._lock:
+            proc = self._proc
+            if proc is None:
+                return
+            if proc.poll() is None:
+                try:
+                    self._send("exit")
+                    proc.wait(timeout=timeout)
+                except (DiskpartSessionError, subprocess.TimeoutExpired):
+                    pass
+            self._discard()
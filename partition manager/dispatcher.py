@@ -0,0 +1,131 @@
+import queue
+import time
+
+from jobs import INTERACTIVE, JobScheduler
+
+
+class TkDispatcher:
+    """Run blocking calls on a worker pool and deliver results on the Tk thread.
+
+    Workers never touch Tk. They put results on a queue that the Tk event
+    loop drains with ``after()``; callbacks therefore always run on the main
+    thread. Each drain stops after ``budget_ms`` so a burst of results can
+    not stall the UI for longer than a frame.
+
+    Requests submitted with the same ``key`` supersede each other: a newer
+    request cancels an older one that has not started, and the result of an
+    older one that is already running is dropped.
+
+    Work runs on a jobs.JobScheduler, which orders it per disk and by
+    priority; see submit().
+    """
+
+    def __init__(self, root, max_workers=4, poll_ms=15, budget_ms=8, on_busy=None,
+                 scheduler=None):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.budget = budget_ms / 1000
+        self.on_busy = on_busy
+        self.scheduler = scheduler or JobScheduler(max_reads=max_workers)
+        self.results = queue.Queue()
+        self._generations = {}
+        self._futures = {}
+        self._busy = 0
+        self._closed = False
+        self._after_id = self.root.after(self.poll_ms, self._drain)
+
+    @property
+    def busy(self):
+        return self._busy > 0
+
+    def _set_busy(self, delta):
+        was_busy = self.busy
+        self._busy += delta
+        if self.on_busy is not None and was_busy != self.busy:
+            self.on_busy(self.busy)
+
+    def submit(self, func, *args, on_done=None, on_error=None, key=None, disk=None,
+               mutates=False, priority=INTERACTIVE, name=None):
+        """Run ``func(*args)`` on a worker. Must be called from the Tk thread.
+
+        ``on_done(result)`` or ``on_error(exception)`` is called on the Tk
+        thread when it finishes, unless a newer request with the same key
+        was submitted in the meantime. ``disk``, ``mutates``, ``priority``
+        and ``name`` are passed on to JobScheduler.submit(). Returns the Job.
+        """
+        generation = None
+        if key is not None:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            previous = self._futures.pop(key, None)
+            if previous is not None and previous.cancel():
+                self._set_busy(-1)
+        job = self.scheduler.submit(self._work, func, args, on_done, on_error, key,
+                                    generation, disk=disk, mutates=mutates,
+                                    priority=priority,
+                                    name=name or getattr(func, "__name__", "job"))
+        if key is not None:
+            self._futures[key] = job
+        self._set_busy(1)
+        return job
+
+    def _work(self, func, args, on_done, on_error, key, generation):
+        try:
+            result = func(*args)
+        except Exception as e:
+            self.results.put((on_error, (e,), key, generation, True))
+            # Let the scheduler mark the job FAILED too
+            raise
+        else:
+            self.results.put((on_done, (result,), key, generation, True))
+
+    def post(self, callback, *args):
+        """Run ``callback(*args)`` on the Tk thread. Safe to call from any thread."""
+        self.results.put((callback, args, None, None, False))
+
+    def _drain(self):
+        deadline = time.perf_counter() + self.budget
+        while time.perf_counter() < deadline:
+            try:
+                callback, args, key, generation, finished = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if finished:
+                self._set_busy(-1)
+            if key is not None:
+                if self._generations.get(key) != generation:
+                    continue
+                self._futures.pop(key, None)
+            if callback is not None:
+                try:
+                    callback(*args)
+                except Exception as e:
+                    # A failing callback must not stop the polling loop
+                    self.root.report_callback_exception(type(e), e, e.__traceback__)
+        if not self._closed:
+            self._after_id = self.root.after(self.poll_ms, self._drain)
+
+    def cancel(self, key):
+        """Forget the pending request for ``key`` so its result is dropped."""
+        self._generations[key] = self._generations.get(key, 0) + 1
+        future = self._futures.pop(key, None)
+        if future is not None and future.cancel():
+            self._set_busy(-1)
+
+    def cancel_job(self, job):
+        """Cancel a job submitted here if it has not started yet."""
+        if not job.cancel():
+            return False
+        for key, pending in list(self._futures.items()):
+            if pending is job:
+                del self._futures[key]
+        self._set_busy(-1)
+        return True
+
+    def shutdown(self):
+        self._closed = True
+        try:
+            self.root.after_cancel(self._after_id)
+        except Exception:
+            pass
+        self.scheduler.shutdown()
@@ -0,0 +1,188 @@
+"""Free-space queries over a disk's partition extents.
+
+ExtentIndex keeps the partitions of one disk as sorted (offset, end) pairs
+and the free runs between them, so the dialogs can answer "how far can this
+partition grow", "how big can a new partition be" and "does this request
+fit" with a bisect instead of asking diskpart and waiting for it to fail.
+All sizes passed in and returned by the check_* methods are in MB, the unit
+diskpart uses (1 MB = 1024 * 1024 bytes).
+"""
+from bisect import bisect_left
+
+MB = 1024 * 1024
+# diskpart starts the first partition at 1 MB and aligns new ones to 1 MB
+ALIGNMENT = MB
+GPT_RESERVED_SECTORS = 33
+MBR_PRIMARY_LIMIT = 4
+GPT_ENTRY_LIMIT = 128
+# WMI does not list the Microsoft Reserved partition Windows puts right
+# after the EFI system partition; it is 16 MB, or 128 MB on older installs
+ESP_TYPE = "GPT: System"
+MSR_MAX = 128 * MB
+
+
+def parse_size_mb(text):
+    text = str(text).strip()
+    if not text.isdigit() or int(text) == 0:
+        raise ValueError("Size must be a positive number")
+    return int(text)
+
+
+def _align_up(value):
+    return -(-value // ALIGNMENT) * ALIGNMENT
+
+
+def _align_down(value):
+    return value // ALIGNMENT * ALIGNMENT
+
+
+def hidden_reserved(disk):
+    """(offset, length) of the Microsoft Reserved partition WMI hides, or None.
+
+    Taken to fill the gap after a GPT disk's EFI system partition, up to
+    MSR_MAX bytes of it.
+    """
+    if disk.style != "gpt":
+        return None
+    for position, partition in enumerate(disk.partitions):
+        if partition.type == ESP_TYPE and partition.offset is not None:
+            start = partition.offset + partition.size
+            following = [p.offset for p in disk.partitions[position + 1:]]
+            length = min(min(following, default=disk.size) - start, MSR_MAX)
+            return (start, length) if length > 0 else None
+    return None
+
+
+def table_entries(disk):
+    """Partition table entries used on a topology.DiskNode.
+
+    On MBR disks logical partitions live inside one extended partition,
+    which takes a single primary entry. WMI lists the logical partitions but
+    not the extended partition around them.
+    """
+    partitions = disk.partitions
+    logical = [p for p in partitions if not p.primary]
+    entries = len(partitions) - len(logical)
+    if logical and not any(p.primary and p.offset <= logical[0].offset < p.offset + p.size
+                           for p in partitions):
+        entries += 1
+    if hidden_reserved(disk) is not None:
+        entries += 1
+    return entries
+
+
+class ExtentIndex:
+    """Partition extents of one disk and the free runs between them.
+
+    ``extents`` is an iterable of (offset, length) in bytes. Free space is
+    only counted between ``start`` and ``end`` and rounded to the 1 MB
+    alignment diskpart uses, so a run is what diskpart could really use.
+    """
+
+    def __init__(self, extents, end, start=ALIGNMENT, style=None, entries=None):
+        self.style = style
+        self.start = start
+        self.end = end
+        extents = sorted((offset, offset + length) for offset, length in extents)
+        self.offsets = [offset for offset, _ in extents]
+        self.ends = [end_ for _, end_ in extents]
+        # Partition table entries in use; by default one per extent
+        self.entries = len(extents) if entries is None else entries
+        # Free run i lies before extent i; the last one follows the last extent
+        self.free = []
+        previous = start
+        for offset, extent_end in extents + [(end, end)]:
+            self.free.append(max(0, _align_down(offset) - _align_up(previous)))
+            previous = max(previous, extent_end)
+
+    @classmethod
+    def from_disk(cls, disk):
+        """Build the index for a topology.DiskNode.
+
+        Returns None if the disk size or a partition offset is unknown.
+        The Microsoft Reserved partition WMI does not list is counted as
+        occupied; see hidden_reserved().
+        """
+        if disk is None or not disk.size:
+            return None
+        if any(p.offset is None or p.size is None for p in disk.partitions):
+            return None
+        end = disk.size
+        if disk.style != "mbr":
+            # Leave room for the backup GPT at the end of the disk
+            end -= GPT_RESERVED_SECTORS * (disk.bytes_per_sector or 512)
+        extents = [(p.offset, p.size) for p in disk.partitions]
+        reserved = hidden_reserved(disk)
+        if reserved is not None:
+            extents.append(reserved)
+        return cls(extents, end, style=disk.style, entries=table_entries(disk))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _position(self, offset):
+        position = bisect_left(self.offsets, offset)
+        if position == len(self.offsets) or self.offsets[position] != offset:
+            raise KeyError(f"No partition starts at offset {offset}")
+        return position
+
+    def free_after(self, offset):
+        """Bytes of contiguous free space right after the partition at ``offset``."""
+        return self.free[self._position(offset) + 1]
+
+    def largest_free(self):
+        """Size in bytes of the largest free run on the disk."""
+        return max(self.free)
+
+    def max_create_mb(self):
+        if self.style == "mbr" and self.entries >= MBR_PRIMARY_LIMIT:
+            return 0
+        if self.style == "gpt" and self.entries >= GPT_ENTRY_LIMIT:
+            return 0
+        return self.largest_free() // MB
+
+    def max_extend_mb(self, offset):
+        return self.free_after(offset) // MB
+
+    def check_create(self, size_mb):
+        size_mb = parse_size_mb(size_mb)
+        if self.style == "mbr" and self.entries >= MBR_PRIMARY_LIMIT:
+            raise ValueError("An MBR disk can hold at most 4 primary partitions")
+        if self.style == "gpt" and self.entries >= GPT_ENTRY_LIMIT:
+            raise ValueError("The GPT partition entry array is full")
+        largest = self.max_create_mb()
+        if size_mb > largest:
+            raise ValueError(f"Not enough unallocated space: the largest free "
+                             f"area is {largest} MB")
+        return size_mb
+
+    def check_extend(self, offset, size_mb):
+        size_mb = parse_size_mb(size_mb)
+        available = self.max_extend_mb(offset)
+        if size_mb > available:
+            if not available:
+                raise ValueError("There is no unallocated space directly after "
+                                 "this partition")
+            raise ValueError(f"Only {available} MB of unallocated space follows "
+                             f"this partition")
+        return size_mb
+
+
+def max_shrink_mb(partition):
+    """Upper bound for shrinking a topology.PartitionNode, or None if unknown.
+
+    A volume can give back at most its free space; diskpart may allow
+    less if unmovable files sit near the end of the volume.
+    """
+    if not partition.volumes or partition.volumes[0].free is None:
+        return None
+    return partition.volumes[0].free // MB
+
+
+def check_shrink(partition, size_mb):
+    size_mb = parse_size_mb(size_mb)
+    limit = max_shrink_mb(partition)
+    if limit is not None and size_mb > limit:
+        raise ValueError(f"The volume has only {limit} MB free; it cannot shrink "
+                         f"by {size_mb} MB")
+    return size_mb
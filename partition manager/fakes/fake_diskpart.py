@@ -0,0 +1,486 @@
+"""Stand-in for diskpart.exe so PartitionManager can be exercised off Windows.
+
+Usage:
+    python fake_diskpart.py            interactive session on stdin/stdout
+    python fake_diskpart.py /s FILE    run a script, like ``diskpart /s``
+
+The disk layout is kept in the JSON file named by FAKE_DISKPART_STATE so
+changes survive between processes. FAKE_DISKPART_STARTUP_DELAY (seconds)
+simulates the time diskpart spends starting and enumerating disks, and
+FAKE_DISKPART_PROGRESS_DELAY (seconds per 10 percent) makes extend, shrink
+and convert report progress slowly, the way long operations do.
+FAKE_DISKPART_COMMAND_DELAY (seconds) is added to every command.
+
+A disk with an "image" path in the state also gets its partition table
+written to that file whenever the state is saved, so the exact layout can
+be read back with partition_table the way it would be from the drive.
+"""
+import json
+import os
+import sys
+import time
+import uuid
+
+PROMPT = "DISKPART> "
+MB = 1024 ** 2
+GB = 1024 ** 3
+ALIGN = MB
+
+# Commands after which an interactive session writes the state back
+MUTATING = ("create", "delete", "extend", "shrink", "convert")
+
+BASIC_DATA_GUID = "ebd0a0a2-b9e5-4433-87c0-68b6b72699c7"
+TYPE_GUIDS = {
+    "System": "c12a7328-f81f-11d2-ba4b-00a0c93ec93b",
+    "Reserved": "e3c9e316-0b5c-4db8-817d-f92df00215ae",
+}
+
+
+def default_state():
+    return {
+        "disks": [
+            {
+                "model": "Fake NVMe SSD 512GB",
+                "size": 512 * GB,
+                "style": "gpt",
+                "partitions": [
+                    {"offset": MB, "size": 100 * MB, "type": "System",
+                     "fs": "FAT32", "label": "SYSTEM", "letter": ""},
+                    {"offset": 101 * MB, "size": 16 * MB, "type": "Reserved",
+                     "fs": "", "label": "", "letter": ""},
+                    {"offset": 117 * MB, "size": 400 * GB, "type": "Primary",
+                     "fs": "NTFS", "label": "Windows", "letter": "C"},
+                ],
+            },
+            {
+                "model": "Fake SATA HDD 1TB",
+                "size": 1024 * GB,
+                "style": "mbr",
+                "partitions": [
+                    {"offset": MB, "size": 200 * GB, "type": "Primary",
+                     "fs": "NTFS", "label": "Data", "letter": "D"},
+                ],
+            },
+        ]
+    }
+
+
+def fleet_state(disks, partitions):
+    """Return a state with ``disks`` GPT disks of ``partitions`` partitions each."""
+    state = {"disks": []}
+    for number in range(disks):
+        parts = []
+        offset = MB
+        for index in range(partitions):
+            size = (4 + index % 4) * GB
+            parts.append({"offset": offset, "size": size, "type": "Primary",
+                          "fs": "NTFS", "label": f"D{number}P{index + 1}",
+                          "letter": ""})
+            offset += size
+        state["disks"].append({"model": f"Fake SAN LUN {number}",
+                               "size": offset + 64 * GB, "style": "gpt",
+                               "partitions": parts})
+    return state
+
+
+def format_size(size):
+    """Format a byte count the way diskpart does (e.g. '1863 GB', '0 B').
+
+    Like diskpart, rounds to the nearest unit, so the shown value can be
+    above the exact one.
+    """
+    for unit, name in ((1024 ** 4, "TB"), (GB, "GB"), (MB, "MB"), (1024, "KB")):
+        if size >= 10 * unit:
+            return f"{(size + unit // 2) // unit} {name}"
+    return f"{size} B"
+
+
+class FakeDiskpart:
+    def __init__(self, state, out):
+        self.state = state
+        self.out = out
+        self.disk = None
+        self.partition = None
+        self.command_delay = float(os.environ.get("FAKE_DISKPART_COMMAND_DELAY", "0"))
+
+    def write(self, text=""):
+        self.out.write(text + "\n")
+
+    # -- helpers -----------------------------------------------------------
+
+    def _disks(self):
+        return self.state["disks"]
+
+    def _parts(self, disk):
+        disk["partitions"].sort(key=lambda p: p["offset"])
+        return disk["partitions"]
+
+    def _free(self, disk):
+        """Return (offset, length) of every aligned free gap on ``disk``."""
+        gaps = []
+        pos = ALIGN
+        end = disk["size"] - ALIGN if disk["style"] == "gpt" else disk["size"]
+        for part in self._parts(disk):
+            if part["offset"] > pos:
+                gaps.append((pos, part["offset"] - pos))
+            pos = max(pos, part["offset"] + part["size"])
+        if end > pos:
+            gaps.append((pos, end - pos))
+        return gaps
+
+    def _volumes(self):
+        volumes = []
+        for disk in self._disks():
+            for part in self._parts(disk):
+                if part.get("fs") or part.get("letter"):
+                    volumes.append(part)
+        return volumes
+
+    def _need_disk(self):
+        if self.disk is None:
+            self.write("There is no disk selected.")
+            self.write()
+            self.write("Please select a disk and try again.")
+            return False
+        return True
+
+    def _need_partition(self):
+        if not self._need_disk():
+            return False
+        if self.partition is None:
+            self.write("There is no partition selected.")
+            self.write()
+            self.write("Please select a partition and try again.")
+            return False
+        return True
+
+    def _error(self, message):
+        self.write("Virtual Disk Service error:")
+        self.write(message)
+        return False
+
+    def _progress(self, phase):
+        delay = float(os.environ.get("FAKE_DISKPART_PROGRESS_DELAY", "0"))
+        if not delay:
+            return
+        self.write(phase)
+        for percent in range(0, 101, 10):
+            # Rewritten in place, like diskpart does
+            self.out.write(f"  {percent:3} percent completed\r")
+            self.out.flush()
+            time.sleep(delay)
+        self.write()
+
+    def _volume_table(self, parts):
+        self.write("  Volume ###  Ltr  Label        Fs     Type        Size     Status     Info")
+        self.write("  ----------  ---  -----------  -----  ----------  -------  ---------  --------")
+        volumes = self._volumes()
+        for part in parts:
+            if part not in volumes:
+                continue
+            number = volumes.index(part)
+            mark = "*" if part is self.partition else " "
+            self.write(f"{mark} Volume {number:<3}  {part.get('letter') or '':<3}  "
+                       f"{part.get('label', '')[:11]:<11}  {part.get('fs', '')[:5]:<5}  "
+                       f"{'Partition':<10}  {format_size(part['size']):>7}  "
+                       f"{'Healthy':<9}  {part.get('info', '')}")
+
+    # -- commands ----------------------------------------------------------
+
+    def execute(self, line):
+        """Run one command line. Returns False if the command failed."""
+        words = line.strip().split()
+        if not words or words[0].lower() == "rem":
+            return True
+        verb = words[0].lower()
+        args = [w.lower() for w in words[1:]]
+        if self.command_delay:
+            time.sleep(self.command_delay)
+        handler = getattr(self, "cmd_" + verb, None)
+        if handler is None:
+            self.write(f"The command \"{words[0]}\" is not recognized.")
+            return False
+        self.write()
+        ok = handler(args)
+        self.write()
+        return ok is not False
+
+    def cmd_list(self, args):
+        what = args[0] if args else ""
+        if what == "disk":
+            self.write("  Disk ###  Status         Size     Free     Dyn  Gpt")
+            self.write("  --------  -------------  -------  -------  ---  ---")
+            for number, disk in enumerate(self._disks()):
+                free = sum(length for _, length in self._free(disk))
+                mark = "*" if disk is self.disk else " "
+                gpt = "*" if disk["style"] == "gpt" else " "
+                self.write(f"{mark} Disk {number:<4} {'Online':<13}  "
+                           f"{format_size(disk['size']):>7}  {format_size(free):>7}        {gpt}")
+        elif what == "partition":
+            if not self._need_disk():
+                return False
+            parts = self._parts(self.disk)
+            if not parts:
+                self.write("There are no partitions on this disk to show.")
+                return True
+            self.write("  Partition ###  Type              Size     Offset")
+            self.write("  -------------  ----------------  -------  -------")
+            for number, part in enumerate(parts, 1):
+                mark = "*" if part is self.partition else " "
+                self.write(f"{mark} Partition {number:<5}{part['type']:<16}  "
+                           f"{format_size(part['size']):>7}  {format_size(part['offset']):>7}")
+        elif what == "volume":
+            self._volume_table([p for d in self._disks() for p in self._parts(d)])
+        else:
+            self.write("The arguments specified for this command are not valid.")
+            return False
+
+    def cmd_select(self, args):
+        if len(args) < 2 or not args[1].isdigit():
+            self.write("The arguments specified for this command are not valid.")
+            return False
+        what, number = args[0], int(args[1])
+        if what == "disk":
+            if number >= len(self._disks()):
+                self.write("The disk you specified is not valid.")
+                self.write()
+                self.write("There is no disk selected.")
+                return False
+            self.disk = self._disks()[number]
+            self.partition = None
+            self.write(f"Disk {number} is now the selected disk.")
+        elif what == "partition":
+            if not self._need_disk():
+                return False
+            parts = self._parts(self.disk)
+            if not 1 <= number <= len(parts):
+                self.write("The partition you specified is not valid.")
+                self.write("Please choose a valid partition.")
+                self.write()
+                self.write("There is no partition selected.")
+                return False
+            self.partition = parts[number - 1]
+            self.write(f"Partition {number} is now the selected partition.")
+        else:
+            self.write("The arguments specified for this command are not valid.")
+            return False
+
+    def cmd_detail(self, args):
+        what = args[0] if args else ""
+        if what == "disk":
+            if not self._need_disk():
+                return False
+            number = self._disks().index(self.disk)
+            self.write(self.disk["model"])
+            self.write("Disk ID: {00000000-0000-0000-0000-%012d}" % number)
+            self.write("Type   : SATA")
+            self.write("Status : Online")
+            self.write(f"Path   : {number}")
+            self.write("Target : 0")
+            self.write("LUN ID : 0")
+            self.write("Current Read-only State : No")
+            self.write("Read-only  : No")
+            self.write("Boot Disk  : " + ("Yes" if number == 0 else "No"))
+            self.write("Pagefile Disk  : No")
+            self.write("Hibernation File Disk  : No")
+            self.write("Crashdump Disk  : No")
+            self.write("Clustered Disk  : No")
+            self.write()
+            self._volume_table(self._parts(self.disk))
+        elif what == "partition":
+            if not self._need_partition():
+                return False
+            part = self.partition
+            number = self._parts(self.disk).index(part) + 1
+            self.write(f"Partition {number}")
+            if self.disk["style"] == "gpt":
+                self.write(f"Type    : {part.get('guid', BASIC_DATA_GUID)}")
+                self.write("Hidden  : No")
+                self.write("Required: No")
+                self.write(f"Attrib  : {part.get('attrib', '0000000000000000')}")
+            else:
+                self.write(f"Type  : {part.get('mbr_type', '07')}")
+                self.write("Hidden: No")
+                self.write("Active: " + ("Yes" if number == 1 else "No"))
+            self.write(f"Offset in Bytes: {part['offset']}")
+            self.write()
+            self._volume_table([part])
+        else:
+            self.write("The arguments specified for this command are not valid.")
+            return False
+
+    def cmd_create(self, args):
+        if not self._need_disk():
+            return False
+        size = None
+        for arg in args[2:]:
+            if arg.startswith("size="):
+                size = int(arg[5:]) * MB
+        if self.disk["style"] == "mbr" and len(self._parts(self.disk)) >= 4:
+            return self._error("There is not enough usable space for this operation.")
+        gaps = self._free(self.disk)
+        if size is None:
+            gaps = sorted(gaps, key=lambda gap: gap[1], reverse=True)[:1]
+        for offset, length in gaps:
+            if size is None or length >= size:
+                part = {"offset": offset, "size": length if size is None else size,
+                        "type": "Primary", "fs": "", "label": "", "letter": ""}
+                self.disk["partitions"].append(part)
+                self.partition = part
+                self.write("DiskPart succeeded in creating the specified partition.")
+                return True
+        return self._error("There is not enough usable space for this operation.")
+
+    def cmd_delete(self, args):
+        if not self._need_partition():
+            return False
+        self.disk["partitions"].remove(self.partition)
+        self.partition = None
+        self.write("DiskPart successfully deleted the selected partition.")
+
+    def cmd_extend(self, args):
+        if not self._need_partition():
+            return False
+        part = self.partition
+        end = part["offset"] + part["size"]
+        available = 0
+        for offset, length in self._free(self.disk):
+            if offset == end:
+                available = length
+        size = available
+        for arg in args:
+            if arg.startswith("size="):
+                size = int(arg[5:]) * MB
+        if size <= 0 or size > available:
+            return self._error("There is not enough usable space for this operation.")
+        self._progress("DiskPart is extending the volume.")
+        part["size"] += size
+        self.write("DiskPart successfully extended the volume.")
+
+    def cmd_shrink(self, args):
+        if not self._need_partition():
+            return False
+        part = self.partition
+        maximum = part["size"] - part.get("used", part["size"] // 2)
+        size = maximum
+        for arg in args:
+            if arg.startswith("desired="):
+                size = int(arg[8:]) * MB
+        if not part.get("fs"):
+            self.write("The volume cannot be shrunk because the file system does not support it.")
+            return False
+        if size > maximum:
+            self.write("The specified shrink size is too big and will cause the volume to be")
+            self.write("smaller than the minimum volume size.")
+            return False
+        self._progress("DiskPart is shrinking the volume.")
+        part["size"] -= size
+        self.write(f"DiskPart successfully shrunk the volume by: {format_size(size):>7}")
+
+    def cmd_convert(self, args):
+        if not self._need_disk():
+            return False
+        target = args[0] if args else ""
+        if target not in ("gpt", "mbr"):
+            self.write("The arguments specified for this command are not valid.")
+            return False
+        if self._parts(self.disk):
+            return self._error("The specified disk is not convertible. CDROMs and DVDs\n"
+                               "are examples of disks that are not convertible.")
+        self._progress(f"DiskPart is converting the disk to {target.upper()}.")
+        self.disk["style"] = target
+        self.write(f"DiskPart successfully converted the selected disk to {target.upper()} format.")
+
+    def cmd__crash(self, args):
+        # Not a diskpart command: lets callers simulate diskpart dying.
+        self.out.flush()
+        os._exit(3)
+
+
+def load_state(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return default_state()
+
+
+def save_state(path, state):
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+    write_images(state)
+
+
+def write_images(state):
+    """Write the partition table of every disk that names an "image" file."""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from partition_writer import ImageLayout, MBR_NTFS
+
+    for disk in state["disks"]:
+        if not disk.get("image"):
+            continue
+        partitions = []
+        for part in disk["partitions"]:
+            if disk["style"] == "gpt":
+                part_type = part.get("guid") or TYPE_GUIDS.get(part["type"], BASIC_DATA_GUID)
+                partitions.append((part["offset"], part["size"], part_type,
+                                   str(uuid.uuid4()), False))
+            else:
+                partitions.append((part["offset"], part["size"], MBR_NTFS, None, False))
+        with open(disk["image"], "wb") as f:
+            f.truncate(disk["size"])
+        ImageLayout(disk["image"], disk["size"], disk["style"],
+                    partitions=partitions).save()
+
+
+def banner(out):
+    out.write("\nMicrosoft DiskPart version 10.0.19041.964\n\n")
+    out.write("Copyright (C) Microsoft Corporation.\n")
+    out.write("On computer: FAKEHOST\n\n")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    path = os.environ.get("FAKE_DISKPART_STATE")
+    state = load_state(path)
+    time.sleep(float(os.environ.get("FAKE_DISKPART_STARTUP_DELAY", "0")))
+    out = sys.stdout
+    dp = FakeDiskpart(state, out)
+    banner(out)
+
+    if len(argv) >= 2 and argv[0].lower() == "/s":
+        with open(argv[1]) as f:
+            lines = f.read().splitlines()
+        code = 0
+        for line in lines:
+            if line.strip().lower() == "exit":
+                break
+            if not dp.execute(line):
+                code = 1
+                break
+        save_state(path, state)
+        out.write("Leaving DiskPart...\n")
+        out.flush()
+        return code
+
+    while True:
+        out.write(PROMPT)
+        out.flush()
+        line = sys.stdin.readline()
+        if not line or line.strip().lower() == "exit":
+            break
+        dp.execute(line)
+        # Rewriting a large fleet's state after every "list" would dwarf
+        # the command itself
+        if line.strip().lower().startswith(MUTATING):
+            save_state(path, state)
+    out.write("\nLeaving DiskPart...\n")
+    out.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
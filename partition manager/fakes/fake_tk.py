@@ -0,0 +1,130 @@
+"""Minimal stand-ins for the ttk widgets the GUI drives, for headless runs.
+
+FakeTreeview keeps its items in plain Python structures and counts the
+calls made to it, so benchmarks can report Treeview work without a display.
+FakeRoot runs after() callbacks when pumped, standing in for the Tk event
+loop that TkDispatcher polls from.
+"""
+import heapq
+import itertools
+import time
+import traceback
+from collections import Counter
+
+
+class FakeRoot:
+    def __init__(self):
+        self._timers = []
+        self._ids = itertools.count(1)
+        self._cancelled = set()
+
+    def after(self, ms, func, *args):
+        timer_id = next(self._ids)
+        heapq.heappush(self._timers, (time.monotonic() + ms / 1000, timer_id, func, args))
+        return timer_id
+
+    def after_cancel(self, timer_id):
+        self._cancelled.add(timer_id)
+
+    def configure(self, **options):
+        pass
+
+    def report_callback_exception(self, exc_type, exc, tb):
+        traceback.print_exception(exc_type, exc, tb)
+
+    def pump(self, until, timeout=60):
+        """Run due callbacks until ``until()`` is true. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while not until():
+            now = time.monotonic()
+            if now > deadline:
+                return False
+            if not self._timers:
+                time.sleep(0.001)
+                continue
+            due, timer_id, func, args = self._timers[0]
+            if due > now:
+                time.sleep(min(due - now, 0.001))
+                continue
+            heapq.heappop(self._timers)
+            if timer_id in self._cancelled:
+                self._cancelled.discard(timer_id)
+                continue
+            func(*args)
+        return True
+
+
+class FakeTreeview:
+    def __init__(self, height=10):
+        self.options = {"height": height, "yscrollcommand": ""}
+        self.items = {}
+        self.order = []
+        self.selected = ()
+        self.bindings = {}
+        self.calls = Counter()
+
+    def cget(self, option):
+        return self.options[option]
+
+    def configure(self, **options):
+        self.options.update(options)
+
+    def bind(self, sequence, func, add=None):
+        self.bindings.setdefault(sequence, []).append(func)
+
+    def insert(self, parent, index, iid=None, values=()):
+        self.calls["insert"] += 1
+        if iid in self.items:
+            raise ValueError(f"Item {iid} already exists")
+        self.items[iid] = tuple(values)
+        if index == "end":
+            self.order.append(iid)
+        else:
+            self.order.insert(index, iid)
+        return iid
+
+    def delete(self, *iids):
+        self.calls["delete"] += 1
+        gone = set(iids)
+        for iid in iids:
+            del self.items[iid]
+        self.order = [iid for iid in self.order if iid not in gone]
+        self.selected = tuple(iid for iid in self.selected if iid not in gone)
+
+    def item(self, iid, values=None):
+        self.calls["item"] += 1
+        if values is not None:
+            self.items[iid] = tuple(values)
+        return {"values": self.items[iid]}
+
+    def move(self, iid, parent, index):
+        self.calls["move"] += 1
+        self.order.remove(iid)
+        self.order.insert(index, iid)
+
+    def get_children(self, item=""):
+        return tuple(self.order)
+
+    def exists(self, iid):
+        return iid in self.items
+
+    def selection(self):
+        return self.selected
+
+    def selection_set(self, items):
+        self.selected = tuple(items)
+
+    def yview(self, *args):
+        return (0.0, 1.0)
+
+
+class FakeScrollbar:
+    def __init__(self):
+        self.options = {}
+        self.position = (0.0, 1.0)
+
+    def configure(self, **options):
+        self.options.update(options)
+
+    def set(self, first, last):
+        self.position = (float(first), float(last))
@@ -0,0 +1,96 @@
+"""In-memory stand-in for WMI, answering the queries TopologyLoader makes.
+
+The layout comes from a fake_diskpart state dict, so a FakeWmiBackend and a
+fake diskpart can describe the same disks. Like real WMI, the Microsoft
+Reserved partition is not listed and only lettered volumes appear as
+Win32_LogicalDisk.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_diskpart import default_state, fleet_state  # noqa: E402
+
+
+def _path(class_name, device_id):
+    escaped = device_id.replace("\\", "\\\\").replace('"', '\\"')
+    return f'\\\\FAKEHOST\\root\\cimv2:{class_name}.DeviceID="{escaped}"'
+
+
+def _partition_type(style, part_type):
+    # What Win32_DiskPartition.Type says for the fake diskpart types
+    if style == "gpt":
+        return "GPT: System" if part_type == "System" else "GPT: Basic Data"
+    return "Installable File System"
+
+
+def _matches(row, where):
+    """Evaluate the "Name = value [OR Name = value ...]" conditions WQL uses here."""
+    for clause in where.split(" OR "):
+        name, _, value = clause.partition("=")
+        value = value.strip().strip("'\"")
+        if str(row.get(name.strip())) == value:
+            return True
+    return False
+
+
+class FakeWmiBackend:
+    def __init__(self, state=None, latency=0.0):
+        self.latency = latency
+        self.queries = 0
+        self.load_state(state if state is not None else default_state())
+
+    @classmethod
+    def fleet(cls, disks, partitions, latency=0.0):
+        return cls(fleet_state(disks, partitions), latency)
+
+    def load_state(self, state):
+        tables = {name: [] for name in (
+            "Win32_DiskDrive", "Win32_DiskPartition", "Win32_LogicalDisk",
+            "Win32_DiskDriveToDiskPartition", "Win32_LogicalDiskToPartition")}
+        for number, disk in enumerate(state["disks"]):
+            disk_id = f"\\\\.\\PHYSICALDRIVE{number}"
+            tables["Win32_DiskDrive"].append({
+                "Index": number, "DeviceID": disk_id, "Model": disk["model"],
+                "Size": str(disk["size"]), "InterfaceType": "SCSI",
+                "BytesPerSector": 512,
+            })
+            visible = [p for p in sorted(disk["partitions"], key=lambda p: p["offset"])
+                       if p["type"] != "Reserved"]
+            for index, part in enumerate(visible):
+                part_id = f"Disk #{number}, Partition #{index}"
+                tables["Win32_DiskPartition"].append({
+                    "DeviceID": part_id, "DiskIndex": number, "Index": index,
+                    "StartingOffset": str(part["offset"]), "Size": str(part["size"]),
+                    "Type": _partition_type(disk["style"], part["type"]),
+                    "BootPartition": part["type"] == "System",
+                    "PrimaryPartition": part["type"] != "Logical",
+                })
+                tables["Win32_DiskDriveToDiskPartition"].append({
+                    "Antecedent": _path("Win32_DiskDrive", disk_id),
+                    "Dependent": _path("Win32_DiskPartition", part_id),
+                })
+                if part.get("letter"):
+                    volume_id = part["letter"] + ":"
+                    tables["Win32_LogicalDisk"].append({
+                        "DeviceID": volume_id, "Size": str(part["size"]),
+                        "FreeSpace": str(part["size"] - part.get("used", part["size"] // 2)),
+                        "FileSystem": part.get("fs") or None,
+                        "VolumeName": part.get("label", ""),
+                    })
+                    tables["Win32_LogicalDiskToPartition"].append({
+                        "Antecedent": _path("Win32_DiskPartition", part_id),
+                        "Dependent": _path("Win32_LogicalDisk", volume_id),
+                    })
+        self.tables = tables
+
+    def instances(self, class_name, properties, where=None):
+        self.queries += 1
+        if self.latency:
+            time.sleep(self.latency)
+        rows = self.tables[class_name]
+        if where:
+            rows = [row for row in rows if _matches(row, where)]
+        return [{name: row.get(name) for name in properties} for row in rows]
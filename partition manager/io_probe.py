@@ -0,0 +1,285 @@
+"""Sequential and random I/O throughput of a volume, file or disk image.
+
+IOProbe reads blocks of ``block_size`` bytes from ``queue_depth`` threads
+at once. Each thread has its own handle and a buffer allocated up front
+that readinto() fills through a memoryview, so nothing is allocated or
+copied per operation. Offsets are multiples of the block size, which raw
+volumes (\\\\.\\C:) need. Write tests go to a scratch file, never to the
+target itself. Every operation's latency is kept for the percentiles.
+
+Where os.posix_fadvise exists the target's page cache is dropped before
+each read test; elsewhere, reading a target that is smaller than memory
+twice measures the cache rather than the disk.
+"""
+import itertools
+import json
+import os
+import random
+import struct
+import threading
+import time
+from array import array
+
+KB = 1024
+MB = 1024 * KB
+SEQ_READ = "seq-read"
+RAND_READ = "rand-read"
+SEQ_WRITE = "seq-write"
+RAND_WRITE = "rand-write"
+READ_TESTS = (SEQ_READ, RAND_READ)
+WRITE_TESTS = (SEQ_WRITE, RAND_WRITE)
+SCRATCH_NAME = "partition-manager-io-test.tmp"
+# Raw volume offsets and lengths must be whole sectors; 4 KB covers both
+# 512 byte and 4K sector drives
+BLOCK_MULTIPLE = 4 * KB
+MAX_QUEUE_DEPTH = 256
+
+
+def parse_block_size(text):
+    """Block size in bytes from a number of KB typed by the user."""
+    text = str(text).strip()
+    if not text.isdigit() or int(text) == 0 or int(text) * KB % BLOCK_MULTIPLE:
+        raise ValueError(f"Block size must be a multiple of {BLOCK_MULTIPLE // KB} KB")
+    return int(text) * KB
+
+
+def parse_queue_depth(text):
+    text = str(text).strip()
+    if not text.isdigit() or not 1 <= int(text) <= MAX_QUEUE_DEPTH:
+        raise ValueError(f"Queue depth must be a whole number from 1 to {MAX_QUEUE_DEPTH}")
+    return int(text)
+
+
+class ProbeResult:
+    """Throughput and latency of one test."""
+
+    __slots__ = ("test", "block_size", "queue_depth", "operations", "bytes",
+                 "elapsed", "latencies")
+
+    def __init__(self, test, block_size, queue_depth, latencies, elapsed):
+        self.test = test
+        self.block_size = block_size
+        self.queue_depth = queue_depth
+        self.latencies = sorted(latencies)
+        self.operations = len(self.latencies)
+        self.bytes = self.operations * block_size
+        self.elapsed = elapsed
+
+    @property
+    def mb_per_s(self):
+        return self.bytes / MB / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def iops(self):
+        return self.operations / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, q):
+        """Latency in seconds that ``q`` of the operations stayed under."""
+        if not self.latencies:
+            return None
+        return self.latencies[min(self.operations - 1, int(q * self.operations))]
+
+    def to_dict(self):
+        return {
+            "test": self.test,
+            "block_size": self.block_size,
+            "queue_depth": self.queue_depth,
+            "operations": self.operations,
+            "bytes": self.bytes,
+            "seconds": self.elapsed,
+            "mb_per_s": self.mb_per_s,
+            "iops": self.iops,
+            "latency_ms": {name: None if value is None else value * 1000
+                           for name, value in (("p50", self.percentile(0.50)),
+                                               ("p95", self.percentile(0.95)),
+                                               ("p99", self.percentile(0.99)),
+                                               ("max", self.latencies[-1]
+                                                if self.latencies else None))},
+        }
+
+    def __repr__(self):
+        return (f"ProbeResult({self.test}, {self.mb_per_s:.1f} MB/s, "
+                f"{self.iops:.0f} IOPS)")
+
+
+def _drop_cache(path):
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class IOProbe:
+    """Measure ``path`` (a file, image or raw volume).
+
+    ``size`` is the number of bytes to test, by default the file's size;
+    raw Windows volumes do not report one, so pass the volume's size.
+    Each test runs for ``duration`` seconds or until ``max_bytes`` were
+    transferred. Write tests use a scratch file of ``scratch_size`` bytes
+    in ``scratch_dir``, deleted afterwards. cancel() also stops a run that
+    has not started yet; build a new probe to measure again.
+    """
+
+    def __init__(self, path, block_size=64 * KB, queue_depth=4, duration=5.0,
+                 size=None, max_bytes=None, scratch_dir=None, scratch_size=256 * MB):
+        self.path = path
+        self.block_size = block_size
+        self.queue_depth = queue_depth
+        self.duration = duration
+        self.size = size
+        self.max_bytes = max_bytes
+        self.scratch_dir = scratch_dir
+        self.scratch_size = scratch_size
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self, tests=READ_TESTS):
+        """Run ``tests`` in order; returns a list of ProbeResults."""
+        results = []
+        for test in tests:
+            if self._cancel.is_set():
+                break
+            if test in READ_TESTS:
+                results.append(self.read(test == RAND_READ))
+            elif test in WRITE_TESTS:
+                results.append(self.write(test == RAND_WRITE))
+            else:
+                raise ValueError(f"Unknown test {test!r}")
+        return results
+
+    def read(self, random_access=False):
+        size = self.size
+        if size is None:
+            with open(self.path, "rb", buffering=0) as f:
+                size = f.seek(0, os.SEEK_END)
+        _drop_cache(self.path)
+        return self._measure(RAND_READ if random_access else SEQ_READ, self.path,
+                             "rb", size, random_access)
+
+    def write(self, random_access=False):
+        directory = self.scratch_dir or os.path.dirname(os.path.abspath(self.path))
+        scratch = os.path.join(directory, SCRATCH_NAME)
+        size = self.scratch_size // self.block_size * self.block_size
+        with open(scratch, "wb") as f:
+            f.truncate(size)
+        try:
+            return self._measure(RAND_WRITE if random_access else SEQ_WRITE, scratch,
+                                 "r+b", size, random_access)
+        finally:
+            os.remove(scratch)
+
+    def _measure(self, test, path, mode, size, random_access):
+        blocks = size // self.block_size
+        if blocks < 1:
+            raise ValueError(f"{path} is smaller than one {self.block_size} byte block")
+        limit = None
+        if self.max_bytes is not None:
+            limit = max(1, self.max_bytes // self.block_size)
+        # Sequential threads share one position so together they walk the
+        # target in order, as a deeper queue on one stream would
+        position = itertools.count()
+        latencies = [array("d") for _ in range(self.queue_depth)]
+        errors = []
+        files = [open(path, mode, buffering=0) for _ in range(self.queue_depth)]
+        try:
+            start = time.perf_counter()
+            deadline = start + self.duration
+            threads = [threading.Thread(target=self._worker,
+                                        args=(files[number], number, test, blocks,
+                                              random_access, position, limit, deadline,
+                                              latencies[number], errors),
+                                        daemon=True, name=f"pm-io-{number + 1}")
+                       for number in range(self.queue_depth)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if mode != "rb":
+                # Count getting the data onto the disk, not just into the cache
+                os.fsync(files[0].fileno())
+            elapsed = time.perf_counter() - start
+        finally:
+            for f in files:
+                f.close()
+        if errors:
+            raise errors[0]
+        return ProbeResult(test, self.block_size, self.queue_depth,
+                           itertools.chain.from_iterable(latencies), elapsed)
+
+    def _worker(self, f, number, test, blocks, random_access, position, limit, deadline,
+                latencies, errors):
+        block_size = self.block_size
+        buffer = bytearray(block_size)
+        writing = test in WRITE_TESTS
+        if writing:
+            # Random data, so compressing storage cannot cheat; each write
+            # also gets its own number in the first 8 bytes, so neither can
+            # deduplicating storage
+            buffer[:] = os.urandom(block_size)
+            stamp = struct.Struct("<Q").pack_into
+            serials = itertools.count(number << 48)
+        view = memoryview(buffer)
+        transfer = f.write if writing else f.readinto
+        choose = random.Random(number).randrange
+        clock = time.perf_counter
+        record = latencies.append
+        cancelled = self._cancel.is_set
+        try:
+            while True:
+                if random_access:
+                    if limit is not None and next(position) >= limit:
+                        return
+                    block = choose(blocks)
+                else:
+                    block = next(position)
+                    if limit is not None and block >= limit:
+                        return
+                    block %= blocks
+                if writing:
+                    stamp(buffer, 0, next(serials))
+                started = clock()
+                if started >= deadline or cancelled():
+                    return
+                f.seek(block * block_size)
+                if transfer(view) != block_size:
+                    raise OSError(f"Short transfer at offset {block * block_size}")
+                record(clock() - started)
+        except OSError as e:
+            errors.append(e)
+        finally:
+            view.release()
+
+
+def format_results(results):
+    """Results as a plain-text table."""
+    lines = [f"{'Test':<11} {'Block':>7} {'QD':>3} {'MB/s':>9} {'IOPS':>9} "
+             f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"]
+    for result in results:
+        data = result.to_dict()
+        latency = [f"{value:8.3f}" if value is not None else f"{'-':>8}"
+                   for value in data["latency_ms"].values()]
+        lines.append(f"{result.test:<11} {_block(result.block_size):>7} "
+                     f"{result.queue_depth:>3} {result.mb_per_s:9.1f} {result.iops:9.0f} "
+                     + " ".join(latency))
+    return "\n".join(lines)
+
+
+def save_report(path, results, **info):
+    """Write ``results`` and any extra ``info`` fields to a JSON file."""
+    data = dict(info, results=[result.to_dict() for result in results])
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def _block(size):
+    return f"{size // MB}M" if size >= MB and size % MB == 0 else f"{size // KB}K"
@@ -0,0 +1,202 @@
+import itertools
+import threading
+import time
+from bisect import insort
+from collections import deque
+
+# Lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Job:
+    """One unit of work queued on a JobScheduler."""
+
+    def __init__(self, scheduler, id, func, args, name, disk, mutates, priority, callback):
+        self._scheduler = scheduler
+        self.id = id
+        self.func = func
+        self.args = args
+        self.name = name
+        self.disk = disk
+        self.mutates = mutates
+        self.priority = priority
+        self.callback = callback
+        self.state = PENDING
+        self.result = None
+        self.error = None
+        self.created = time.monotonic()
+        self.started = None
+        self.finished = None
+
+    def __lt__(self, other):
+        return (self.priority, self.id) < (other.priority, other.id)
+
+    def cancel(self):
+        """Cancel the job if it has not started. Returns True if it was cancelled."""
+        return self._scheduler.cancel(self)
+
+    def cancelled(self):
+        return self.state == CANCELLED
+
+    def done(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    @property
+    def wait_time(self):
+        """Seconds spent queued, so far if the job has not started."""
+        end = self.started or self.finished or time.monotonic()
+        return end - self.created
+
+    @property
+    def run_time(self):
+        if self.started is None:
+            return None
+        return (self.finished or time.monotonic()) - self.started
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.name!r}, disk={self.disk!r}, {self.state})"
+
+
+class JobScheduler:
+    """Run disk jobs on worker threads with per-disk ordering.
+
+    Jobs that change a disk (``mutates=True``) run one at a time per disk,
+    in the order they were submitted, and never while another job on that
+    disk runs. Read-only jobs run concurrently, at most ``max_reads`` at a
+    time, but not on a disk that is being changed. Among the jobs that may
+    start, INTERACTIVE ones go before BACKGROUND ones.
+    """
+
+    def __init__(self, max_reads=4, max_mutations=2, history=200):
+        self.max_reads = max_reads
+        self.max_mutations = max_mutations
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._pending = []
+        self._running = []
+        self._history = deque(maxlen=history)
+        # disk -> ids of its pending mutations, oldest first
+        self._disk_queue = {}
+        self._threads = []
+        self._closed = False
+
+    def submit(self, func, *args, name=None, disk=None, mutates=False,
+               priority=INTERACTIVE, callback=None):
+        """Queue ``func(*args)`` and return its Job.
+
+        ``callback(job)`` is called on the worker thread once the job has
+        finished or failed.
+        """
+        disk = None if disk is None else int(disk)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The scheduler has been shut down")
+            job = Job(self, next(self._ids), func, args,
+                      name or getattr(func, "__name__", "job"), disk, mutates,
+                      priority, callback)
+            insort(self._pending, job)
+            if mutates and disk is not None:
+                self._disk_queue.setdefault(disk, deque()).append(job.id)
+            self._start_workers()
+            self._cond.notify()
+        return job
+
+    def _start_workers(self):
+        while len(self._threads) < self.max_reads + self.max_mutations:
+            thread = threading.Thread(target=self._worker, daemon=True,
+                                      name=f"pm-job-{len(self._threads) + 1}")
+            self._threads.append(thread)
+            thread.start()
+
+    def _startable(self, job):
+        running = self._running
+        if job.mutates:
+            if sum(1 for other in running if other.mutates) >= self.max_mutations:
+                return False
+            if job.disk is None:
+                return True
+            if self._disk_queue[job.disk][0] != job.id:
+                return False
+            return not any(other.disk == job.disk for other in running)
+        if sum(1 for other in running if not other.mutates) >= self.max_reads:
+            return False
+        return job.disk is None or not any(
+            other.mutates and other.disk == job.disk for other in running)
+
+    def _next_job(self):
+        for position, job in enumerate(self._pending):
+            if self._startable(job):
+                del self._pending[position]
+                if job.mutates and job.disk is not None:
+                    self._disk_queue[job.disk].popleft()
+                return job
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                job.state = RUNNING
+                job.started = time.monotonic()
+                self._running.append(job)
+            try:
+                job.result = job.func(*job.args)
+                job.state = DONE
+            except Exception as e:
+                job.error = e
+                job.state = FAILED
+            with self._cond:
+                job.finished = time.monotonic()
+                self._running.remove(job)
+                self._history.append(job)
+                self._cond.notify_all()
+            if job.callback is not None:
+                job.callback(job)
+
+    def cancel(self, job):
+        with self._cond:
+            if job.state != PENDING:
+                return False
+            self._pending.remove(job)
+            if job.mutates and job.disk is not None:
+                self._disk_queue[job.disk].remove(job.id)
+            job.state = CANCELLED
+            job.finished = time.monotonic()
+            self._history.append(job)
+            # The cancelled job may have been holding back its disk
+            self._cond.notify_all()
+            return True
+
+    def cancel_pending(self, disk=None):
+        """Cancel every job that has not started, or only those on ``disk``."""
+        with self._cond:
+            jobs = [job for job in self._pending if disk is None or job.disk == int(disk)]
+        return sum(1 for job in jobs if self.cancel(job))
+
+    def jobs(self):
+        """Snapshot of finished, running and pending jobs, oldest first."""
+        with self._cond:
+            jobs = list(self._history) + self._running + self._pending
+        return sorted(jobs, key=lambda job: job.id)
+
+    def shutdown(self, wait=False):
+        """Cancel pending jobs and stop the workers once running jobs finish."""
+        self.cancel_pending()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,241 @@
+"""Alignment and layout health of partitions.
+
+check_disk() looks at a topology.DiskNode, either from the WMI topology
+(Win32_DiskPartition.StartingOffset and Size, Win32_DiskDrive.BytesPerSector)
+or from partition_table.read_layout(), and reports:
+
+* partitions that do not start on a physical sector boundary, so every
+  write to them touches two physical sectors;
+* partitions that do not start on a 1 MB boundary, the alignment Windows
+  uses and that SSD erase blocks and SAN stripes are sized for;
+* partitions whose length is not a whole number of physical sectors;
+* free space split into several areas, so no one partition can use it all;
+* slack: space between partitions too small or too misaligned to use.
+
+Win32_DiskDrive only reports the logical sector size, so the physical
+sector size is taken to be 4 KB, as on 512e drives, unless it is given.
+WMI does not list the Microsoft Reserved partition, so free areas smaller
+than MIN_FREE_AREA are not counted as fragments.
+"""
+from extents import ALIGNMENT, MB, ExtentIndex
+
+PHYSICAL_SECTOR = 4096
+MIN_FREE_AREA = 256 * MB
+
+OK = "ok"
+INFO = "info"
+WARNING = "warning"
+ERROR = "error"
+SEVERITIES = (OK, INFO, WARNING, ERROR)
+
+# Short text for the partition list's Health column
+LABELS = {
+    "unknown": "Unknown",
+    "misaligned": "Misaligned",
+    "not_1mb_aligned": "Not 1 MB aligned",
+    "partial_sector": "Partial sector",
+}
+
+
+class Issue:
+    __slots__ = ("severity", "code", "message")
+
+    def __init__(self, severity, code, message):
+        self.severity = severity
+        self.code = code
+        self.message = message
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"Issue({self.severity}, {self.code!r})"
+
+
+def _worst(issues):
+    return max((issue.severity for issue in issues), key=SEVERITIES.index, default=OK)
+
+
+class PartitionHealth:
+    __slots__ = ("partition", "issues")
+
+    def __init__(self, partition, issues):
+        self.partition = partition
+        self.issues = issues
+
+    @property
+    def severity(self):
+        return _worst(self.issues)
+
+    @property
+    def label(self):
+        if not self.issues:
+            return "OK"
+        worst = max(self.issues, key=lambda issue: SEVERITIES.index(issue.severity))
+        return LABELS[worst.code]
+
+    def to_dict(self):
+        partition = self.partition
+        return {"number": partition.number, "offset": partition.offset,
+                "size": partition.size, "severity": self.severity,
+                "issues": [issue.to_dict() for issue in self.issues]}
+
+
+class DiskHealth:
+    """Health of one disk and each of its partitions."""
+
+    def __init__(self, disk, physical_sector_size, partitions, issues,
+                 free_bytes=None, free_areas=None, largest_free=None, slack_bytes=None):
+        self.disk = disk
+        self.physical_sector_size = physical_sector_size
+        self.partitions = partitions
+        self.issues = issues
+        self.free_bytes = free_bytes
+        self.free_areas = free_areas
+        self.largest_free = largest_free
+        self.slack_bytes = slack_bytes
+
+    @property
+    def severity(self):
+        return _worst(self.issues + [issue for health in self.partitions
+                                     for issue in health.issues])
+
+    def to_dict(self):
+        disk = self.disk
+        return {"disk": disk.index, "device_id": disk.device_id, "style": disk.style,
+                "size": disk.size, "logical_sector_size": disk.bytes_per_sector,
+                "physical_sector_size": self.physical_sector_size,
+                "severity": self.severity,
+                "free_bytes": self.free_bytes, "free_areas": self.free_areas,
+                "largest_free": self.largest_free, "slack_bytes": self.slack_bytes,
+                "issues": [issue.to_dict() for issue in self.issues],
+                "partitions": [health.to_dict() for health in self.partitions]}
+
+
+def check_partition(partition, physical_sector_size=PHYSICAL_SECTOR):
+    offset, size = partition.offset, partition.size
+    if offset is None or size is None:
+        return PartitionHealth(partition, [Issue(INFO, "unknown",
+                                                 "Offset or size not reported")])
+    issues = []
+    if offset % physical_sector_size:
+        issues.append(Issue(ERROR, "misaligned",
+                            f"Starts at byte {offset}, which is not a multiple of the "
+                            f"{physical_sector_size} byte physical sector"))
+    elif offset % ALIGNMENT:
+        issues.append(Issue(WARNING, "not_1mb_aligned",
+                            f"Starts at {offset / MB:.3f} MB, not on a 1 MB boundary"))
+    if size % physical_sector_size:
+        issues.append(Issue(INFO, "partial_sector",
+                            f"Length {size} is not a whole number of "
+                            f"{physical_sector_size} byte sectors"))
+    return PartitionHealth(partition, issues)
+
+
+def check_disk(disk, physical_sector_size=None):
+    """Return the DiskHealth of a topology.DiskNode."""
+    physical = max(disk.bytes_per_sector or 512, physical_sector_size or PHYSICAL_SECTOR)
+    partitions = [check_partition(partition, physical) for partition in disk.partitions]
+    extents = ExtentIndex.from_disk(disk)
+    if extents is None:
+        return DiskHealth(disk, physical, partitions, [])
+
+    issues = []
+    areas = [length for length in extents.free if length >= MIN_FREE_AREA]
+    free_bytes = sum(areas)
+    largest = max(areas, default=0)
+    if len(areas) > 1:
+        issues.append(Issue(WARNING, "fragmented",
+                            f"Free space is split over {len(areas)} areas; the largest "
+                            f"is {largest // MB} MB of {free_bytes // MB} MB"))
+    # Gaps before and between partitions as they are, against what is
+    # usable of them once aligned. The end of the disk is rarely on a 1 MB
+    # boundary, so the area after the last partition is left out.
+    gaps = 0
+    previous = extents.start
+    for offset, end in zip(extents.offsets, extents.ends):
+        gaps += max(0, offset - previous)
+        previous = max(previous, end)
+    slack = max(0, gaps - sum(extents.free[:-1]))
+    if slack:
+        issues.append(Issue(INFO, "slack",
+                            f"{_size(slack)} between partitions is too small or "
+                            f"misaligned to use"))
+    return DiskHealth(disk, physical, partitions, issues, free_bytes, len(areas),
+                      largest, slack)
+
+
+def _size(size):
+    return f"{size / MB:.2f} MB" if size >= MB else f"{size / 1024:.1f} KB"
+
+
+class FleetReport:
+    """Health of many disks, with images that could not be read in ``errors``."""
+
+    def __init__(self, disks, errors=()):
+        self.disks = list(disks)
+        self.errors = list(errors)
+
+    def summary(self):
+        partitions = [health for disk in self.disks for health in disk.partitions]
+        codes = [issue.code for health in partitions for issue in health.issues]
+        return {
+            "disks": len(self.disks),
+            "partitions": len(partitions),
+            "misaligned": codes.count("misaligned"),
+            "not_1mb_aligned": codes.count("not_1mb_aligned"),
+            "partial_sector": codes.count("partial_sector"),
+            "fragmented_disks": sum(any(issue.code == "fragmented" for issue in disk.issues)
+                                    for disk in self.disks),
+            "slack_bytes": sum(disk.slack_bytes or 0 for disk in self.disks),
+            "unreadable": len(self.errors),
+        }
+
+    def to_dict(self):
+        return {"summary": self.summary(),
+                "disks": [disk.to_dict() for disk in self.disks],
+                "errors": [{"path": path, "error": error} for path, error in self.errors]}
+
+    def format_text(self):
+        summary = self.summary()
+        lines = [f"{summary['disks']} disks, {summary['partitions']} partitions: "
+                 f"{summary['misaligned']} misaligned, "
+                 f"{summary['not_1mb_aligned']} not 1 MB aligned, "
+                 f"{summary['fragmented_disks']} disks with fragmented free space", ""]
+        for health in self.disks:
+            disk = health.disk
+            lines.append(f"Disk {disk.index} ({disk.device_id}, {disk.style or 'unknown'}, "
+                         f"{disk.bytes_per_sector or '?'}/{health.physical_sector_size} "
+                         f"byte sectors): {health.severity.upper()}")
+            lines.extend(f"  {issue.message}" for issue in health.issues)
+            for partition in health.partitions:
+                for issue in partition.issues:
+                    lines.append(f"  Partition {partition.partition.number}: {issue.message}")
+        for path, error in self.errors:
+            lines.append(f"{path}: {error}")
+        return "\n".join(lines)
+
+
+def check_topology(topology, physical_sector_sizes=None):
+    """FleetReport for every disk of a topology.Topology (or DiskNodes).
+
+    ``physical_sector_sizes`` maps disk index to a known physical sector size.
+    """
+    sizes = physical_sector_sizes or {}
+    return FleetReport(check_disk(disk, sizes.get(disk.index)) for disk in topology)
+
+
+def check_images(directory, patterns=("*",), workers=None, physical_sector_size=None):
+    """FleetReport for the disk images in ``directory``, read in parallel."""
+    # partition_table pulls in mmap and the process pool; only load it here
+    import partition_table
+    disks, errors = [], []
+    results = partition_table.scan_images(directory, patterns, workers)
+    for number, (path, layout, error) in enumerate(results):
+        if layout is None:
+            errors.append((path, error))
+        else:
+            # Every image is read as disk 0; number them in directory order
+            layout.disk.index = number
+            disks.append(check_disk(layout.disk, physical_sector_size))
+    return FleetReport(disks, errors)
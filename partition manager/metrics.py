@@ -0,0 +1,276 @@
+"""Timers, histograms and a slow-operation log for the hot paths.
+
+    with metrics.timer("wmi.query.Win32_DiskDrive"):
+        ...
+
+Instrumentation is off unless enable() is called or the
+PARTITION_MANAGER_METRICS environment variable is set; while it is off,
+timer() returns a shared no-op context manager, so instrumented code pays
+for one function call. Durations go into per-operation histograms with
+fixed buckets. Operations slower than their threshold are also kept in a
+slow-operation log (and appended to a JSON-lines file if one is set).
+Everything can be exported as JSON or as a Prometheus textfile for the
+node exporter's textfile collector.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Seconds after which an operation is logged as slow, by name prefix; the
+# longest matching prefix wins
+SLOW_THRESHOLDS = {
+    "": 1.0,
+    "diskpart.": 10.0,
+    "wmi.": 2.0,
+    "parse.": 0.25,
+    "treeview.": 0.1,
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for position, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = BUCKETS[position - 1] if position else 0.0
+                high = BUCKETS[position] if position < len(BUCKETS) else self.max
+                low, high = max(low, self.min), min(high, self.max)
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], self.counts)),
+        }
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def stop(self):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "started")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def stop(self):
+        self.registry.observe(self.name, time.perf_counter() - self.started)
+
+
+class Registry:
+    def __init__(self, enabled=False, slow_log_path=None, slow_log_size=200):
+        self.enabled = enabled
+        self.slow_log_path = slow_log_path
+        self.thresholds = dict(SLOW_THRESHOLDS)
+        self.histograms = {}
+        self.slow = deque(maxlen=slow_log_size)
+        self._threshold_cache = {}
+        self._lock = threading.Lock()
+
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def threshold(self, name):
+        threshold = self._threshold_cache.get(name)
+        if threshold is None:
+            prefix = max((p for p in self.thresholds if name.startswith(p)), key=len)
+            threshold = self._threshold_cache[name] = self.thresholds[prefix]
+        return threshold
+
+    def set_threshold(self, prefix, seconds):
+        self.thresholds[prefix] = seconds
+        self._threshold_cache.clear()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+        if seconds >= self.threshold(name):
+            self._log_slow(name, seconds)
+
+    def _log_slow(self, name, seconds):
+        entry = {"time": time.time(), "operation": name, "seconds": round(seconds, 6),
+                 "thread": threading.current_thread().name}
+        self.slow.append(entry)
+        if self.slow_log_path:
+            try:
+                with open(self.slow_log_path, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError:
+                pass
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.slow.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {name: histogram.to_dict()
+                    for name, histogram in sorted(self.histograms.items())}
+
+    def to_json(self):
+        return json.dumps({"time": time.time(), "operations": self.snapshot(),
+                           "slow": list(self.slow)}, indent=2)
+
+    def to_prometheus(self):
+        lines = ["# HELP partition_manager_operation_seconds Duration of disk "
+                 "management operations.",
+                 "# TYPE partition_manager_operation_seconds histogram"]
+        for name, data in self.snapshot().items():
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            cumulative = 0
+            for bound, count in data["buckets"].items():
+                cumulative += count
+                lines.append(f'partition_manager_operation_seconds_bucket'
+                             f'{{operation="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'partition_manager_operation_seconds_sum'
+                         f'{{operation="{label}"}} {data["sum"]:.6f}')
+            lines.append(f'partition_manager_operation_seconds_count'
+                         f'{{operation="{label}"}} {data["count"]}')
+        lines.append("# HELP partition_manager_slow_operations Slow operations in the log.")
+        lines.append("# TYPE partition_manager_slow_operations gauge")
+        lines.append(f"partition_manager_slow_operations {len(self.slow)}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory):
+        """Write metrics.json and partition_manager.prom into ``directory``.
+
+        Files are replaced atomically, so the textfile collector never reads
+        a half-written file.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, text in (("metrics.json", self.to_json()),
+                           ("partition_manager.prom", self.to_prometheus())):
+            path = os.path.join(directory, name)
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(text)
+            os.replace(tmp, path)
+
+
+class Exporter:
+    """Export a registry to a directory every ``interval`` seconds."""
+
+    def __init__(self, registry, directory, interval=15):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="pm-metrics-export")
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._export()
+
+    def _export(self):
+        try:
+            self.registry.export(self.directory)
+        except OSError as e:
+            print(f"Could not export metrics: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._export()
+
+
+REGISTRY = Registry(enabled=bool(os.environ.get("PARTITION_MANAGER_METRICS")),
+                    slow_log_path=os.environ.get("PARTITION_MANAGER_SLOW_LOG"))
+
+
+def timer(name):
+    """Context manager timing ``name`` in the global registry."""
+    if not REGISTRY.enabled:
+        return _NULL_TIMER
+    return _Timer(REGISTRY, name)
+
+
+def start(name):
+    """Start timing ``name``; call stop() on the result when it is done.
+
+    For spans that do not fit a with block, such as a generator's lifetime.
+    """
+    if not REGISTRY.enabled:
+        return _NULL_TIMER
+    return _Timer(REGISTRY, name).__enter__()
+
+
+def enable(enabled=True):
+    REGISTRY.enabled = enabled
+
+
+def default_export_dir():
+    directory = os.environ.get("PARTITION_MANAGER_METRICS_DIR")
+    if directory:
+        return directory
+    base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    return os.path.join(base, "Windows Partition Manager", "metrics")
@@ -0,0 +1,210 @@
+import os
+import tempfile
+
+from diskpart_session import DiskpartSession
+from diskpart_batch import OperationBatch
+import diskpart_parser
+import metrics
+from progress import DiskpartStream
+
+
+class PartitionManager:
+    def __init__(self, persistent=False, diskpart_cmd=None):
+        self.diskpart_cmd = list(diskpart_cmd or ["diskpart"])
+        # With persistent=True one diskpart process is kept open and reused
+        # for every command instead of starting a new one per call.
+        self.session = DiskpartSession(self.diskpart_cmd) if persistent else None
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+    def run_diskpart_command(self, commands, on_progress=None):
+        """Run ``commands`` and return their output.
+
+        ``on_progress`` is called with a progress.ProgressEvent whenever
+        diskpart reports progress, while the commands are still running.
+        """
+        if self.session is not None:
+            try:
+                output = "\n".join(self.session.execute(commands, on_progress))
+                print(output)
+                return output
+            except Exception as e:
+                print(f"Error executing diskpart: {e}")
+                return None
+
+        # Write commands to a temporary script file of our own, so calls
+        # running at the same time never overwrite each other's script
+        fd, script = tempfile.mkstemp(prefix="diskpart_", suffix=".txt")
+        with os.fdopen(fd, "w") as f:
+            for cmd in commands:
+                f.write(cmd + "\n")
+        
+        # Run diskpart with the script, reading its output as it comes
+        try:
+            stream = DiskpartStream(self.diskpart_cmd + ["/s", script],
+                                    command="; ".join(commands))
+            for event in stream:
+                if on_progress is not None:
+                    on_progress(event)
+            print(stream.output)
+            return stream.output
+        except Exception as e:
+            print(f"Error executing diskpart: {e}")
+        finally:
+            # Clean up temporary script file
+            if os.path.exists(script):
+                os.remove(script)
+
+    def run_diskpart_script(self, commands):
+        """Run ``commands`` in one diskpart process and return each one's output."""
+        if self.session is not None:
+            return self.session.execute(commands)
+        with DiskpartSession(self.diskpart_cmd) as session:
+            return session.execute(commands)
+
+    def batch(self):
+        """Return an OperationBatch that queues operations for a single run."""
+        return OperationBatch(self)
+
+    def list_disks(self):
+        commands = ["list disk"]
+        return self.run_diskpart_command(commands)
+
+    def list_partitions(self, disk_number):
+        commands = [
+            f"select disk {disk_number}",
+            "list partition"
+        ]
+        return self.run_diskpart_command(commands)
+
+    def list_volumes(self):
+        return self.run_diskpart_command(["list volume"])
+
+    # Parsed variants of the commands above, returning records instead of text
+
+    def _parse(self, parser, output):
+        with metrics.timer(f"parse.{parser.__name__[len('parse_'):]}"):
+            return parser(output or "")
+
+    def disk_records(self):
+        return self._parse(diskpart_parser.parse_disks, self.list_disks())
+
+    def partition_records(self, disk_number):
+        return self._parse(diskpart_parser.parse_partitions,
+                           self.list_partitions(disk_number))
+
+    def volume_records(self):
+        return self._parse(diskpart_parser.parse_volumes, self.list_volumes())
+
+    def disk_detail(self, disk_number):
+        return self._parse(diskpart_parser.parse_disk_detail,
+                           self.get_disk_details(disk_number))
+
+    def partition_detail(self, disk_number, partition_number):
+        return self._parse(diskpart_parser.parse_partition_detail,
+                           self.get_partition_details(disk_number, partition_number))
+
+    def partition_number(self, disk_number, offset):
+        """Return diskpart's number for the partition starting at byte ``offset``.
+
+        WMI does not list the Microsoft Reserved partition, so its indexes
+        are not diskpart's numbers. ``list partition`` rounds offsets, so
+        the closest rows are confirmed with ``detail partition``. Raises
+        ValueError unless one of them starts exactly at ``offset``.
+        """
+        if offset is None:
+            raise ValueError("The partition's starting offset is unknown")
+        # Shown offsets are rounded to the nearest unit, up or down
+        candidates = sorted((record for record in self.partition_records(disk_number)
+                             if abs(offset - record.offset)
+                             <= diskpart_parser.size_precision(record.offset) // 2),
+                            key=lambda record: abs(offset - record.offset))
+        if candidates:
+            commands = [f"select disk {disk_number}"]
+            for record in candidates:
+                commands += [f"select partition {record.number}", "detail partition"]
+            outputs = self.run_diskpart_script(commands)
+            for record, output in zip(candidates, outputs[2::2]):
+                if diskpart_parser.parse_partition_detail(output).offset == offset:
+                    return record.number
+        raise ValueError(f"No partition on disk {disk_number} starts at byte {offset}; "
+                         f"refresh the disk list and try again")
+
+    def probe_layout(self, disk):
+        """Read a disk's partition table directly, without starting diskpart.
+
+        ``disk`` is a disk number or the path of an image file. Returns a
+        partition_table.RawLayout; needs administrator rights for disks.
+        """
+        import partition_table
+        if isinstance(disk, int) or str(disk).isdigit():
+            return partition_table.read_layout(partition_table.physical_drive_path(disk),
+                                               index=int(disk))
+        return partition_table.read_layout(disk)
+
+    def create_partition(self, disk_number, size_mb):
+        commands = [
+            f"select disk {disk_number}",
+            f"create partition primary size={size_mb}"
+        ]
+        return self.run_diskpart_command(commands)
+
+    def delete_partition(self, disk_number, partition_number):
+        commands = [
+            f"select disk {disk_number}",
+            f"select partition {partition_number}",
+            "delete partition"
+        ]
+        return self.run_diskpart_command(commands)
+
+    def extend_partition(self, disk_number, partition_number, on_progress=None):
+        commands = [
+            f"select disk {disk_number}",
+            f"select partition {partition_number}",
+            "extend"
+        ]
+        return self.run_diskpart_command(commands, on_progress)
+
+    def extend_partition_with_size(self, disk_number, partition_number, size_mb,
+                                   on_progress=None):
+        commands = [
+            f"select disk {disk_number}",
+            f"select partition {partition_number}",
+            f"extend size={size_mb}"
+        ]
+        return self.run_diskpart_command(commands, on_progress)
+
+    def get_disk_details(self, disk_number):
+        commands = [
+            f"select disk {disk_number}",
+            "detail disk"
+        ]
+        return self.run_diskpart_command(commands)
+
+    def get_partition_details(self, disk_number, partition_number):
+        commands = [
+            f"select disk {disk_number}",
+            f"select partition {partition_number}",
+            "detail partition"
+        ]
+        return self.run_diskpart_command(commands)
+
+    def shrink_partition(self, disk_number, partition_number, size_mb, on_progress=None):
+        commands = [
+            f"select disk {disk_number}",
+            f"select partition {partition_number}",
+            f"shrink desired={size_mb}"
+        ]
+        return self.run_diskpart_command(commands, on_progress)
+
+    def convert_disk(self, disk_number, type_to, on_progress=None):
+        """Convert disk between MBR and GPT"""
+        if type_to not in ['gpt', 'mbr']:
+            raise ValueError("Type must be 'gpt' or 'mbr'")
+        commands = [
+            f"select disk {disk_number}",
+            f"convert {type_to}"
+        ]
+        return self.run_diskpart_command(commands, on_progress)
@@ -1,120 +1,39 @@
-import subprocess
-import sys
+import functools
 import os
+import sys
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox
-import wmi
-import win32api
-import win32file
-from threading import Thread
-import ctypes
-
-class PartitionManager:
-    def __init__(self):
-        self.diskpart_script = "diskpart_commands.txt"
-
-    def run_diskpart_command(self, commands):
-        # Write commands to temporary script file
-        with open(self.diskpart_script, "w") as f:
-            for cmd in commands:
-                f.write(cmd + "\n")
-        
-        # Run diskpart with the script
-        try:
-            result = subprocess.run(["diskpart", "/s", self.diskpart_script], 
-                                  capture_output=True, 
-                                  text=True)
-            print(result.stdout)
-            return result.stdout
-        except Exception as e:
-            print(f"Error executing diskpart: {e}")
-        finally:
-            # Clean up temporary script file
-            if os.path.exists(self.diskpart_script):
-                os.remove(self.diskpart_script)
-
-    def list_disks(self):
-        commands = ["list disk"]
-        return self.run_diskpart_command(commands)
-
-    def list_partitions(self, disk_number):
-        commands = [
-            f"select disk {disk_number}",
-            "list partition"
-        ]
-        return self.run_diskpart_command(commands)
-
-    def create_partition(self, disk_number, size_mb):
-        commands = [
-            f"select disk {disk_number}",
-            f"create partition primary size={size_mb}"
-        ]
-        return self.run_diskpart_command(commands)
-
-    def delete_partition(self, disk_number, partition_number):
-        commands = [
-            f"select disk {disk_number}",
-            f"select partition {partition_number}",
-            "delete partition"
-        ]
-        return self.run_diskpart_command(commands)
-
-    def extend_partition(self, disk_number, partition_number):
-        commands = [
-            f"select disk {disk_number}",
-            f"select partition {partition_number}",
-            "extend"
-        ]
-        return self.run_diskpart_command(commands)
-
-    def extend_partition_with_size(self, disk_number, partition_number, size_mb):
-        commands = [
-            f"select disk {disk_number}",
-            f"select partition {partition_number}",
-            f"extend size={size_mb}"
-        ]
-        return self.run_diskpart_command(commands)
-
-    def get_disk_details(self, disk_number):
-        commands = [
-            f"select disk {disk_number}",
-            "detail disk"
-        ]
-        return self.run_diskpart_command(commands)
-
-    def get_partition_details(self, disk_number, partition_number):
-        commands = [
-            f"select disk {disk_number}",
-            f"select partition {partition_number}",
-            "detail partition"
-        ]
-        return self.run_diskpart_command(commands)
-
-    def shrink_partition(self, disk_number, partition_number, size_mb):
-        commands = [
-            f"select disk {disk_number}",
-            f"select partition {partition_number}",
-            f"shrink desired={size_mb}"
-        ]
-        return self.run_diskpart_command(commands)
-
-    def convert_disk(self, disk_number, type_to):
-        """Convert disk between MBR and GPT"""
-        if type_to not in ['gpt', 'mbr']:
-            raise ValueError("Type must be 'gpt' or 'mbr'")
-        commands = [
-            f"select disk {disk_number}",
-            f"convert {type_to}"
-        ]
-        return self.run_diskpart_command(commands)
+from partition_core import PartitionManager
+from topology import TopologyLoader, WmiBackend
+from topology_cache import TopologyCache, default_cache_path
+from dispatcher import TkDispatcher
+from jobs import BACKGROUND
+from tree_sync import TreeRows
+import extents
+from progress import format_eta
+import changes
+import io_probe
+import layout_health
+import metrics
+import usage
 
 class PartitionManagerGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Windows Partition Manager - by Kamrul Mollah")
         self.root.geometry("800x600")
-        self.wmi = wmi.WMI()
-        self.pm = PartitionManager()
+        # Layout is read through a cache: clicking between disks costs no
+        # queries, and an operation only re-reads the disk it changed
+        self.topology_cache = TopologyCache(TopologyLoader(WmiBackend()), ttl=30,
+                                            path=default_cache_path())
+        # Directory totals from earlier usage scans, loaded on first use
+        self.usage_cache = usage.UsageCache(usage.default_cache_path())
+        self.pm = PartitionManager(persistent=True)
+        # All WMI and diskpart calls run on worker threads; results come
+        # back to the Tk thread through the dispatcher
+        self.dispatcher = TkDispatcher(self.root, on_busy=self._set_busy)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Create main frame
         self.main_frame = ttk.Frame(self.root, padding="10")
@@ -135,8 +54,54 @@ class PartitionManagerGUI:
         # Add developer info
         self.create_developer_info()
         
-        # Initialize displays
-        self.refresh_disk_list()
+        # Add status bar
+        self.create_status_bar()
+        
+        # Initialize displays with the last known layout, if any, and
+        # revalidate it in the background
+        saved = self.topology_cache.load_saved()
+        if saved is not None:
+            self.show_topology(saved)
+            self._revalidate_topology()
+        else:
+            self.refresh_disk_list()
+        
+        # Re-read disks when they change, whether through this app, another
+        # tool or hot-plugging, instead of polling
+        self.local_changes = changes.ManualSource()
+        sources = [self.local_changes, changes.WmiEventSource()]
+        events_file = os.environ.get("PARTITION_MANAGER_EVENTS_FILE")
+        if events_file:
+            sources.append(changes.FileEventSource(events_file))
+        self.change_watcher = changes.ChangeWatcher(
+            sources, lambda change_set: self.dispatcher.post(self.apply_changes, change_set))
+        self.change_watcher.start()
+        
+        # With PARTITION_MANAGER_METRICS_DIR set, timings are exported there
+        # for the Prometheus node exporter's textfile collector
+        self.metrics_exporter = None
+        if os.environ.get("PARTITION_MANAGER_METRICS_DIR"):
+            metrics.enable()
+            self.metrics_exporter = metrics.Exporter(metrics.REGISTRY,
+                                                     metrics.default_export_dir())
+            self.metrics_exporter.start()
+
+    def on_close(self):
+        self.change_watcher.stop()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+        self.dispatcher.shutdown()
+        self.pm.close()
+        self.root.destroy()
+
+    def create_status_bar(self):
+        self.status_var = tk.StringVar(value="Ready")
+        ttk.Label(self.main_frame, textvariable=self.status_var,
+                  font=('Arial', 9)).grid(row=4, column=0, columnspan=2, sticky=tk.W)
+
+    def _set_busy(self, busy):
+        self.status_var.set("Working..." if busy else "Ready")
+        self.root.configure(cursor="watch" if busy else "")
 
     def create_disk_view(self):
         # Disk list frame
@@ -154,8 +119,9 @@ class PartitionManagerGUI:
         disk_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
         self.disk_tree.configure(yscrollcommand=disk_scroll.set)
         
-        # Bind selection event
-        self.disk_tree.bind("<<TreeviewSelect>>", self.on_disk_select)
+        # Rows are diffed against the last topology instead of being rebuilt;
+        # TreeRows records the selection before calling on_disk_select
+        self.disk_rows = TreeRows(self.disk_tree, disk_scroll, on_select=self.on_disk_select)
 
     def create_partition_view(self):
         # Partition list frame
@@ -164,18 +130,24 @@ class PartitionManagerGUI:
         
         # Partition Treeview
         self.part_tree = ttk.Treeview(part_frame, 
-                                     columns=("Size", "Free", "FS", "Letter"),
+                                     columns=("Size", "Free", "FS", "Letter", "Health"),
                                      show="headings")
         self.part_tree.heading("Size", text="Size (GB)")
         self.part_tree.heading("Free", text="Free (GB)")
         self.part_tree.heading("FS", text="File System")
         self.part_tree.heading("Letter", text="Drive Letter")
+        self.part_tree.heading("Health", text="Health")
         self.part_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         # Scrollbar for partition list
         part_scroll = ttk.Scrollbar(part_frame, orient=tk.VERTICAL, command=self.part_tree.yview)
         part_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
         self.part_tree.configure(yscrollcommand=part_scroll.set)
+        
+        # Rows are keyed by partition offset, which survives renumbering
+        self.part_rows = TreeRows(self.part_tree, part_scroll)
+        self._partitions = {}
+        self._partitions_disk = None
 
     def create_buttons(self):
         btn_frame = ttk.Frame(self.main_frame, padding="5")
@@ -189,72 +161,245 @@ class PartitionManagerGUI:
         ttk.Button(btn_frame, text="Advanced Options", command=self.create_advanced_menu).pack(side=tk.LEFT, padx=5)
 
     def refresh_disk_list(self):
-        # Clear existing items
-        self.disk_tree.delete(*self.disk_tree.get_children())
-        self.part_tree.delete(*self.part_tree.get_children())
-        
-        # Get physical disks
-        for disk in self.wmi.Win32_DiskDrive():
-            try:
-                size_gb = round(int(disk.Size) / (1024**3), 2) if disk.Size else 0
-                self.disk_tree.insert("", tk.END, 
-                                    values=(size_gb, disk.InterfaceType or "Unknown"),
-                                    iid=disk.Index)
-            except (ValueError, TypeError, AttributeError):
-                # Handle case where disk size or other attributes are not available
-                self.disk_tree.insert("", tk.END, 
-                                    values=("Unknown", disk.InterfaceType or "Unknown"),
-                                    iid=disk.Index)
+        def failed(e):
+            messagebox.showerror("Error", f"Failed to get disk information: {str(e)}")
+        self.dispatcher.submit(self.topology_cache.get, on_done=self.show_topology,
+                               on_error=failed, key="topology", name="Refresh disks")
+
+    def _revalidate_topology(self):
+        # Keep showing the saved layout on failure; Refresh will report the error
+        self.dispatcher.submit(self.topology_cache.refresh, on_done=self.show_topology,
+                               key="topology", priority=BACKGROUND,
+                               name="Revalidate saved layout")
+
+    def show_topology(self, topology):
+        self.disk_rows.set_rows((disk.index, self._disk_values(disk)) for disk in topology)
+        
+        # Keep the partitions of the selected disk, if it is still there
+        selection = self.disk_rows.selection()
+        disk = topology.disk(selection[0]) if selection else None
+        if disk is not None:
+            self.show_partitions(disk)
+        else:
+            self._partitions_disk = None
+            self.part_rows.clear()
+
+    def _disk_values(self, disk):
+        size_gb = round(disk.size / (1024**3), 2) if disk.size else "Unknown"
+        return (size_gb, disk.interface or "Unknown")
+
+    def refresh_disk(self, disk_index):
+        """Re-read one disk after it changed and update its rows."""
+        def failed(e):
+            messagebox.showerror("Error", f"Failed to get disk information: {str(e)}")
+        self.dispatcher.submit(self.topology_cache.disk, disk_index,
+                               on_done=lambda disk: self._update_disk(disk_index, disk),
+                               on_error=failed, key=f"disk-{disk_index}", disk=disk_index,
+                               priority=BACKGROUND, name="Re-read disk")
+
+    def _update_disk(self, disk_index, disk):
+        if disk is None:
+            self.disk_rows.remove_row(disk_index)
+            return
+        self.disk_rows.update_row(disk_index, self._disk_values(disk))
+        if str(disk_index) in self.disk_rows.selection():
+            self.show_partitions(disk)
+
+    def apply_changes(self, change_set):
+        """Re-read only the disks a batch of change events touched."""
+        topology = self.topology_cache.topology
+        disks = set(change_set.disks)
+        full = change_set.full or topology is None
+        for volume in change_set.volumes:
+            disk = self._disk_of_volume(topology, volume) if topology else None
+            if disk is None:
+                full = True
+            else:
+                disks.add(disk)
+        if full:
+            self.topology_cache.invalidate()
+            self.refresh_disk_list()
+            return
+        for disk in disks:
+            self.topology_cache.invalidate_disk(disk)
+            self.refresh_disk(disk)
+
+    def _disk_of_volume(self, topology, volume):
+        for disk in topology:
+            for partition in disk.partitions:
+                if any(v.device_id == volume for v in partition.volumes):
+                    return disk.index
+        return None
 
     def on_disk_select(self, event):
-        selection = self.disk_tree.selection()
+        selection = self.disk_rows.selection()
         if not selection:
             return
             
         disk_index = selection[0]
+        if self._partitions_disk == int(disk_index):
+            # Already shown; the windowed disk list re-selects rows as it scrolls
+            return
         self.refresh_partition_list(disk_index)
 
     def refresh_partition_list(self, disk_index):
-        self.part_tree.delete(*self.part_tree.get_children())
-        
-        try:
-            # Get partitions for selected disk
-            disk = self.wmi.Win32_DiskDrive(Index=int(disk_index))[0]
-            for partition in disk.associators("Win32_DiskDriveToDiskPartition"):
-                for logical_disk in partition.associators("Win32_LogicalDiskToPartition"):
-                    try:
-                        size_gb = round(int(logical_disk.Size) / (1024**3), 2) if logical_disk.Size else 0
-                        free_gb = round(int(logical_disk.FreeSpace) / (1024**3), 2) if logical_disk.FreeSpace else 0
-                        self.part_tree.insert("", tk.END,
-                                            values=(size_gb, free_gb,
-                                                   logical_disk.FileSystem or "Unknown",
-                                                   logical_disk.DeviceID or "None"))
-                    except (ValueError, TypeError, AttributeError):
-                        self.part_tree.insert("", tk.END,
-                                            values=("Unknown", "Unknown",
-                                                   "Unknown",
-                                                   logical_disk.DeviceID or "None"))
-        except Exception as e:
+        def failed(e):
             messagebox.showerror("Error", f"Failed to get partition information: {str(e)}")
+        # Clicking quickly through disks supersedes the earlier requests
+        self.dispatcher.submit(self.topology_cache.disk, disk_index,
+                               on_done=self.show_partitions, on_error=failed,
+                               key="partitions", disk=disk_index, name="List partitions")
+
+    def show_partitions(self, disk):
+        if disk is None or disk.index != self._partitions_disk:
+            # Offsets repeat across disks; never carry a selection over
+            self.part_rows.clear()
+        if disk is None:
+            self._partitions_disk = None
+            return
+        self._partitions_disk = disk.index
+        self._partitions = {}
+        rows = []
+        health = layout_health.check_disk(disk)
+        for partition, partition_health in zip(disk.partitions, health.partitions):
+            if partition.volumes:
+                volume = partition.volumes[0]
+                size = volume.size if volume.size is not None else partition.size
+                size_gb = round(size / (1024**3), 2) if size is not None else "Unknown"
+                free_gb = round(volume.free / (1024**3), 2) if volume.free is not None else "Unknown"
+                values = (size_gb, free_gb, volume.filesystem or "Unknown", volume.device_id or "None")
+            else:
+                size_gb = round(partition.size / (1024**3), 2) if partition.size is not None else "Unknown"
+                values = (size_gb, "Unknown", "Unknown", "None")
+            values += (partition_health.label,)
+            iid = str(partition.offset if partition.offset is not None else partition.device_id)
+            self._partitions[iid] = partition
+            rows.append((iid, values))
+        self.part_rows.set_rows(rows)
+
+    def _selected_partition(self):
+        """Return the starting offset of the selected partition row.
+
+        Operations take the offset and look up diskpart's partition number
+        for it on the worker, right before they run.
+        """
+        selection = self.part_rows.selection()
+        partition = self._partitions.get(selection[0]) if selection else None
+        return partition.offset if partition is not None else None
+
+    def _at_offset(self, func):
+        """Wrap ``func(disk, partition_number, ...)`` to take the partition's offset."""
+        @functools.wraps(func)
+        def run(disk_index, offset, *args, **kwargs):
+            return func(disk_index, self.pm.partition_number(disk_index, offset),
+                        *args, **kwargs)
+        return run
+
+    def _selected_extents(self):
+        """ExtentIndex of the selected disk from the cached topology, or None."""
+        topology = self.topology_cache.topology
+        selection = self.disk_rows.selection()
+        if topology is None or not selection:
+            return None
+        return extents.ExtentIndex.from_disk(topology.disk(selection[0]))
+
+    def _range_text(self, limit):
+        if limit is None:
+            return "Valid range: unknown until the disk list is loaded"
+        if limit == 0:
+            return "No space available for this operation"
+        return f"Valid range: 1 - {limit} MB"
+
+    def _run_operation(self, disk_index, func, args, success=None, failure=None,
+                       progress_title=None):
+        """Run a disk operation on a worker and re-read the disk when it is done.
+
+        With ``progress_title`` a window shows diskpart's progress live.
+        """
+        name = func.__name__.replace("_", " ").capitalize()
+        window = None
+        if progress_title:
+            window, on_progress = self._progress_window(progress_title)
+            func = functools.partial(func, on_progress=on_progress)
+
+        def close_progress():
+            if window is not None and window.winfo_exists():
+                window.destroy()
+
+        def done(result):
+            close_progress()
+            # Coalesced with the WMI events the operation causes
+            self.local_changes.fire(changes.DISK_CHANGED, disk_index)
+            if success:
+                messagebox.showinfo("Success", success)
+
+        def failed(e):
+            close_progress()
+            messagebox.showerror("Error", f"{failure}: {str(e)}" if failure else str(e))
+
+        # Operations on one disk run one at a time, in the order requested
+        self.dispatcher.submit(func, *args, on_done=done, on_error=failed,
+                               disk=disk_index, mutates=True, name=name)
+
+    def _progress_window(self, title):
+        """Open a progress window; returns it and a thread-safe progress callback."""
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        window.geometry("380x130")
+        
+        phase = tk.StringVar(value="Waiting for diskpart...")
+        ttk.Label(window, textvariable=phase, wraplength=350).pack(pady=5)
+        # Indeterminate until diskpart reports a percentage
+        bar = ttk.Progressbar(window, length=340, mode="indeterminate", maximum=100)
+        bar.pack(pady=5)
+        bar.start(15)
+        eta = tk.StringVar(value="")
+        ttk.Label(window, textvariable=eta).pack()
+        
+        def update(event):
+            if not window.winfo_exists():
+                return
+            if event.phase:
+                phase.set(event.phase)
+            if event.percent is not None:
+                if str(bar.cget("mode")) != "determinate":
+                    bar.stop()
+                    bar.configure(mode="determinate")
+                bar["value"] = event.percent
+                text = f"{event.percent:.0f}% complete"
+                if event.eta is not None:
+                    text += f", about {format_eta(event.eta)} left"
+                eta.set(text)
+        
+        # Progress arrives on a worker thread; hand it to the Tk thread
+        return window, lambda event: self.dispatcher.post(update, event)
 
     def create_partition_dialog(self):
-        if not self.disk_tree.selection():
+        if not self.disk_rows.selection():
             messagebox.showwarning("Warning", "Please select a disk first")
             return
             
         dialog = tk.Toplevel(self.root)
         dialog.title("Create Partition")
-        dialog.geometry("300x150")
+        dialog.geometry("300x180")
         
         ttk.Label(dialog, text="Size (MB):").pack(pady=5)
         size_entry = ttk.Entry(dialog)
         size_entry.pack(pady=5)
         
+        index = self._selected_extents()
+        ttk.Label(dialog, text=self._range_text(
+            index.max_create_mb() if index is not None else None)).pack()
+        
         def create():
             try:
-                disk_index = self.disk_tree.selection()[0]
+                disk_index = self.disk_rows.selection()[0]
                 size = size_entry.get()
-                Thread(target=self._create_partition, args=(disk_index, size)).start()
+                if index is not None:
+                    size = index.check_create(size)
+                else:
+                    size = extents.parse_size_mb(size)
+                self._create_partition(disk_index, size)
                 dialog.destroy()
             except Exception as e:
                 messagebox.showerror("Error", str(e))
@@ -262,39 +407,32 @@ class PartitionManagerGUI:
         ttk.Button(dialog, text="Create", command=create).pack(pady=10)
 
     def _create_partition(self, disk_index, size):
-        try:
-            self.pm.create_partition(disk_index, size)
-            self.root.after(1000, self.refresh_disk_list)
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self._run_operation(disk_index, self.pm.create_partition, (disk_index, size))
 
     def delete_partition_dialog(self):
-        if not self.disk_tree.selection():
+        if not self.disk_rows.selection():
             messagebox.showwarning("Warning", "Please select a disk first")
             return
             
-        if not self.part_tree.selection():
+        if not self.part_rows.selection():
             messagebox.showwarning("Warning", "Please select a partition first")
             return
             
         if messagebox.askyesno("Confirm", "Are you sure you want to delete this partition? This cannot be undone!"):
-            disk_index = self.disk_tree.selection()[0]
-            partition = self.part_tree.selection()[0]
-            Thread(target=self._delete_partition, args=(disk_index, partition)).start()
+            disk_index = self.disk_rows.selection()[0]
+            offset = self._selected_partition()
+            self._delete_partition(disk_index, offset)
 
-    def _delete_partition(self, disk_index, partition):
-        try:
-            self.pm.delete_partition(disk_index, partition)
-            self.root.after(1000, self.refresh_disk_list)
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+    def _delete_partition(self, disk_index, offset):
+        self._run_operation(disk_index, self._at_offset(self.pm.delete_partition),
+                            (disk_index, offset))
 
     def extend_partition_dialog(self):
-        if not self.disk_tree.selection():
+        if not self.disk_rows.selection():
             messagebox.showwarning("Warning", "Please select a disk first")
             return
             
-        if not self.part_tree.selection():
+        if not self.part_rows.selection():
             messagebox.showwarning("Warning", "Please select a partition first")
             return
             
@@ -308,6 +446,14 @@ class PartitionManagerGUI:
         size_entry = ttk.Entry(dialog)
         size_entry.pack(pady=5)
         
+        # Only contiguous unallocated space right after the partition counts
+        index = self._selected_extents()
+        partition = self._partitions.get(self.part_rows.selection()[0])
+        limit = None
+        if index is not None and partition is not None:
+            limit = index.max_extend_mb(partition.offset)
+        ttk.Label(dialog, text=self._range_text(limit)).pack()
+        
         # Add warning label
         warning_text = ("Warning: Make sure there is unallocated space available.\n"
                        "The space must be contiguous and after the partition.\n"
@@ -316,26 +462,26 @@ class PartitionManagerGUI:
         
         def extend():
             try:
-                disk_index = self.disk_tree.selection()[0]
-                partition_index = self.part_tree.selection()[0]
+                disk_index = self.disk_rows.selection()[0]
+                offset = self._selected_partition()
                 size_mb = size_entry.get()
-                if not size_mb.isdigit():
-                    raise ValueError("Size must be a positive number")
-                Thread(target=self._extend_partition_with_size, 
-                       args=(disk_index, partition_index, size_mb)).start()
+                if limit is not None:
+                    size_mb = index.check_extend(partition.offset, size_mb)
+                else:
+                    size_mb = extents.parse_size_mb(size_mb)
+                self._extend_partition_with_size(disk_index, offset, size_mb)
                 dialog.destroy()
             except Exception as e:
                 messagebox.showerror("Error", str(e))
         
         ttk.Button(dialog, text="Extend", command=extend).pack(pady=10)
 
-    def _extend_partition_with_size(self, disk_index, partition_index, size_mb):
-        try:
-            self.pm.extend_partition_with_size(disk_index, partition_index, size_mb)
-            self.root.after(1000, self.refresh_disk_list)
-            messagebox.showinfo("Success", "Partition extended successfully")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to extend partition: {str(e)}")
+    def _extend_partition_with_size(self, disk_index, offset, size_mb):
+        self._run_operation(disk_index, self._at_offset(self.pm.extend_partition_with_size),
+                            (disk_index, offset, size_mb),
+                            success="Partition extended successfully",
+                            failure="Failed to extend partition",
+                            progress_title="Extending Partition")
 
     def change_letter_dialog(self):
         # Implementation for drive letter change would go here
@@ -354,44 +500,260 @@ class PartitionManagerGUI:
                    command=self.shrink_partition_dialog).pack(side=tk.LEFT, padx=5)
         ttk.Button(advanced_frame, text="Convert Disk", 
                    command=self.convert_disk_dialog).pack(side=tk.LEFT, padx=5)
+        ttk.Button(advanced_frame, text="I/O Test", 
+                   command=self.io_test_dialog).pack(side=tk.LEFT, padx=5)
+        ttk.Button(advanced_frame, text="Layout Health", 
+                   command=self.show_layout_health).pack(side=tk.LEFT, padx=5)
+        ttk.Button(advanced_frame, text="Jobs", 
+                   command=self.show_jobs).pack(side=tk.LEFT, padx=5)
+        ttk.Button(advanced_frame, text="Performance", 
+                   command=self.show_performance).pack(side=tk.LEFT, padx=5)
+
+    def show_jobs(self):
+        """Window listing queued, running and finished jobs."""
+        window = tk.Toplevel(self.root)
+        window.title("Jobs")
+        window.geometry("600x300")
+        
+        columns = ("Job", "Disk", "State", "Waited", "Ran")
+        tree = ttk.Treeview(window, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=160 if col == "Job" else 90)
+        tree.pack(fill=tk.BOTH, expand=True)
+        rows = TreeRows(tree)
+        
+        def cancel():
+            jobs = {str(job.id): job for job in self.dispatcher.scheduler.jobs()}
+            for iid in rows.selection():
+                if iid in jobs:
+                    self.dispatcher.cancel_job(jobs[iid])
+        
+        ttk.Button(window, text="Cancel Selected", command=cancel).pack(pady=5)
+        
+        def update():
+            if not window.winfo_exists():
+                return
+            rows.set_rows((job.id, self._job_values(job))
+                          for job in reversed(self.dispatcher.scheduler.jobs()))
+            window.after(500, update)
+        update()
+
+    def _job_values(self, job):
+        run_time = f"{job.run_time:.1f}s" if job.run_time is not None else ""
+        return (job.name, "" if job.disk is None else job.disk, job.state,
+                f"{job.wait_time:.1f}s", run_time)
+
+    def show_performance(self):
+        """Window with live operation timings and the slow-operation log."""
+        window = tk.Toplevel(self.root)
+        window.title("Performance")
+        window.geometry("700x450")
+        
+        enabled = tk.BooleanVar(value=metrics.REGISTRY.enabled)
+        ttk.Checkbutton(window, text="Record timings", variable=enabled,
+                        command=lambda: metrics.enable(enabled.get())).pack(anchor=tk.W, padx=5)
+        
+        columns = ("Operation", "Count", "Mean", "p50", "p95", "Max")
+        tree = ttk.Treeview(window, columns=columns, show="headings", height=10)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=220 if col == "Operation" else 80)
+        tree.pack(fill=tk.BOTH, expand=True)
+        rows = TreeRows(tree)
+        
+        ttk.Label(window, text="Slow operations").pack(anchor=tk.W, padx=5)
+        slow_columns = ("Operation", "Took", "Thread")
+        slow_tree = ttk.Treeview(window, columns=slow_columns, show="headings", height=6)
+        for col in slow_columns:
+            slow_tree.heading(col, text=col)
+            slow_tree.column(col, width=220 if col == "Operation" else 120)
+        slow_tree.pack(fill=tk.BOTH, expand=True)
+        slow_rows = TreeRows(slow_tree)
+        
+        def export():
+            directory = metrics.default_export_dir()
+            try:
+                metrics.REGISTRY.export(directory)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not export metrics: {e}")
+                return
+            messagebox.showinfo("Info", f"Metrics written to {directory}")
+        
+        buttons = ttk.Frame(window)
+        buttons.pack(pady=5)
+        ttk.Button(buttons, text="Reset", command=metrics.REGISTRY.reset).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Export", command=export).pack(side=tk.LEFT, padx=5)
+        
+        def update():
+            if not window.winfo_exists():
+                return
+            rows.set_rows((name, self._metric_values(name, data))
+                          for name, data in metrics.REGISTRY.snapshot().items())
+            # Two entries can share a time and operation, so rows are keyed
+            # by their position in the log, newest shown first
+            slow = list(enumerate(metrics.REGISTRY.slow))
+            slow_rows.set_rows((str(position),
+                                (entry["operation"], _ms(entry["seconds"]), entry["thread"]))
+                               for position, entry in reversed(slow))
+            window.after(1000, update)
+        update()
+
+    def _metric_values(self, name, data):
+        return (name, data["count"], _ms(data["mean"]), _ms(data["p50"]),
+                _ms(data["p95"]), _ms(data["max"]))
 
     def show_disk_details(self):
-        if not self.disk_tree.selection():
+        if not self.disk_rows.selection():
             messagebox.showwarning("Warning", "Please select a disk first")
             return
         
-        disk_index = self.disk_tree.selection()[0]
-        details = self.pm.get_disk_details(disk_index)
-        
-        # Create details window
-        details_window = tk.Toplevel(self.root)
-        details_window.title(f"Disk {disk_index} Details")
-        details_window.geometry("600x400")
-        
-        # Add text widget with scrollbar
-        text_widget = tk.Text(details_window, wrap=tk.WORD)
-        scrollbar = ttk.Scrollbar(details_window, command=text_widget.yview)
-        text_widget.configure(yscrollcommand=scrollbar.set)
-        
-        text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        text_widget.insert(tk.END, details)
-        text_widget.configure(state='disabled')
+        disk_index = self.disk_rows.selection()[0]
+        text_widget = self._details_window(f"Disk {disk_index} Details")
+        self.dispatcher.submit(self.pm.get_disk_details, disk_index,
+                               on_done=lambda details: self._fill_details(text_widget, details),
+                               on_error=lambda e: self._fill_details(text_widget, f"Error: {e}"),
+                               disk=disk_index, name="Disk details")
 
     def show_partition_details(self):
-        if not all([self.disk_tree.selection(), self.part_tree.selection()]):
+        if not all([self.disk_rows.selection(), self.part_rows.selection()]):
             messagebox.showwarning("Warning", "Please select both disk and partition")
             return
         
-        disk_index = self.disk_tree.selection()[0]
-        partition_index = self.part_tree.selection()[0]
-        details = self.pm.get_partition_details(disk_index, partition_index)
+        disk_index = self.disk_rows.selection()[0]
+        offset = self._selected_partition()
+        text_widget = self._details_window("Partition Details")
+        self.dispatcher.submit(self._at_offset(self.pm.get_partition_details), disk_index, offset,
+                               on_done=lambda details: self._fill_details(text_widget, details),
+                               on_error=lambda e: self._fill_details(text_widget, f"Error: {e}"),
+                               disk=disk_index, name="Partition details")
+
+    def show_layout_health(self):
+        """Alignment, free space and slack of every disk's partitions."""
+        text_widget = self._details_window("Layout Health")
+        self.dispatcher.submit(self.topology_cache.get,
+                               on_done=lambda topology: self._fill_details(
+                                   text_widget, layout_health.check_topology(topology).format_text()),
+                               on_error=lambda e: self._fill_details(text_widget, f"Error: {e}"),
+                               name="Layout health")
+
+    def io_test_dialog(self):
+        """Measure the throughput and latency of the selected partition's volume."""
+        if not all([self.disk_rows.selection(), self.part_rows.selection()]):
+            messagebox.showwarning("Warning", "Please select both disk and partition")
+            return
+        partition = self._partitions.get(self.part_rows.selection()[0])
+        if partition is None or not partition.volumes or not partition.volumes[0].device_id:
+            messagebox.showwarning("Warning", "The selected partition has no drive letter")
+            return
         
+        disk_index = self.disk_rows.selection()[0]
+        volume = partition.volumes[0]
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"I/O Test - {volume.device_id}")
+        dialog.geometry("720x450")
+        
+        options = ttk.Frame(dialog)
+        options.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(options, text="Block size (KB):").pack(side=tk.LEFT)
+        block = ttk.Combobox(options, values=("4", "64", "1024"), width=6)
+        block.set("64")
+        block.pack(side=tk.LEFT, padx=5)
+        ttk.Label(options, text="Queue depth:").pack(side=tk.LEFT)
+        depth = ttk.Combobox(options, values=("1", "4", "16", "32"), width=4)
+        depth.set("4")
+        depth.pack(side=tk.LEFT, padx=5)
+        ttk.Label(options, text="Seconds per test:").pack(side=tk.LEFT)
+        seconds = ttk.Entry(options, width=5)
+        seconds.insert(0, "5")
+        seconds.pack(side=tk.LEFT, padx=5)
+        writes = tk.BooleanVar(value=False)
+        ttk.Checkbutton(dialog, text=f"Also test writes, to a scratch file on {volume.device_id}",
+                        variable=writes).pack(anchor=tk.W, padx=5)
+        
+        text_widget = tk.Text(dialog, wrap=tk.NONE, height=15)
+        text_widget.pack(fill=tk.BOTH, expand=True, padx=5)
+        text_widget.configure(state='disabled')
+        buttons = ttk.Frame(dialog)
+        buttons.pack(pady=5)
+        probe = [None]
+        report = {}
+        
+        def done(result):
+            results, details = result
+            if not dialog.winfo_exists():
+                return
+            run_button.config(state=tk.NORMAL)
+            report.clear()
+            report.update(disk=disk_index, volume=volume.device_id,
+                          time=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                          disk_details=details, results=results)
+            self._fill_details(text_widget, f"{io_probe.format_results(results)}\n\n"
+                                            f"Disk {disk_index} details:\n{details}")
+            export_button.config(state=tk.NORMAL)
+        
+        def failed(e):
+            if dialog.winfo_exists():
+                run_button.config(state=tk.NORMAL)
+                self._fill_details(text_widget, f"Error: {e}")
+        
+        def run():
+            try:
+                block_size = io_probe.parse_block_size(block.get())
+                queue_depth = io_probe.parse_queue_depth(depth.get())
+                duration = float(seconds.get())
+                if duration <= 0:
+                    raise ValueError("Seconds per test must be positive")
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            probe[0] = io_probe.IOProbe(rf"\\.\{volume.device_id}", block_size, queue_depth,
+                                        duration, size=volume.size,
+                                        scratch_dir=volume.device_id + "\\")
+            tests = io_probe.READ_TESTS + (io_probe.WRITE_TESTS if writes.get() else ())
+            run_button.config(state=tk.DISABLED)
+            self._fill_details(text_widget, "Running...")
+            # Queued behind operations on the disk, so a shrink or extend
+            # does not skew the numbers
+            self.dispatcher.submit(self._run_io_test, probe[0], tests, disk_index,
+                                   on_done=done, on_error=failed, disk=disk_index,
+                                   name="I/O test")
+        
+        def export():
+            directory = metrics.default_export_dir()
+            path = os.path.join(directory, f"io-test-disk{disk_index}-"
+                                           f"{report['time'].replace(':', '')}.json")
+            try:
+                os.makedirs(directory, exist_ok=True)
+                info = dict(report)
+                io_probe.save_report(path, info.pop("results"), **info)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not export the results: {e}")
+                return
+            messagebox.showinfo("Info", f"Results written to {path}")
+        
+        def close():
+            if probe[0] is not None:
+                probe[0].cancel()
+            dialog.destroy()
+        
+        run_button = ttk.Button(buttons, text="Run", command=run)
+        run_button.pack(side=tk.LEFT, padx=5)
+        export_button = ttk.Button(buttons, text="Export", command=export, state=tk.DISABLED)
+        export_button.pack(side=tk.LEFT, padx=5)
+        dialog.protocol("WM_DELETE_WINDOW", close)
+
+    def _run_io_test(self, probe, tests, disk_index):
+        results = probe.run(tests)
+        return results, self.pm.get_disk_details(disk_index)
+
+    def _details_window(self, title):
+        # Create details window
         details_window = tk.Toplevel(self.root)
-        details_window.title(f"Partition Details")
+        details_window.title(title)
         details_window.geometry("600x400")
         
+        # Add text widget with scrollbar
         text_widget = tk.Text(details_window, wrap=tk.WORD)
         scrollbar = ttk.Scrollbar(details_window, command=text_widget.yview)
         text_widget.configure(yscrollcommand=scrollbar.set)
@@ -399,52 +761,167 @@ class PartitionManagerGUI:
         text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        text_widget.insert(tk.END, details)
+        text_widget.insert(tk.END, "Loading...")
+        text_widget.configure(state='disabled')
+        return text_widget
+
+    def _fill_details(self, text_widget, details):
+        if not text_widget.winfo_exists():
+            return
+        text_widget.configure(state='normal')
+        text_widget.delete("1.0", tk.END)
+        text_widget.insert(tk.END, details or "")
         text_widget.configure(state='disabled')
 
     def shrink_partition_dialog(self):
-        if not all([self.disk_tree.selection(), self.part_tree.selection()]):
+        if not all([self.disk_rows.selection(), self.part_rows.selection()]):
             messagebox.showwarning("Warning", "Please select both disk and partition")
             return
         
         dialog = tk.Toplevel(self.root)
         dialog.title("Shrink Partition")
-        dialog.geometry("400x200")
+        dialog.geometry("450x200")
         
         ttk.Label(dialog, text="Amount to shrink (MB):").pack(pady=5)
         size_entry = ttk.Entry(dialog)
         size_entry.pack(pady=5)
         
+        partition = self._partitions.get(self.part_rows.selection()[0])
+        limit = extents.max_shrink_mb(partition) if partition is not None else None
+        ttk.Label(dialog, text=self._range_text(limit)).pack()
+        
         warning_text = ("Warning: Shrinking a partition may make some files inaccessible.\n"
                        "Make sure to backup important data before proceeding.\n"
                        "Example: To shrink by 50GB, enter: 51200")
         ttk.Label(dialog, text=warning_text, wraplength=350).pack(pady=10)
         
+        analyzer = None
+        if partition is not None and partition.volumes and partition.volumes[0].device_id:
+            analyzer = self._usage_panel(dialog, partition.volumes[0].device_id, size_entry)
+        
+        def close():
+            if analyzer is not None:
+                analyzer.cancel()
+            dialog.destroy()
+        
         def shrink():
             try:
-                disk_index = self.disk_tree.selection()[0]
-                partition_index = self.part_tree.selection()[0]
+                disk_index = self.disk_rows.selection()[0]
+                offset = self._selected_partition()
                 size_mb = size_entry.get()
-                if not size_mb.isdigit():
-                    raise ValueError("Size must be a positive number")
-                Thread(target=self._shrink_partition, 
-                       args=(disk_index, partition_index, size_mb)).start()
-                dialog.destroy()
+                if partition is not None:
+                    size_mb = extents.check_shrink(partition, size_mb)
+                else:
+                    size_mb = extents.parse_size_mb(size_mb)
+                self._shrink_partition(disk_index, offset, size_mb)
+                close()
             except Exception as e:
                 messagebox.showerror("Error", str(e))
         
         ttk.Button(dialog, text="Shrink", command=shrink).pack(pady=10)
-
-    def _shrink_partition(self, disk_index, partition_index, size_mb):
-        try:
-            self.pm.shrink_partition(disk_index, partition_index, size_mb)
-            self.root.after(1000, self.refresh_disk_list)
-            messagebox.showinfo("Success", "Partition shrunk successfully")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to shrink partition: {str(e)}")
+        dialog.protocol("WM_DELETE_WINDOW", close)
+
+    def _usage_panel(self, dialog, volume, size_entry):
+        """Add an "Analyze Usage" section to the shrink dialog; returns its analyzer.
+
+        The scan runs in the background and shows its progress; when it is
+        done the largest folders and files are listed and the recommended
+        shrink can be copied into ``size_entry``.
+        """
+        root = volume.rstrip("\\") + "\\"
+        frame = ttk.LabelFrame(dialog, text=f"Usage of {volume}")
+        frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        status = ttk.Label(frame, text="Scan the volume to see what uses its space.")
+        status.pack(anchor=tk.W, padx=5)
+        listing = tk.Text(frame, height=8, wrap=tk.NONE)
+        buttons = ttk.Frame(frame)
+        buttons.pack(pady=5)
+        recommended = []
+        scanning = [False]
+        last_progress = [0.0]
+        
+        def on_directory(path, size, files):
+            # Called for every directory on the scan threads; keep the Tk
+            # queue to a few updates a second
+            now = time.monotonic()
+            if now - last_progress[0] >= 0.2:
+                last_progress[0] = now
+                self.dispatcher.post(show_progress, path)
+        
+        def show_progress(path):
+            if scanning[0] and status.winfo_exists():
+                status.config(text=f"Scanning {path}")
+        
+        analyzer = usage.VolumeAnalyzer(cache=self.usage_cache, on_directory=on_directory)
+        
+        def done(report):
+            scanning[0] = False
+            if not dialog.winfo_exists():
+                return
+            analyze.config(state=tk.NORMAL)
+            dialog.geometry("450x480")
+            recommended[:] = [report.recommended_shrink_mb()]
+            status.config(text=f"{_size(report.used)} used by {report.files:,} files in "
+                               f"{report.directories:,} folders ({report.elapsed:.1f} s)"
+                               f"\nRecommended maximum shrink: {recommended[0]} MB")
+            lines = ["Largest folders:"]
+            lines += [f"  {_size(size):>10}  {root if name == '.' else root + name}"
+                      for size, name in report.branches[:8]]
+            lines.append("Largest files:")
+            lines += [f"  {_size(size):>10}  {path}" for size, path in report.largest_files[:8]]
+            if report.errors:
+                lines.append(f"{report.errors} files or folders could not be read")
+            listing.delete("1.0", tk.END)
+            listing.insert(tk.END, "\n".join(lines))
+            listing.pack(fill=tk.BOTH, expand=True, padx=5, before=buttons)
+            use.config(state=tk.NORMAL)
+        
+        def failed(e):
+            scanning[0] = False
+            if dialog.winfo_exists():
+                analyze.config(state=tk.NORMAL)
+                status.config(text=f"Could not analyze {volume}: {e}")
+        
+        def start():
+            scanning[0] = True
+            analyze.config(state=tk.DISABLED)
+            status.config(text=f"Scanning {root}")
+            self.dispatcher.submit(self._analyze_usage, analyzer, root,
+                                   on_done=done, on_error=failed,
+                                   priority=BACKGROUND, name="Analyze volume usage")
+        
+        def use_recommended():
+            size_entry.delete(0, tk.END)
+            size_entry.insert(0, str(recommended[0]))
+        
+        analyze = ttk.Button(buttons, text="Analyze Usage", command=start)
+        analyze.pack(side=tk.LEFT, padx=5)
+        use = ttk.Button(buttons, text="Use Recommended", command=use_recommended,
+                         state=tk.DISABLED)
+        use.pack(side=tk.LEFT, padx=5)
+        return analyzer
+
+    def _analyze_usage(self, analyzer, root):
+        """Scan ``root`` on a worker, reusing and updating the usage cache."""
+        if not self.usage_cache.loaded:
+            self.usage_cache.load()
+        report = analyzer.scan(root)
+        if not report.cancelled:
+            try:
+                self.usage_cache.save()
+            except OSError:
+                pass
+        return report
+
+    def _shrink_partition(self, disk_index, offset, size_mb):
+        self._run_operation(disk_index, self._at_offset(self.pm.shrink_partition),
+                            (disk_index, offset, size_mb),
+                            success="Partition shrunk successfully",
+                            failure="Failed to shrink partition",
+                            progress_title="Shrinking Partition")
 
     def convert_disk_dialog(self):
-        if not self.disk_tree.selection():
+        if not self.disk_rows.selection():
             messagebox.showwarning("Warning", "Please select a disk first")
             return
         
@@ -467,9 +944,8 @@ class PartitionManagerGUI:
             if messagebox.askyesno("Confirm", 
                                   "This will DELETE ALL DATA on the disk. Continue?"):
                 try:
-                    disk_index = self.disk_tree.selection()[0]
-                    Thread(target=self._convert_disk, 
-                           args=(disk_index, disk_type.get())).start()
+                    disk_index = self.disk_rows.selection()[0]
+                    self._convert_disk(disk_index, disk_type.get())
                     dialog.destroy()
                 except Exception as e:
                     messagebox.showerror("Error", str(e))
@@ -477,12 +953,10 @@ class PartitionManagerGUI:
         ttk.Button(dialog, text="Convert", command=convert).pack(pady=10)
 
     def _convert_disk(self, disk_index, type_to):
-        try:
-            self.pm.convert_disk(disk_index, type_to)
-            self.root.after(1000, self.refresh_disk_list)
-            messagebox.showinfo("Success", "Disk converted successfully")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to convert disk: {str(e)}")
+        self._run_operation(disk_index, self.pm.convert_disk, (disk_index, type_to),
+                            success="Disk converted successfully",
+                            failure="Failed to convert disk",
+                            progress_title="Converting Disk")
 
     def create_developer_info(self):
         # Create developer info frame at the bottom
@@ -506,9 +980,25 @@ class PartitionManagerGUI:
         import webbrowser
         webbrowser.open("http://kamrulmollah.com")
 
+def _ms(seconds):
+    return "" if seconds is None else f"{seconds * 1000:.1f} ms"
+
+
+def _size(size):
+    if size < 1024**3:
+        return f"{size / (1024**2):.1f} MB"
+    return f"{size / (1024**3):.2f} GB"
+
+
+def is_admin():
+    # Platform modules are imported on first use so this module (and the
+    # core it re-exports) can be imported quickly, and off Windows
+    import ctypes
+    return bool(ctypes.windll.shell32.IsUserAnAdmin())
+
 def main():
     # Replace the Unix-specific check with a Windows admin check
-    if not ctypes.windll.shell32.IsUserAnAdmin():
+    if not is_admin():
         messagebox.showerror("Error", "This application must be run as administrator")
         sys.exit(1)
 
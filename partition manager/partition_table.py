@@ -0,0 +1,288 @@
+"""Read-only MBR/GPT partition table reader.
+
+Parses the partition table straight from a disk image or block device
+(\\\\.\\PhysicalDriveN on Windows) without diskpart or WMI. Images are
+mapped with mmap and parsed through memoryview slices with
+struct.unpack_from, so no part of the image is copied; devices that cannot
+be mapped are read with one readinto() per region. Both GPT CRC32s are
+checked, and the backup GPT is used if the primary one is damaged.
+"""
+import fnmatch
+import mmap
+import os
+import struct
+import uuid
+import zlib
+
+from topology import DiskNode, PartitionNode
+
+MBR_ENTRY = struct.Struct("<B3sB3sII")
+GPT_HEADER = struct.Struct("<8sIIII QQQQ 16s QIII")
+GPT_ENTRY = struct.Struct("<16s16sQQQ72s")
+GPT_SIGNATURE = b"EFI PART"
+PROTECTIVE_TYPE = 0xEE
+EXTENDED_TYPES = (0x05, 0x0F, 0x85)
+# GPT type of Windows data partitions, as guid_str() formats it
+BASIC_DATA = "ebd0a0a2-b9e5-4433-87c0-68b6b72699c7"
+SECTOR_SIZES = (512, 4096)
+# Enough to hold the MBR, GPT header and a 128 entry array at 4K sectors
+HEAD_BYTES = 6 * 4096 + 128 * 128
+
+
+class PartitionTableError(ValueError):
+    pass
+
+
+def guid_str(raw):
+    """Format a GPT mixed-endian GUID the way diskpart and Windows do."""
+    return str(uuid.UUID(bytes_le=bytes(raw)))
+
+
+class RawLayout:
+    """Result of reading one disk or image."""
+
+    __slots__ = ("path", "style", "sector_size", "size", "disk_guid",
+                 "header_crc_ok", "entries_crc_ok", "used_backup", "disk")
+
+    def __init__(self, path, style, sector_size, size):
+        self.path = path
+        self.style = style
+        self.sector_size = sector_size
+        self.size = size
+        self.disk_guid = None
+        self.header_crc_ok = None
+        self.entries_crc_ok = None
+        self.used_backup = False
+        self.disk = None
+
+    @property
+    def partitions(self):
+        return self.disk.partitions if self.disk is not None else []
+
+    def __repr__(self):
+        return (f"RawLayout({self.path!r}, style={self.style!r}, "
+                f"partitions={len(self.partitions)})")
+
+
+class _Source:
+    """Hands out memoryviews over regions of an image or device."""
+
+    def __init__(self, path):
+        self.file = open(path, "rb", buffering=0)
+        self.size = self.file.seek(0, os.SEEK_END)
+        self.map = None
+        self.view = None
+        try:
+            if self.size:
+                self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.view = memoryview(self.map)
+        except (OSError, ValueError):
+            self.map = None
+        if self.view is None:
+            # Devices that cannot be mapped: read the head in one call
+            buffer = bytearray(HEAD_BYTES)
+            self.file.seek(0)
+            length = self.file.readinto(buffer) or 0
+            self.head = memoryview(buffer)[:length]
+
+    def region(self, offset, length):
+        if self.view is not None:
+            if offset < 0 or offset + length > len(self.view):
+                raise PartitionTableError("Read past the end of the image")
+            return self.view[offset:offset + length]
+        if offset + length <= len(self.head):
+            return self.head[offset:offset + length]
+        buffer = bytearray(length)
+        self.file.seek(offset)
+        if (self.file.readinto(buffer) or 0) != length:
+            raise PartitionTableError("Read past the end of the device")
+        return memoryview(buffer)
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                # A slice is still referenced (e.g. by a traceback); the
+                # map is unmapped once it is collected.
+                pass
+        self.file.close()
+
+
+def _header_crc(header, header_size):
+    # CRC of the header with its own CRC field (bytes 16-19) taken as zero,
+    # computed incrementally so the header is not copied.
+    crc = zlib.crc32(header[:16])
+    crc = zlib.crc32(b"\0\0\0\0", crc)
+    return zlib.crc32(header[20:header_size], crc)
+
+
+def _read_gpt_header(source, lba, sector_size):
+    header = source.region(lba * sector_size, sector_size)
+    fields = GPT_HEADER.unpack_from(header)
+    if fields[0] != GPT_SIGNATURE:
+        return None
+    header_size = fields[2]
+    if not GPT_HEADER.size <= header_size <= sector_size:
+        return None
+    return fields, _header_crc(header, header_size) == fields[3]
+
+
+def _read_gpt(source, layout, sector_size, index):
+    primary = _read_gpt_header(source, 1, sector_size)
+    if primary is None:
+        raise PartitionTableError("No GPT header behind the protective MBR")
+    fields, header_ok = primary
+    entries = None
+    if header_ok:
+        entries = _read_entries(source, fields, sector_size)
+    if not header_ok or not entries[1]:
+        # Fall back to the backup header at the end of the disk
+        backup_lba = fields[6] or (source.size // sector_size - 1)
+        try:
+            backup = _read_gpt_header(source, backup_lba, sector_size)
+        except PartitionTableError:
+            backup = None
+        if backup is not None and backup[1]:
+            backup_entries = _read_entries(source, backup[0], sector_size)
+            if backup_entries[1]:
+                fields, header_ok, entries = backup[0], True, backup_entries
+                layout.used_backup = True
+        if entries is None:
+            entries = _read_entries(source, fields, sector_size)
+
+    layout.header_crc_ok = header_ok
+    layout.entries_crc_ok = entries[1]
+    layout.disk_guid = guid_str(fields[9])
+    disk = DiskNode(index, layout.path, size=layout.size,
+                    bytes_per_sector=sector_size, style="gpt")
+    for number, (type_guid, unique, first, last, attributes, name) in enumerate(entries[0]):
+        partition = PartitionNode(guid_str(unique), index, number,
+                                  offset=first * sector_size,
+                                  size=(last - first + 1) * sector_size,
+                                  type=guid_str(type_guid))
+        disk.partitions.append(partition)
+    layout.disk = disk
+
+
+def _read_entries(source, fields, sector_size):
+    """Return (used entries, CRC ok) for the entry array a header points at."""
+    entries_lba, count, entry_size, entries_crc = fields[10:14]
+    if entry_size < GPT_ENTRY.size or count * entry_size > 1024 * 1024:
+        raise PartitionTableError("Implausible GPT entry array")
+    array = source.region(entries_lba * sector_size, count * entry_size)
+    crc_ok = zlib.crc32(array) == entries_crc
+    used = []
+    for offset in range(0, count * entry_size, entry_size):
+        entry = GPT_ENTRY.unpack_from(array, offset)
+        if entry[0] != bytes(16):
+            used.append(entry)
+    return used, crc_ok
+
+
+def _read_mbr(source, layout, mbr, index):
+    disk = DiskNode(index, layout.path, size=layout.size,
+                    bytes_per_sector=layout.sector_size, style="mbr")
+    number = 0
+    for slot in range(4):
+        status, _, part_type, _, start, sectors = MBR_ENTRY.unpack_from(mbr, 446 + slot * 16)
+        if part_type == 0 or sectors == 0:
+            continue
+        disk.partitions.append(PartitionNode(f"{layout.path}#{slot + 1}", index, number,
+                                             offset=start * layout.sector_size,
+                                             size=sectors * layout.sector_size,
+                                             type=f"0x{part_type:02X}",
+                                             bootable=status == 0x80))
+        number += 1
+        if part_type in EXTENDED_TYPES:
+            number = _read_logical(source, layout, disk, start, number, index)
+    layout.disk = disk
+
+
+def _read_logical(source, layout, disk, extended_start, number, index):
+    """Follow the EBR chain of an extended partition."""
+    sector_size = layout.sector_size
+    ebr_lba = extended_start
+    seen = set()
+    while ebr_lba not in seen:
+        seen.add(ebr_lba)
+        ebr = source.region(ebr_lba * sector_size, 512)
+        if ebr[510:512] != b"\x55\xaa":
+            break
+        _, _, part_type, _, start, sectors = MBR_ENTRY.unpack_from(ebr, 446)
+        if part_type and sectors:
+            disk.partitions.append(PartitionNode(f"{layout.path}#{number + 1}", index, number,
+                                                 offset=(ebr_lba + start) * sector_size,
+                                                 size=sectors * sector_size,
+                                                 type=f"0x{part_type:02X}", primary=False))
+            number += 1
+        _, _, next_type, _, next_start, _ = MBR_ENTRY.unpack_from(ebr, 462)
+        if not next_type:
+            break
+        ebr_lba = extended_start + next_start
+    return number
+
+
+def read_layout(path, index=0):
+    """Read the partition table of an image or device at ``path``.
+
+    Returns a RawLayout whose ``disk`` is a topology.DiskNode, the same
+    record the GUI shows. Raises PartitionTableError if there is no table.
+    """
+    source = _Source(path)
+    try:
+        mbr = source.region(0, 512)
+        if mbr[510:512] != b"\x55\xaa":
+            raise PartitionTableError("No MBR boot signature")
+        types = [mbr[446 + slot * 16 + 4] for slot in range(4)]
+        if PROTECTIVE_TYPE in types:
+            for sector_size in SECTOR_SIZES:
+                try:
+                    header = source.region(sector_size, 8)
+                except PartitionTableError:
+                    continue
+                if header == GPT_SIGNATURE:
+                    break
+            layout = RawLayout(path, "gpt", sector_size, source.size)
+            _read_gpt(source, layout, sector_size, index)
+        else:
+            layout = RawLayout(path, "mbr", 512, source.size)
+            _read_mbr(source, layout, mbr, index)
+        del mbr
+        return layout
+    finally:
+        source.close()
+
+
+def physical_drive_path(disk_number):
+    return rf"\\.\PhysicalDrive{int(disk_number)}"
+
+
+def _scan_one(path):
+    try:
+        return path, read_layout(path), None
+    except (OSError, PartitionTableError, struct.error) as e:
+        return path, None, str(e)
+
+
+def iter_images(directory, patterns=("*",)):
+    for entry in os.scandir(directory):
+        if entry.is_file() and any(fnmatch.fnmatch(entry.name, p) for p in patterns):
+            yield entry.path
+
+
+def scan_images(directory, patterns=("*",), workers=None, chunksize=16):
+    """Read every matching image in ``directory`` with a process pool.
+
+    Yields (path, RawLayout or None, error message or None) as results
+    arrive, in directory order.
+    """
+    paths = list(iter_images(directory, patterns))
+    if not paths:
+        return
+    # multiprocessing is slow to import; only pay for it when scanning
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_scan_one, paths, chunksize=chunksize)
@@ -0,0 +1,294 @@
+"""Write MBR and GPT partition tables straight into disk images.
+
+ImageLayout edits the partition table of a raw or sparse image file with
+the same create_partition / delete_partition / extend_partition /
+convert_disk calls as PartitionManager, but without diskpart, so images
+can be built on any platform. Where a partition goes (1 MB alignment,
+first fit, the MBR and GPT limits) is decided by simulator.SimDisk, so an
+image is laid out the way diskpart would lay out a disk.
+
+Changes are made in memory and written by save(): one write for the start
+of the image (MBR, GPT header and entry array) and one for the backup GPT
+at its end. The entry array CRC is computed once and shared by both
+headers. Only primary MBR partitions are supported.
+"""
+import struct
+import uuid
+import zlib
+
+from partition_table import (BASIC_DATA, EXTENDED_TYPES, GPT_ENTRY, GPT_HEADER,
+                             GPT_SIGNATURE, MBR_ENTRY, PROTECTIVE_TYPE, read_layout)
+from simulator import MB, SimDisk, SimulationError
+
+BASIC_DATA_NAME = "Basic data partition"
+MBR_NTFS = 0x07
+ENTRY_COUNT = 128
+ENTRY_SIZE = 128
+# CHS fields of partitions beyond what CHS can address
+CHS_NONE = b"\xfe\xff\xff"
+
+
+def _check_style(style, sector_size):
+    # MBR readers, partition_table's included, assume 512 byte sectors
+    if style == "mbr" and sector_size != 512:
+        raise SimulationError("MBR images must use 512 byte sectors")
+
+
+class ImageLayout:
+    """Partition table of one image file, changed in memory until save().
+
+    ``partitions`` holds (offset, size, type, guid, bootable) in offset
+    order: ``type`` is a GPT type GUID string or an MBR type byte, ``guid``
+    the GPT unique partition GUID (None on MBR). Partition numbers passed
+    to the methods count from 1, as in diskpart.
+    """
+
+    def __init__(self, path, size, style="gpt", sector_size=512, partitions=(),
+                 disk_guid=None):
+        _check_style(style, sector_size)
+        self.path = path
+        self.size = size
+        self.style = style
+        self.sector_size = sector_size
+        self.partitions = sorted(partitions)
+        self.disk_guid = disk_guid or str(uuid.uuid4())
+        # A GPT left over from a conversion to MBR, cleared by save()
+        self._stale_gpt = False
+
+    @classmethod
+    def read(cls, path):
+        """Load the table of an existing image.
+
+        GPT partition names and attribute bits are not kept: save() writes
+        the default name and no attributes for every partition.
+        """
+        raw = read_layout(path)
+        partitions = []
+        for partition in raw.partitions:
+            if raw.style == "mbr":
+                part_type = int(partition.type, 16)
+                if part_type in EXTENDED_TYPES or partition.index >= 4:
+                    raise SimulationError(f"{path} has logical partitions, which "
+                                          f"cannot be rewritten")
+                partitions.append((partition.offset, partition.size, part_type, None,
+                                   partition.bootable))
+            else:
+                partitions.append((partition.offset, partition.size, partition.type,
+                                   partition.device_id, False))
+        return cls(path, raw.size, raw.style, raw.sector_size, partitions, raw.disk_guid)
+
+    def __repr__(self):
+        return (f"ImageLayout({self.path!r}, {self.style}, "
+                f"partitions={len(self.partitions)})")
+
+    # -- operations ----------------------------------------------------------
+
+    def sim(self):
+        """The layout as a simulator.SimDisk."""
+        return SimDisk(self.size, self.style,
+                       [(offset, size, None) for offset, size, _, _, _ in self.partitions],
+                       self.sector_size)
+
+    def _update(self, sim, part_type=None):
+        # Match partitions to the old ones by offset, which no operation
+        # here changes; anything new is a fresh partition
+        existing = {entry[0]: entry for entry in self.partitions}
+        if part_type is None:
+            part_type = BASIC_DATA if sim.style == "gpt" else MBR_NTFS
+        partitions = []
+        for offset, size, _ in sim.partitions:
+            entry = existing.get(offset)
+            if entry is None:
+                guid = str(uuid.uuid4()) if sim.style == "gpt" else None
+                entry = (offset, size, part_type, guid, False)
+            partitions.append((offset, size) + entry[2:])
+        self.partitions = partitions
+
+    def apply(self, operation):
+        """Apply a diskpart_batch.Operation; its disk number is ignored."""
+        self._update(self.sim().apply(operation))
+
+    def create_partition(self, size_mb=None, part_type=None):
+        """Add a partition of ``size_mb`` MB, or fill the largest free area.
+
+        ``part_type`` defaults to basic data on GPT and NTFS (0x07) on MBR.
+        """
+        self._update(self.sim().create_partition(size_mb), part_type)
+
+    def delete_partition(self, partition_number):
+        self._update(self.sim().delete_partition(partition_number))
+
+    def extend_partition(self, partition_number, size_mb=None):
+        self._update(self.sim().extend_partition(partition_number, size_mb))
+
+    def convert_disk(self, type_to):
+        sim = self.sim().convert_disk(type_to)
+        _check_style(sim.style, self.sector_size)
+        if self.style == "gpt":
+            self._stale_gpt = True
+        self.style = sim.style
+        if sim.style == "gpt":
+            self.disk_guid = str(uuid.uuid4())
+
+    # -- writing -------------------------------------------------------------
+
+    def _entry_sectors(self):
+        return -(-ENTRY_COUNT * ENTRY_SIZE // self.sector_size)
+
+    def _mbr(self, slots, signature=0):
+        mbr = bytearray(512)
+        struct.pack_into("<I", mbr, 440, signature)
+        for slot, (status, part_type, start, sectors) in enumerate(slots):
+            if start > 0xFFFFFFFF or sectors > 0xFFFFFFFF:
+                raise SimulationError(f"Partition {slot + 1} lies beyond the 2 TB an "
+                                      f"MBR disk can address")
+            MBR_ENTRY.pack_into(mbr, 446 + slot * 16, status,
+                                b"\x00\x02\x00" if part_type == PROTECTIVE_TYPE else CHS_NONE,
+                                part_type, CHS_NONE, start, sectors)
+        mbr[510:512] = b"\x55\xaa"
+        return mbr
+
+    def _gpt_header(self, buffer, offset, current, backup, entries_lba, entries_crc):
+        sectors = self.size // self.sector_size
+        entry_sectors = self._entry_sectors()
+        GPT_HEADER.pack_into(buffer, offset, GPT_SIGNATURE, 0x10000, GPT_HEADER.size, 0, 0,
+                             current, backup, 2 + entry_sectors,
+                             sectors - 2 - entry_sectors, uuid.UUID(self.disk_guid).bytes_le,
+                             entries_lba, ENTRY_COUNT, ENTRY_SIZE, entries_crc)
+        header = memoryview(buffer)[offset:offset + GPT_HEADER.size]
+        struct.pack_into("<I", buffer, offset + 16, zlib.crc32(header))
+
+    def regions(self):
+        """(offset, bytes) of each region save() writes, in image order."""
+        ss = self.sector_size
+        last = self.size // ss - 1
+        entry_sectors = self._entry_sectors()
+        # The start of the image up to the first usable sector also covers
+        # any GPT header and entries an MBR layout replaces
+        head = bytearray((2 + entry_sectors) * ss)
+        tail_offset = (last - entry_sectors) * ss
+        if self.style == "mbr":
+            head[:512] = self._mbr([(0x80 if bootable else 0, part_type,
+                                     offset // ss, size // ss)
+                                    for offset, size, part_type, _, bootable in self.partitions],
+                                   signature=uuid.UUID(self.disk_guid).int & 0xFFFFFFFF)
+            regions = [(0, head)]
+            if self._stale_gpt:
+                regions.append((tail_offset, bytes(self.size - tail_offset)))
+            return regions
+
+        entries = bytearray(entry_sectors * ss)
+        for number, (offset, size, part_type, guid, _) in enumerate(self.partitions):
+            GPT_ENTRY.pack_into(entries, number * ENTRY_SIZE, uuid.UUID(part_type).bytes_le,
+                                uuid.UUID(guid).bytes_le, offset // ss,
+                                (offset + size) // ss - 1, 0,
+                                BASIC_DATA_NAME.encode("utf-16-le"))
+        entries_crc = zlib.crc32(memoryview(entries)[:ENTRY_COUNT * ENTRY_SIZE])
+        head[:512] = self._mbr([(0, PROTECTIVE_TYPE, 1, min(last, 0xFFFFFFFF))])
+        self._gpt_header(head, ss, 1, last, 2, entries_crc)
+        head[2 * ss:] = entries
+        tail = bytearray(self.size - tail_offset)
+        tail[:len(entries)] = entries
+        self._gpt_header(tail, entry_sectors * ss, last, 1, last - entry_sectors, entries_crc)
+        return [(0, head), (tail_offset, tail)]
+
+    def save(self):
+        """Write the table into the image, one write per region."""
+        regions = self.regions()
+        with open(self.path, "r+b") as f:
+            for offset, data in regions:
+                f.seek(offset)
+                f.write(data)
+        self._stale_gpt = False
+
+
+def create_image(path, size_mb, style="gpt", sector_size=512):
+    """Create a sparse, empty image of ``size_mb`` MB; returns its unsaved layout."""
+    size = int(size_mb) * MB
+    with open(path, "wb") as f:
+        f.truncate(size)
+    return ImageLayout(path, size, style, sector_size)
+
+
+def provision(path, size_mb, style="gpt", sizes=(), sector_size=512):
+    """Create an image with one partition per entry of ``sizes``.
+
+    Each entry is a size in MB, or None for the largest free area.
+    """
+    layout = create_image(path, size_mb, style, sector_size)
+    for size in sizes:
+        layout.create_partition(size)
+    layout.save()
+    return layout
+
+
+def verify(layout):
+    """Read ``layout``'s image back; returns a list of differences."""
+    raw = read_layout(layout.path)
+    problems = []
+    if raw.style != layout.style:
+        problems.append(f"style is {raw.style}, expected {layout.style}")
+    if raw.sector_size != layout.sector_size:
+        problems.append(f"sector size is {raw.sector_size}, expected {layout.sector_size}")
+    if raw.style == "gpt" and not (raw.header_crc_ok and raw.entries_crc_ok):
+        problems.append("GPT CRC mismatch")
+    found = [(p.offset, p.size) for p in raw.partitions]
+    expected = [(offset, size) for offset, size, _, _, _ in layout.partitions]
+    if found != expected:
+        problems.append(f"partitions are {found}, expected {expected}")
+    elif raw.style == "gpt":
+        for partition, (_, _, part_type, guid, _) in zip(raw.partitions, layout.partitions):
+            if (partition.type, partition.device_id) != (part_type, guid):
+                problems.append(f"partition {partition.number} has type "
+                                f"{partition.type} and id {partition.device_id}")
+    return problems
+
+
+class ImageWriter:
+    """PartitionManager's partition calls, against image files.
+
+    ``disk`` is the path of an image instead of a disk number. Each call
+    reads the image's table, changes it and writes it back; to make several
+    changes to one image, use ImageLayout directly.
+    """
+
+    def _edit(self, path, method, *args):
+        layout = ImageLayout.read(path)
+        getattr(layout, method)(*args)
+        layout.save()
+        return layout
+
+    def create_partition(self, disk, size_mb=None):
+        return self._edit(disk, "create_partition", size_mb)
+
+    def delete_partition(self, disk, partition_number):
+        return self._edit(disk, "delete_partition", partition_number)
+
+    def extend_partition(self, disk, partition_number):
+        return self._edit(disk, "extend_partition", partition_number)
+
+    def extend_partition_with_size(self, disk, partition_number, size_mb):
+        return self._edit(disk, "extend_partition", partition_number, size_mb)
+
+    def convert_disk(self, disk, type_to):
+        return self._edit(disk, "convert_disk", type_to)
+
+
+def _provision_one(spec):
+    try:
+        provision(*spec)
+        return spec[0], None
+    except (OSError, SimulationError) as e:
+        return spec[0], str(e)
+
+
+def provision_images(specs, workers=None, chunksize=16):
+    """Provision images with a process pool.
+
+    ``specs`` are (path, size_mb, style, sizes) tuples as taken by
+    provision(). Yields (path, error message or None) in the order given.
+    """
+    # multiprocessing is slow to import; only pay for it when provisioning
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_provision_one, specs, chunksize=chunksize)
@@ -0,0 +1,154 @@
+"""Live progress from diskpart output.
+
+Long commands such as shrink, extend or convert can run for minutes.
+diskpart reports how far it got with lines like ``  40 percent completed``,
+usually rewritten in place with a carriage return, plus the odd status
+message. ProgressParser turns output, fed in whatever chunks it arrives,
+into ProgressEvents; DiskpartStream runs a diskpart process and yields the
+events as they happen instead of waiting for it to exit.
+"""
+import codecs
+import locale
+import re
+import subprocess
+import time
+
+import metrics
+
+PERCENT = re.compile(r"(\d{1,3}(?:[.,]\d+)?)\s*percent completed", re.IGNORECASE)
+_LINE_END = re.compile(r"[\r\n]")
+
+
+class ProgressEvent:
+    __slots__ = ("command", "percent", "phase", "elapsed", "eta")
+
+    def __init__(self, command, percent, phase, elapsed, eta):
+        self.command = command
+        self.percent = percent
+        self.phase = phase
+        self.elapsed = elapsed
+        self.eta = eta
+
+    def __repr__(self):
+        return (f"ProgressEvent({self.command!r}, percent={self.percent!r}, "
+                f"phase={self.phase!r})")
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "unknown"
+    seconds = int(seconds + 0.5)
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02}m"
+
+
+class ProgressParser:
+    """Turn chunks of diskpart output into ProgressEvents.
+
+    An event is produced when the percentage changes or a new message
+    line appears; each is passed to ``callback`` if given and returned by
+    feed(). The ETA assumes the rest of the command runs at the average
+    rate so far.
+    """
+
+    def __init__(self, callback=None, clock=time.monotonic):
+        self.callback = callback
+        self.clock = clock
+        self.start(None)
+
+    def start(self, command):
+        """Reset for the next command."""
+        self.command = command
+        self.percent = None
+        self.phase = None
+        self.started = self.clock()
+        self._partial = ""
+
+    def feed(self, text):
+        events = []
+        pieces = _LINE_END.split(self._partial + text)
+        self._partial = pieces.pop()
+        for piece in pieces:
+            self._line(piece, events)
+        # A percentage is often rewritten without a line end; report it now
+        if PERCENT.search(self._partial) and self._partial.rstrip().endswith("completed"):
+            self._line(self._partial, events)
+            self._partial = ""
+        return events
+
+    def _line(self, line, events):
+        line = line.strip()
+        if not line:
+            return
+        match = PERCENT.search(line)
+        if match:
+            percent = min(100.0, float(match.group(1).replace(",", ".")))
+            if percent == self.percent:
+                return
+            self.percent = percent
+        elif line == self.phase:
+            return
+        else:
+            self.phase = line
+        elapsed = self.clock() - self.started
+        eta = None
+        if self.percent:
+            eta = elapsed * (100 - self.percent) / self.percent
+        event = ProgressEvent(self.command, self.percent, self.phase, elapsed, eta)
+        events.append(event)
+        if self.callback is not None:
+            self.callback(event)
+
+
+class DiskpartStream:
+    """Run diskpart and iterate over its progress while it runs.
+
+        stream = DiskpartStream(["diskpart", "/s", script])
+        for event in stream:
+            print(event.percent, event.phase)
+        stream.output, stream.returncode
+
+    Output is read from the pipe as it arrives, not when the process exits.
+    """
+
+    def __init__(self, argv, command=None, encoding=None):
+        self.argv = list(argv)
+        self.command = command
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.output = None
+        self.returncode = None
+
+    def __iter__(self):
+        parser = ProgressParser()
+        parser.start(self.command)
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        chunks = []
+        run = metrics.start("diskpart.run")
+        with metrics.timer("diskpart.spawn"):
+            proc = subprocess.Popen(self.argv, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, bufsize=0,
+                                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        try:
+            while True:
+                data = proc.stdout.read(4096)
+                if not data:
+                    break
+                text = decoder.decode(data)
+                chunks.append(text)
+                yield from parser.feed(text)
+            text = decoder.decode(b"", final=True)
+            chunks.append(text)
+            yield from parser.feed(text + "\n")
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            self.returncode = proc.wait()
+            proc.stdout.close()
+            run.stop()
+            # Same newlines as subprocess.run(text=True) gave
+            self.output = "".join(chunks).replace("\r\n", "\n")
@@ -0,0 +1,478 @@
+"""What-if simulation of partition operations and a planner built on it.
+
+SimDisk is an immutable model of one disk's partition table. Applying an
+operation returns a new SimDisk, following diskpart's rules as the rest of
+this package understands them:
+
+* partitions are numbered from 1 in offset order and renumber when one is
+  created or deleted;
+* ``create`` with a size takes the first free area that is large enough,
+  without a size the largest one; starts and sizes are aligned to 1 MB;
+* an MBR disk holds at most 4 primary partitions, a GPT disk 128;
+* ``extend`` grows into free space directly after the partition;
+* ``shrink`` can give back at most the volume's free space, and only if the
+  partition has a file system;
+* ``convert`` needs a disk without partitions.
+
+Operations are diskpart_batch.Operation objects, so a simulated sequence can
+be queued on an OperationBatch as is. plan() searches for a cheap
+sequence that turns a disk into a target layout.
+"""
+import heapq
+import itertools
+
+from diskpart_batch import Operation
+from extents import (ALIGNMENT, GPT_ENTRY_LIMIT, GPT_RESERVED_SECTORS, MB,
+                     MBR_PRIMARY_LIMIT, hidden_reserved)
+
+# Relative cost of each operation for plan(). Shrinking moves data and can
+# take minutes; deleting a partition is also weighed by the data it held.
+COSTS = {
+    "create": 1,
+    "extend": 2,
+    "convert": 3,
+    "delete": 4,
+    "shrink": 10,
+}
+
+
+class SimulationError(ValueError):
+    pass
+
+
+def _align_up(value):
+    return -(-value // ALIGNMENT) * ALIGNMENT
+
+
+def _align_down(value):
+    return value // ALIGNMENT * ALIGNMENT
+
+
+class SimDisk:
+    """One disk: size and style plus (offset, size, used) per partition.
+
+    ``used`` is the number of bytes the volume needs, or None if the
+    partition has no file system (it then cannot be shrunk).
+    """
+
+    __slots__ = ("size", "style", "partitions", "sector_size", "end", "_key")
+
+    def __init__(self, size, style="gpt", partitions=(), sector_size=512):
+        self.size = size
+        self.style = style
+        self.partitions = tuple(sorted(partitions))
+        self.sector_size = sector_size
+        self.end = size
+        if style != "mbr":
+            # Leave room for the backup GPT at the end of the disk
+            self.end -= GPT_RESERVED_SECTORS * sector_size
+        self._key = (style, self.partitions)
+
+    @classmethod
+    def from_disk(cls, disk):
+        """Build from a topology.DiskNode; None if its layout is not fully known.
+
+        The Microsoft Reserved partition WMI does not list is added back,
+        so partitions are numbered the way diskpart numbers them. MBR disks
+        with logical partitions are not modelled and give None.
+        """
+        if disk is None or not disk.size:
+            return None
+        partitions = []
+        reserved = hidden_reserved(disk)
+        if reserved is not None:
+            partitions.append(reserved + (None,))
+        for partition in disk.partitions:
+            if partition.offset is None or partition.size is None or not partition.primary:
+                return None
+            used = None
+            if partition.volumes:
+                volume = partition.volumes[0]
+                if volume.filesystem and volume.free is not None:
+                    used = max(0, (volume.size or partition.size) - volume.free)
+            partitions.append((partition.offset, partition.size, used))
+        return cls(disk.size, disk.style or "gpt", partitions, disk.bytes_per_sector or 512)
+
+    def _replace(self, style=None, partitions=None):
+        return SimDisk(self.size, style or self.style,
+                       self.partitions if partitions is None else partitions,
+                       self.sector_size)
+
+    def __eq__(self, other):
+        return isinstance(other, SimDisk) and self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __len__(self):
+        return len(self.partitions)
+
+    def __repr__(self):
+        sizes = ", ".join(f"{size // MB}" for _, size, _ in self.partitions)
+        return f"SimDisk({self.style}, {self.size // MB} MB, partitions MB=[{sizes}])"
+
+    # -- queries -------------------------------------------------------------
+
+    def free(self):
+        """(offset, length) of every aligned free area, in offset order."""
+        gaps = []
+        position = ALIGNMENT
+        for offset, size, _ in self.partitions + ((self.end, 0, None),):
+            start, stop = _align_up(position), _align_down(offset)
+            if stop > start:
+                gaps.append((start, stop - start))
+            position = max(position, offset + size)
+        return gaps
+
+    def free_after(self, number):
+        """Bytes of free space directly after partition ``number``."""
+        partitions = self.partitions
+        offset, size, _ = partitions[self._index(number)]
+        following = partitions[number][0] if number < len(partitions) else self.end
+        return max(0, _align_down(following) - (offset + size))
+
+    def _index(self, number):
+        if not 1 <= number <= len(self.partitions):
+            raise SimulationError(f"There is no partition {number}")
+        return number - 1
+
+    # -- operations ----------------------------------------------------------
+
+    def create_partition(self, size_mb=None):
+        if self.style == "mbr" and len(self.partitions) >= MBR_PRIMARY_LIMIT:
+            raise SimulationError("An MBR disk can hold at most 4 primary partitions")
+        if len(self.partitions) >= GPT_ENTRY_LIMIT:
+            raise SimulationError("The GPT partition entry array is full")
+        gaps = self.free()
+        if size_mb is None:
+            if not gaps:
+                raise SimulationError("There is no unallocated space on the disk")
+            offset, size = max(gaps, key=lambda gap: gap[1])
+        else:
+            size = int(size_mb) * MB
+            offset = next((start for start, length in gaps if length >= size), None)
+            if offset is None:
+                raise SimulationError(f"No free area can hold {size_mb} MB")
+        return self._replace(partitions=self.partitions + ((offset, size, None),))
+
+    def delete_partition(self, number):
+        index = self._index(number)
+        return self._replace(partitions=self.partitions[:index] + self.partitions[index + 1:])
+
+    def extend_partition(self, number, size_mb=None):
+        index = self._index(number)
+        available = self.free_after(number)
+        size = available if size_mb is None else int(size_mb) * MB
+        if size <= 0 or size > available:
+            raise SimulationError(f"Partition {number} cannot grow by "
+                                  f"{size // MB} MB; {available // MB} MB follow it")
+        offset, old_size, used = self.partitions[index]
+        return self._set(index, (offset, old_size + size, used))
+
+    def shrink_partition(self, number, size_mb):
+        index = self._index(number)
+        offset, size, used = self.partitions[index]
+        if used is None:
+            raise SimulationError(f"Partition {number} has no file system and cannot "
+                                  f"be shrunk")
+        shrink = int(size_mb) * MB
+        if shrink <= 0 or shrink > size - used:
+            raise SimulationError(f"Partition {number} can shrink by at most "
+                                  f"{(size - used) // MB} MB")
+        return self._set(index, (offset, size - shrink, used))
+
+    def convert_disk(self, type_to):
+        if type_to not in ("gpt", "mbr"):
+            raise SimulationError("Type must be 'gpt' or 'mbr'")
+        if self.partitions:
+            raise SimulationError("Only a disk without partitions can be converted")
+        if type_to == self.style:
+            raise SimulationError(f"The disk is already {type_to.upper()}")
+        return self._replace(style=type_to)
+
+    def _set(self, index, partition):
+        partitions = list(self.partitions)
+        partitions[index] = partition
+        return self._replace(partitions=partitions)
+
+    def apply(self, operation):
+        """Return the disk after a diskpart_batch.Operation."""
+        kind = operation.kind
+        if kind == "create":
+            return self.create_partition(operation.size_mb)
+        if kind == "delete":
+            return self.delete_partition(operation.partition)
+        if kind == "extend":
+            return self.extend_partition(operation.partition, operation.size_mb)
+        if kind == "shrink":
+            return self.shrink_partition(operation.partition, operation.size_mb)
+        if kind == "convert":
+            return self.convert_disk(operation.type_to)
+        raise SimulationError(f"Unknown operation {kind!r}")
+
+    def simulate(self, operations):
+        """Apply ``operations`` in order and return the resulting disk.
+
+        Raises SimulationError naming the first operation that would fail.
+        """
+        disk = self
+        for position, operation in enumerate(operations, 1):
+            try:
+                disk = disk.apply(operation)
+            except SimulationError as e:
+                raise SimulationError(f"Operation {position} ({operation.kind}): {e}")
+        return disk
+
+
+class Simulator:
+    """Several SimDisks behind PartitionManager's method names.
+
+    Lets code written against PartitionManager do a dry run: every call
+    updates the model or raises SimulationError instead of running diskpart.
+    """
+
+    def __init__(self, disks):
+        self.disks = dict(disks)
+        self.operations = []
+
+    @classmethod
+    def from_topology(cls, topology):
+        disks = {}
+        for disk in topology:
+            sim = SimDisk.from_disk(disk)
+            if sim is not None:
+                disks[disk.index] = sim
+        return cls(disks)
+
+    def disk(self, disk_number):
+        try:
+            return self.disks[int(disk_number)]
+        except KeyError:
+            raise SimulationError(f"There is no disk {disk_number}")
+
+    def apply(self, operation):
+        self.disks[operation.disk] = self.disk(operation.disk).apply(operation)
+        self.operations.append(operation)
+
+    def create_partition(self, disk_number, size_mb=None):
+        self.apply(Operation("create", disk_number, size_mb=size_mb))
+
+    def delete_partition(self, disk_number, partition_number):
+        self.apply(Operation("delete", disk_number, partition_number))
+
+    def extend_partition(self, disk_number, partition_number):
+        self.apply(Operation("extend", disk_number, partition_number))
+
+    def extend_partition_with_size(self, disk_number, partition_number, size_mb):
+        self.apply(Operation("extend", disk_number, partition_number, size_mb))
+
+    def shrink_partition(self, disk_number, partition_number, size_mb):
+        self.apply(Operation("shrink", disk_number, partition_number, size_mb))
+
+    def convert_disk(self, disk_number, type_to):
+        self.apply(Operation("convert", disk_number, type_to=type_to))
+
+
+# -- planning -----------------------------------------------------------------
+
+def matches(disk, sizes, style=None):
+    """True if ``disk`` has exactly the partitions ``sizes`` describes.
+
+    ``sizes`` lists sizes in MB in offset order; a last entry of None means
+    "the rest of the disk": no free space may follow that partition.
+    """
+    if style is not None and disk.style != style:
+        return False
+    if len(disk.partitions) != len(sizes):
+        return False
+    for number, ((_, size, _), size_mb) in enumerate(zip(disk.partitions, sizes), 1):
+        if size_mb is None:
+            if disk.free_after(number) >= ALIGNMENT:
+                return False
+        elif size // MB != size_mb:
+            return False
+    return True
+
+
+def _matched_prefix(disk, sizes, style):
+    """How many leading partitions already have their target size."""
+    if style is not None and style != disk.style:
+        return 0
+    count = 0
+    for (_, size, _), size_mb in zip(disk.partitions, sizes):
+        if size_mb is None or size // MB != size_mb:
+            break
+        count += 1
+    return count
+
+
+def _lost(disk, number):
+    """Bytes of data deleting partition ``number`` destroys."""
+    _, size, used = disk.partitions[number - 1]
+    return size if used is None else used
+
+
+def _moves(disk, sizes, style, disk_number):
+    """Operations worth trying from ``disk`` towards the target.
+
+    Partitions that already match the start of the target are kept. Other
+    partitions that have their target size are only deleted to make room
+    for the partition before them to grow.
+    """
+    count = len(disk.partitions)
+    if style is not None and style != disk.style and not count:
+        yield Operation("convert", disk_number, type_to=style)
+    prefix = _matched_prefix(disk, sizes, style)
+    grows = False
+    for number, (_, size, used) in enumerate(disk.partitions, 1):
+        size_mb = sizes[number - 1] if number <= len(sizes) else None
+        wrong = number > len(sizes) or size_mb is None or size // MB != size_mb
+        if number > prefix and (wrong or grows):
+            yield Operation("delete", disk_number, number)
+        grows = number <= len(sizes) and (size_mb is None or size_mb > size // MB)
+        if number <= prefix or number > len(sizes):
+            continue
+        if size_mb is None:
+            if number == len(sizes) and disk.free_after(number) >= ALIGNMENT:
+                yield Operation("extend", disk_number, number)
+            continue
+        difference = size_mb - size // MB
+        if difference > 0 and difference * MB <= disk.free_after(number):
+            yield Operation("extend", disk_number, number, difference)
+        elif difference < 0 and used is not None and -difference * MB <= size - used:
+            yield Operation("shrink", disk_number, number, -difference)
+    if count < len(sizes) and (style is None or style == disk.style):
+        # A new partition lands in the first free area it fits in, so try
+        # the target size of the position each free area would fill
+        candidates = {sizes[count]}
+        partitions = disk.partitions
+        before = 0
+        for offset, _ in disk.free():
+            while before < count and partitions[before][0] < offset:
+                before += 1
+            if before < len(sizes):
+                candidates.add(sizes[before])
+        for size_mb in sorted(candidates, key=lambda size: (size is None, size)):
+            yield Operation("create", disk_number, size_mb=size_mb)
+
+
+def _estimate(disk, sizes, style, costs):
+    """A lower bound on the cost still needed to reach the target."""
+    count = len(disk.partitions)
+    if style is not None and style != disk.style:
+        # Everything goes, then the whole layout is created
+        return count * costs["delete"] + costs["convert"] + len(sizes) * costs["create"]
+    if count > len(sizes):
+        return (count - len(sizes)) * costs["delete"]
+    return (len(sizes) - count) * costs["create"]
+
+
+def _in_place_plan(disk, sizes, style, disk_number):
+    """Resize the partitions where they are: delete extras, shrink, extend, create."""
+    count = len(disk.partitions)
+    operations = []
+    if style is not None and style != disk.style:
+        if count:
+            return None
+        operations.append(Operation("convert", disk_number, type_to=style))
+    operations.extend(Operation("delete", disk_number, number)
+                      for number in range(count, len(sizes), -1))
+    kept = list(zip(range(1, count + 1), disk.partitions, sizes))
+    extends = []
+    for number, (_, size, _), size_mb in kept:
+        if size_mb is None:
+            extends.append(Operation("extend", disk_number, number))
+            continue
+        difference = size_mb - size // MB
+        if difference < 0:
+            operations.append(Operation("shrink", disk_number, number, -difference))
+        elif difference > 0:
+            extends.append(Operation("extend", disk_number, number, difference))
+    operations.extend(extends)
+    operations.extend(Operation("create", disk_number, size_mb=size_mb)
+                      for size_mb in sizes[len(kept):])
+    try:
+        if matches(disk.simulate(operations), sizes, style):
+            return operations
+    except SimulationError:
+        pass
+    return None
+
+
+def _wipe_plan(disk, sizes, style, disk_number):
+    operations = [Operation("delete", disk_number, number)
+                  for number in range(len(disk.partitions), 0, -1)]
+    if style is not None and style != disk.style:
+        operations.append(Operation("convert", disk_number, type_to=style))
+    operations.extend(Operation("create", disk_number, size_mb=size_mb) for size_mb in sizes)
+    return operations
+
+
+def plan(disk, sizes, style=None, disk_number=0, costs=None, max_states=5000):
+    """Return a list of Operations that gives ``disk`` the target layout.
+
+    ``sizes`` and ``style`` describe the target as for matches(). Plans that
+    delete the least data come first; among those the cheapest by ``costs``
+    (default COSTS) wins, so slow shrinks are used only when nothing else
+    gets there without deleting more. To stay fast on disks with many
+    partitions the search only tries the moves _moves() suggests rather
+    than every possible sequence, and looks at no more than ``max_states``
+    layouts; past that it settles for resizing the partitions in place or,
+    failing that, deleting every partition and creating the layout anew.
+    Raises SimulationError if the target cannot be reached at all.
+    """
+    costs = costs or COSTS
+    sizes = list(sizes)
+    if None in sizes[:-1]:
+        raise SimulationError("Only the last partition can take the rest of the disk")
+    if matches(disk, sizes, style):
+        return []
+    # Resizing in place is usually close to the best plan; nothing that is
+    # no better needs to be searched
+    fallback = _in_place_plan(disk, sizes, style, disk_number)
+    bound = None
+    if fallback is not None:
+        bound = (sum(_lost(disk, number) for number in range(len(sizes) + 1, len(disk) + 1)),
+                 plan_cost(fallback, costs))
+    tie = itertools.count()
+    # (bytes deleted, estimated total cost, cost so far, tie, layout, operations)
+    queue = [(0, _estimate(disk, sizes, style, costs), 0, next(tie), disk, ())]
+    best = {disk: (0, 0)}
+    while queue and len(best) <= max_states:
+        lost, _, cost, _, current, path = heapq.heappop(queue)
+        if (lost, cost) > best[current]:
+            continue
+        if matches(current, sizes, style):
+            return list(path)
+        for operation in _moves(current, sizes, style, disk_number):
+            try:
+                following = current.apply(operation)
+            except SimulationError:
+                continue
+            score = (lost, cost + costs[operation.kind])
+            if operation.kind == "delete":
+                score = (lost + _lost(current, operation.partition), score[1])
+            previous = best.get(following)
+            if previous is not None and score >= previous:
+                continue
+            estimate = score[1] + _estimate(following, sizes, style, costs)
+            if bound is not None and (score[0], estimate) >= bound:
+                continue
+            best[following] = score
+            heapq.heappush(queue, (score[0], estimate, score[1], next(tie),
+                                   following, path + (operation,)))
+    if fallback is not None:
+        return fallback
+    operations = _wipe_plan(disk, sizes, style, disk_number)
+    try:
+        result = disk.simulate(operations)
+    except SimulationError as e:
+        raise SimulationError(f"The target layout cannot be reached: {e}")
+    if not matches(result, sizes, style):
+        raise SimulationError("The target layout cannot be reached")
+    return operations
+
+
+def plan_cost(operations, costs=None):
+    costs = costs or COSTS
+    return sum(costs[operation.kind] for operation in operations)
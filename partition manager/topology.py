@@ -0,0 +1,299 @@
+"""Disk -> partition -> volume graph built from bulk WMI queries.
+
+Walking ``associators()`` from every disk and partition costs a COM round
+trip per object. TopologyLoader instead fetches each class once and joins
+the results in memory. Queries go through a backend object with a single
+method::
+
+    instances(class_name, properties, where=None) -> list of dicts
+
+``where`` is an optional WQL condition such as "DiskIndex = 3".
+
+WmiBackend implements it on top of the ``wmi`` package; fakes/fake_wmi.py
+provides one that runs anywhere.
+"""
+import threading
+
+import metrics
+
+DISK_PROPERTIES = ("Index", "DeviceID", "Model", "Size", "InterfaceType",
+                   "BytesPerSector")
+PARTITION_PROPERTIES = ("DeviceID", "DiskIndex", "Index", "StartingOffset",
+                        "Size", "Type", "BootPartition", "PrimaryPartition")
+LOGICAL_DISK_PROPERTIES = ("DeviceID", "Size", "FreeSpace", "FileSystem",
+                           "VolumeName")
+ASSOCIATION_PROPERTIES = ("Antecedent", "Dependent")
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def path_key(path):
+    """Return the key value of a WMI object path.
+
+    'ROOT\\CIMV2:Win32_LogicalDisk.DeviceID="C:"' -> 'C:'
+    """
+    _, _, key = path.partition("=")
+    key = key.strip()
+    if key.startswith('"') and key.endswith('"'):
+        key = key[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+    return key
+
+
+class VolumeNode:
+    __slots__ = ("device_id", "size", "free", "filesystem", "label")
+
+    def __init__(self, device_id, size=None, free=None, filesystem=None, label=None):
+        self.device_id = device_id
+        self.size = size
+        self.free = free
+        self.filesystem = filesystem
+        self.label = label
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __repr__(self):
+        return f"VolumeNode({self.device_id!r})"
+
+
+class PartitionNode:
+    __slots__ = ("device_id", "disk_index", "index", "offset", "size", "type",
+                 "bootable", "primary", "volumes")
+
+    def __init__(self, device_id, disk_index, index, offset=None, size=None,
+                 type=None, bootable=False, primary=True):
+        self.device_id = device_id
+        self.disk_index = disk_index
+        self.index = index
+        self.offset = offset
+        self.size = size
+        self.type = type
+        self.bootable = bootable
+        # False for a logical partition inside an MBR extended partition
+        self.primary = primary
+        self.volumes = []
+
+    @property
+    def number(self):
+        # WMI's Index plus one, for display. WMI does not list the Microsoft
+        # Reserved partition, so on GPT disks this can be lower than the
+        # number diskpart shows; commands use PartitionManager.partition_number.
+        return self.index + 1
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["volumes"] = [volume.to_dict() for volume in self.volumes]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        volumes = data.pop("volumes", [])
+        partition = cls(**data)
+        partition.volumes = [VolumeNode.from_dict(volume) for volume in volumes]
+        return partition
+
+    def __repr__(self):
+        return f"PartitionNode({self.device_id!r})"
+
+
+class DiskNode:
+    __slots__ = ("index", "device_id", "model", "size", "interface",
+                 "bytes_per_sector", "style", "partitions")
+
+    def __init__(self, index, device_id=None, model=None, size=None,
+                 interface=None, bytes_per_sector=None, style=None):
+        self.index = index
+        self.device_id = device_id
+        self.model = model
+        self.size = size
+        self.interface = interface
+        self.bytes_per_sector = bytes_per_sector
+        # "gpt", "mbr" or None if not known
+        self.style = style
+        self.partitions = []
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["partitions"] = [partition.to_dict() for partition in self.partitions]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        partitions = data.pop("partitions", [])
+        disk = cls(**data)
+        disk.partitions = [PartitionNode.from_dict(partition) for partition in partitions]
+        return disk
+
+    def __repr__(self):
+        return f"DiskNode({self.index!r}, partitions={len(self.partitions)})"
+
+
+class Topology:
+    """All disks keyed by index, each with its partitions sorted by offset."""
+
+    def __init__(self, disks=()):
+        self.disks = {disk.index: disk for disk in disks}
+
+    def __iter__(self):
+        return iter(sorted(self.disks.values(), key=lambda disk: disk.index))
+
+    def __len__(self):
+        return len(self.disks)
+
+    def disk(self, index):
+        return self.disks.get(int(index))
+
+    def replace_disk(self, index, disk):
+        """Swap in a freshly loaded disk, or drop it if ``disk`` is None."""
+        if disk is None:
+            self.disks.pop(int(index), None)
+        else:
+            self.disks[disk.index] = disk
+
+    def to_dict(self):
+        return {"disks": [disk.to_dict() for disk in self]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(DiskNode.from_dict(disk) for disk in data["disks"])
+
+
+class WmiBackend:
+    """Backend that runs WQL queries through the ``wmi`` package.
+
+    COM objects cannot be shared between threads, so unless a connection is
+    passed in, each thread that queries gets its own.
+    """
+
+    def __init__(self, connection=None):
+        self._connection = connection
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        if self._connection is not None:
+            return self._connection
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            import pythoncom
+            import wmi
+            pythoncom.CoInitialize()
+            connection = self._local.connection = wmi.WMI()
+        return connection
+
+    def instances(self, class_name, properties, where=None):
+        query = f"SELECT {', '.join(properties)} FROM {class_name}"
+        if where:
+            query += f" WHERE {where}"
+        rows = []
+        for obj in self.connection.query(query):
+            # wmi_property() returns the raw value, so association
+            # references stay object paths instead of being fetched.
+            rows.append({name: obj.wmi_property(name).value for name in properties})
+        return rows
+
+
+class TopologyLoader:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _instances(self, class_name, properties, where=None):
+        with metrics.timer(f"wmi.{class_name}"):
+            return self.backend.instances(class_name, properties, where)
+
+    def load(self):
+        """Fetch every class once and return the joined Topology."""
+        disk_rows = self._instances("Win32_DiskDrive", DISK_PROPERTIES)
+        partition_rows = self._instances("Win32_DiskPartition", PARTITION_PROPERTIES)
+        logical_rows = self._instances("Win32_LogicalDisk", LOGICAL_DISK_PROPERTIES)
+        disk_links = self._instances("Win32_DiskDriveToDiskPartition",
+                                     ASSOCIATION_PROPERTIES)
+        volume_links = self._instances("Win32_LogicalDiskToPartition",
+                                       ASSOCIATION_PROPERTIES)
+        return self.join(disk_rows, partition_rows, logical_rows,
+                         self._pairs(disk_links), self._pairs(volume_links))
+
+    def _pairs(self, links):
+        return [(path_key(link["Antecedent"]), path_key(link["Dependent"]))
+                for link in links]
+
+    def load_disk(self, index):
+        """Re-read a single disk. Returns None if the disk no longer exists."""
+        index = int(index)
+        disk_rows = self._instances("Win32_DiskDrive", DISK_PROPERTIES,
+                                    f"Index = {index}")
+        if not disk_rows:
+            return None
+        partition_rows = self._instances("Win32_DiskPartition", PARTITION_PROPERTIES,
+                                         f"DiskIndex = {index}")
+        # Association classes cannot be filtered by disk, but they only hold
+        # two short paths per row; logical disks are then fetched by key.
+        links = self._instances("Win32_LogicalDiskToPartition", ASSOCIATION_PROPERTIES)
+        volume_pairs = [pair for pair in self._pairs(links)
+                        if pair[0].startswith(f"Disk #{index},")]
+        logical_rows = []
+        if volume_pairs:
+            where = " OR ".join(f"DeviceID = '{volume_id}'" for _, volume_id in volume_pairs)
+            logical_rows = self._instances("Win32_LogicalDisk", LOGICAL_DISK_PROPERTIES,
+                                           where)
+        disk_id = disk_rows[0]["DeviceID"]
+        disk_pairs = [(disk_id, row["DeviceID"]) for row in partition_rows]
+        topology = self.join(disk_rows, partition_rows, logical_rows,
+                             disk_pairs, volume_pairs)
+        return topology.disk(index)
+
+    def join(self, disk_rows, partition_rows, logical_rows, disk_pairs, volume_pairs):
+        """Build a Topology from query rows and (antecedent, dependent) key pairs."""
+        disks = {}
+        for row in disk_rows:
+            disk = DiskNode(_int(row["Index"]), row["DeviceID"], row["Model"],
+                            _int(row["Size"]), row["InterfaceType"],
+                            _int(row["BytesPerSector"]))
+            disks[disk.device_id] = disk
+
+        partitions = {}
+        for row in partition_rows:
+            partition = PartitionNode(row["DeviceID"], _int(row["DiskIndex"]),
+                                      _int(row["Index"]), _int(row["StartingOffset"]),
+                                      _int(row["Size"]), row["Type"],
+                                      bool(row["BootPartition"]),
+                                      row["PrimaryPartition"] is not False)
+            partitions[partition.device_id] = partition
+
+        volumes = {}
+        for row in logical_rows:
+            volume = VolumeNode(row["DeviceID"], _int(row["Size"]),
+                                _int(row["FreeSpace"]), row["FileSystem"],
+                                row["VolumeName"])
+            volumes[volume.device_id] = volume
+
+        for disk_id, partition_id in disk_pairs:
+            disk = disks.get(disk_id)
+            partition = partitions.get(partition_id)
+            if disk is not None and partition is not None:
+                disk.partitions.append(partition)
+
+        for partition_id, volume_id in volume_pairs:
+            partition = partitions.get(partition_id)
+            volume = volumes.get(volume_id)
+            if partition is not None and volume is not None:
+                partition.volumes.append(volume)
+
+        for disk in disks.values():
+            disk.partitions.sort(key=lambda p: (p.offset or 0, p.index or 0))
+            if disk.partitions:
+                # WMI reports GPT partition types as "GPT: ..."
+                gpt = any((p.type or "").startswith("GPT") for p in disk.partitions)
+                disk.style = "gpt" if gpt else "mbr"
+        return Topology(disks.values())
@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+import time
+
+from topology import Topology
+
+
+def default_cache_path():
+    base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    return os.path.join(base, "Windows Partition Manager", "topology.json")
+
+
+class TopologyCache:
+    """Keeps the last loaded Topology between the GUI and WMI.
+
+    The whole topology is reloaded once it is older than ``ttl`` seconds.
+    A single disk can be invalidated after an operation on it finishes; the
+    next read of that disk re-queries only that disk. If ``path`` is given
+    the topology is written there after every load, so the next start can
+    show the last known layout before WMI has answered.
+    """
+
+    def __init__(self, loader, ttl=30, path=None, clock=time.monotonic):
+        self.loader = loader
+        self.ttl = ttl
+        self.path = path
+        self.clock = clock
+        self._topology = None
+        self._loaded_at = None
+        self._disk_loaded_at = {}
+        self._stale_disks = set()
+        self._lock = threading.RLock()
+
+    @property
+    def fresh(self):
+        """True if the cached topology can be used without re-querying."""
+        with self._lock:
+            return (self._loaded_at is not None
+                    and self.clock() - self._loaded_at < self.ttl)
+
+    @property
+    def topology(self):
+        """The cached topology, however old, or None if nothing is cached."""
+        return self._topology
+
+    def get(self):
+        """Return the topology, reloading it if it has expired."""
+        with self._lock:
+            if not self.fresh:
+                return self.refresh()
+            for index in list(self._stale_disks):
+                self._reload_disk(index)
+            return self._topology
+
+    def disk(self, index):
+        """Return one disk, re-reading only that disk if it is stale.
+
+        A disk is stale once it was invalidated or its own data is older
+        than ``ttl``; the rest of the topology is left alone.
+        """
+        index = int(index)
+        with self._lock:
+            if self._loaded_at is None:
+                return self.refresh().disk(index)
+            loaded_at = self._disk_loaded_at.get(index, self._loaded_at)
+            if index in self._stale_disks or self.clock() - loaded_at >= self.ttl:
+                self._reload_disk(index)
+            return self._topology.disk(index)
+
+    def refresh(self):
+        """Reload the whole topology now."""
+        topology = self.loader.load()
+        with self._lock:
+            self._topology = topology
+            self._loaded_at = self.clock()
+            self._disk_loaded_at.clear()
+            self._stale_disks.clear()
+        self.save()
+        return topology
+
+    def _reload_disk(self, index):
+        disk = self.loader.load_disk(index)
+        with self._lock:
+            self._topology.replace_disk(index, disk)
+            self._disk_loaded_at[index] = self.clock()
+            self._stale_disks.discard(index)
+        self.save()
+
+    def invalidate_disk(self, index):
+        with self._lock:
+            self._stale_disks.add(int(index))
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def save(self):
+        if not self.path or self._topology is None:
+            return
+        with self._lock:
+            data = json.dumps(self._topology.to_dict())
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    def load_saved(self):
+        """Load the topology saved by a previous run.
+
+        The result is treated as expired, so the next get() revalidates it.
+        Returns the topology, or None if there is no usable saved copy.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path) as f:
+                topology = Topology.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        with self._lock:
+            if self._topology is None:
+                self._topology = topology
+        return topology
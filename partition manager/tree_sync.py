@@ -0,0 +1,168 @@
+"""Incremental updates for flat ttk.Treeview lists.
+
+Clearing a Treeview and inserting every row again flickers, drops the
+selection and scroll position and gets slow with thousands of rows.
+TreeRows keeps a model of the rows keyed by stable ids and only inserts,
+updates, moves or deletes the Treeview items that actually changed.
+
+Above ``virtual_above`` rows it switches to a windowed mode: only the rows
+that fit in the widget are materialized, and the scrollbar and mouse wheel
+move the window over the model instead of scrolling the widget.
+
+TreeRows binds <<TreeviewSelect>> itself and calls ``on_select`` after it
+has recorded the new selection, so the callback can rely on selection().
+"""
+import metrics
+
+
+class TreeRows:
+    def __init__(self, tree, scrollbar=None, virtual_above=2000, on_select=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.virtual_above = virtual_above
+        self.rows = []
+        self.positions = {}
+        self.first = 0
+        self.virtual = False
+        self._shown = {}
+        self._shown_order = []
+        self._selected = ()
+        self.on_select = on_select
+        tree.bind("<<TreeviewSelect>>", self._on_select, add="+")
+        tree.bind("<MouseWheel>", self._on_wheel, add="+")
+        tree.bind("<Button-4>", self._on_wheel, add="+")
+        tree.bind("<Button-5>", self._on_wheel, add="+")
+
+    # -- model -------------------------------------------------------------
+
+    def set_rows(self, rows):
+        """Replace the model with ``rows``, a sequence of (iid, values)."""
+        self.rows = [(str(iid), tuple(values)) for iid, values in rows]
+        self.positions = {iid: position for position, (iid, _) in enumerate(self.rows)}
+        self._selected = tuple(iid for iid in self._selected if iid in self.positions)
+        self._set_virtual(len(self.rows) > self.virtual_above)
+        with metrics.timer("treeview.update"):
+            self._render()
+
+    def update_row(self, iid, values):
+        iid = str(iid)
+        position = self.positions.get(iid)
+        if position is None:
+            return
+        self.rows[position] = (iid, tuple(values))
+        if iid in self._shown and self._shown[iid] != self.rows[position][1]:
+            self.tree.item(iid, values=self.rows[position][1])
+            self._shown[iid] = self.rows[position][1]
+
+    def remove_row(self, iid):
+        iid = str(iid)
+        if iid in self.positions:
+            self.set_rows([row for row in self.rows if row[0] != iid])
+
+    def clear(self):
+        self.set_rows([])
+
+    def exists(self, iid):
+        return str(iid) in self.positions
+
+    def __len__(self):
+        return len(self.rows)
+
+    def selection(self):
+        """Selected ids, including a selected row scrolled out of the window."""
+        if not self.virtual:
+            return self.tree.selection()
+        return self._selected
+
+    # -- rendering ---------------------------------------------------------
+
+    def _set_virtual(self, virtual):
+        if virtual == self.virtual:
+            return
+        self.virtual = virtual
+        self.first = 0
+        if self.scrollbar is None:
+            return
+        if virtual:
+            self.scrollbar.configure(command=self.yview)
+            self.tree.configure(yscrollcommand="")
+        else:
+            self.scrollbar.configure(command=self.tree.yview)
+            self.tree.configure(yscrollcommand=self.scrollbar.set)
+
+    def _window(self):
+        if not self.virtual:
+            return 0, len(self.rows)
+        size = int(self.tree.cget("height"))
+        self.first = max(0, min(self.first, len(self.rows) - size))
+        return self.first, min(len(self.rows), self.first + size)
+
+    def _render(self):
+        start, end = self._window()
+        self._reconcile(self.rows[start:end])
+        if self.virtual:
+            if self.scrollbar is not None and self.rows:
+                total = len(self.rows)
+                self.scrollbar.set(start / total, end / total)
+            visible = [iid for iid in self._selected if iid in self._shown]
+            if visible and tuple(self.tree.selection()) != tuple(visible):
+                self.tree.selection_set(visible)
+
+    def _reconcile(self, rows):
+        tree = self.tree
+        wanted = {iid: values for iid, values in rows}
+        removed = [iid for iid in self._shown_order if iid not in wanted]
+        if removed:
+            tree.delete(*removed)
+        kept_old = [iid for iid in self._shown_order if iid in wanted]
+        kept_new = [iid for iid, _ in rows if iid in self._shown]
+        reorder = kept_old != kept_new
+        for position, (iid, values) in enumerate(rows):
+            shown = self._shown.get(iid)
+            if shown is None:
+                tree.insert("", position, iid=iid, values=values)
+                continue
+            if shown != values:
+                tree.item(iid, values=values)
+            if reorder:
+                tree.move(iid, "", position)
+        self._shown = wanted
+        self._shown_order = [iid for iid, _ in rows]
+
+    # -- events ------------------------------------------------------------
+
+    def _on_select(self, event=None):
+        selection = tuple(self.tree.selection())
+        if selection or not self.virtual:
+            self._selected = selection
+        else:
+            # Rows deleted as the window scrolls drop out of the widget's
+            # selection too; only rows still shown were deselected.
+            self._selected = tuple(iid for iid in self._selected if iid not in self._shown)
+        if self.on_select is not None:
+            self.on_select(event)
+
+    def yview(self, *args):
+        """Scrollbar command for windowed mode ('moveto' / 'scroll')."""
+        if not self.virtual:
+            return self.tree.yview(*args)
+        size = int(self.tree.cget("height"))
+        if args[0] == "moveto":
+            self.first = int(float(args[1]) * len(self.rows))
+        elif args[0] == "scroll":
+            step = size if args[2] == "pages" else 1
+            self.first += int(args[1]) * step
+        self._render()
+
+    def _on_wheel(self, event):
+        if not self.virtual:
+            return None
+        if getattr(event, "num", None) == 4:
+            delta = -3
+        elif getattr(event, "num", None) == 5:
+            delta = 3
+        else:
+            delta = -3 if event.delta > 0 else 3
+        self.first += delta
+        self._render()
+        return "break"
@@ -0,0 +1,282 @@
+"""Disk usage of a volume, for choosing how far it can shrink.
+
+VolumeAnalyzer walks a directory tree with os.scandir on a pool of threads.
+Memory grows with the number of directories, not files: each directory is
+summed as it is listed, passed to ``on_directory`` and reduced to a small
+record. UsageCache keeps those records keyed by the directory's mtime, so a
+re-scan only lists the directories whose entries changed since the last
+one. A directory's mtime does not change when a file in it grows in place,
+so cached totals can lag behind files that are being written to.
+"""
+import heapq
+import json
+import os
+import queue
+import shutil
+import stat
+import threading
+import time
+
+MB = 1024 * 1024
+GB = 1024 * MB
+# Free space left on the volume by the recommended shrink, so it does not
+# fill up right after shrinking
+RESERVE_FRACTION = 0.10
+MIN_RESERVE = GB
+
+
+def default_cache_path():
+    base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    return os.path.join(base, "Windows Partition Manager", "usage.json")
+
+
+class UsageCache:
+    """Per-directory totals keyed by path and the directory's mtime.
+
+    An entry is (mtime_ns, bytes, files, subdirectory names, largest files
+    as (size, name)). If ``path`` is given, load() and save() keep the cache
+    between runs.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def get(self, directory, mtime):
+        entry = self.entries.get(directory)
+        if entry is not None and entry[0] == mtime:
+            return entry
+        return None
+
+    def put(self, directory, entry):
+        with self._lock:
+            self.entries[directory] = entry
+
+    def prune(self, root, seen):
+        """Forget directories under ``root`` that the last full scan did not see."""
+        prefix = root.rstrip("\\/") + os.sep
+        with self._lock:
+            for directory in [d for d in self.entries
+                              if (d == root or d.startswith(prefix)) and d not in seen]:
+                del self.entries[directory]
+
+    def load(self):
+        self.loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for directory, (mtime, size, files, subdirs, largest) in data.items():
+                self.entries[directory] = (mtime, size, files, tuple(subdirs),
+                                           tuple(tuple(item) for item in largest))
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self.entries)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+
+class UsageReport:
+    """Result of VolumeAnalyzer.scan(); largest items come first."""
+
+    def __init__(self, root):
+        self.root = root
+        self.bytes = 0
+        self.files = 0
+        self.directories = 0
+        self.cached = 0
+        self.errors = 0
+        self.elapsed = 0.0
+        self.cancelled = False
+        # Subtree totals of the root's own subdirectories; "." is the
+        # root's own files
+        self.branches = []
+        self.largest_directories = []
+        self.largest_files = []
+        self.volume_size = None
+        self.volume_free = None
+
+    @property
+    def used(self):
+        """Bytes in use: what the scan found or the volume reports, if more."""
+        if self.volume_size is None:
+            return self.bytes
+        return max(self.bytes, self.volume_size - self.volume_free)
+
+    def recommended_shrink_mb(self):
+        """How far the volume can shrink while keeping some free space.
+
+        Only meaningful when the scan started at the root of the volume.
+        Windows may still allow less if unmovable files sit near its end.
+        """
+        if self.volume_size is None:
+            return None
+        reserve = max(int(self.volume_size * RESERVE_FRACTION), MIN_RESERVE)
+        return max(0, self.volume_size - self.used - reserve) // MB
+
+
+class _ScanState:
+    def __init__(self, root, top):
+        self.report = UsageReport(root)
+        self.top = top
+        self.branches = {}
+        self.directories = []
+        self.files = []
+        self.seen = set()
+        self.lock = threading.Lock()
+
+    def add(self, directory, branch, entry, cached):
+        _, size, files, subdirs, largest = entry
+        with self.lock:
+            report = self.report
+            report.bytes += size
+            report.files += files
+            report.directories += 1
+            report.cached += cached
+            self.seen.add(directory)
+            self.branches[branch] = self.branches.get(branch, 0) + size
+            _push(self.directories, self.top, (size, directory))
+            for file_size, name in largest:
+                _push(self.files, self.top, (file_size, os.path.join(directory, name)))
+
+    def error(self):
+        with self.lock:
+            self.report.errors += 1
+
+
+def _push(heap, limit, item):
+    if len(heap) < limit:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+def _is_link(st):
+    # Junctions and mount points are reparse points on Windows
+    return (stat.S_ISLNK(st.st_mode)
+            or getattr(st, "st_file_attributes", 0) & stat.FILE_ATTRIBUTE_REPARSE_POINT)
+
+
+class VolumeAnalyzer:
+    """Sum file sizes under a directory on ``workers`` threads.
+
+    ``on_directory(path, bytes, files)`` is called from the worker threads
+    as each directory is done, with the size of the files directly in it.
+    Symbolic links, junctions and other file systems mounted inside the
+    tree are not followed. cancel() also stops a scan that has not started
+    yet; a cancelled analyzer stays cancelled.
+    """
+
+    def __init__(self, workers=8, cache=None, top=20, on_directory=None):
+        self.workers = workers
+        self.cache = cache
+        self.top = top
+        self.on_directory = on_directory
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def scan(self, root):
+        root = os.path.abspath(root)
+        started = time.perf_counter()
+        state = _ScanState(root, self.top)
+        device = os.stat(root).st_dev
+        work = queue.Queue()
+        work.put((root, "."))
+        threads = [threading.Thread(target=self._worker, args=(work, state, device),
+                                    daemon=True, name=f"pm-usage-{number + 1}")
+                   for number in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        work.join()
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+
+        report = state.report
+        report.cancelled = self._cancel.is_set()
+        report.elapsed = time.perf_counter() - started
+        report.branches = sorted(((size, name) for name, size in state.branches.items()),
+                                 reverse=True)
+        report.largest_directories = sorted(state.directories, reverse=True)
+        report.largest_files = sorted(state.files, reverse=True)
+        try:
+            usage = shutil.disk_usage(root)
+            report.volume_size, report.volume_free = usage.total, usage.free
+        except OSError:
+            pass
+        if self.cache is not None and not report.cancelled:
+            self.cache.prune(root, state.seen)
+        return report
+
+    def _worker(self, work, state, device):
+        while True:
+            item = work.get()
+            if item is None:
+                work.task_done()
+                return
+            try:
+                if not self._cancel.is_set():
+                    self._visit(item, work, state, device)
+            except OSError:
+                state.error()
+            finally:
+                work.task_done()
+
+    def _visit(self, item, work, state, device):
+        directory, branch = item
+        mtime = os.stat(directory).st_mtime_ns
+        entry = self.cache.get(directory, mtime) if self.cache is not None else None
+        cached = entry is not None
+        if not cached:
+            entry = self._list(directory, mtime, state, device)
+            if self.cache is not None:
+                self.cache.put(directory, entry)
+        state.add(directory, branch, entry, cached)
+        at_root = branch == "."
+        for name in entry[3]:
+            work.put((os.path.join(directory, name), name if at_root else branch))
+        if self.on_directory is not None:
+            self.on_directory(directory, entry[1], entry[2])
+
+    def _list(self, directory, mtime, state, device):
+        size = files = 0
+        subdirs = []
+        largest = []
+        top = self.top
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    # is_dir() and is_file() come from the directory listing
+                    # itself; so does stat() on Windows, but not elsewhere
+                    if entry.is_dir(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        # st_dev is 0 on Windows until a full stat; reparse
+                        # points already cover mounted volumes there
+                        if not _is_link(st) and st.st_dev in (0, device):
+                            subdirs.append(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        file_size = entry.stat(follow_symlinks=False).st_size
+                        size += file_size
+                        files += 1
+                        if len(largest) < top:
+                            heapq.heappush(largest, (file_size, entry.name))
+                        elif file_size > largest[0][0]:
+                            heapq.heapreplace(largest, (file_size, entry.name))
+                except OSError:
+                    state.error()
+        return (mtime, size, files, tuple(subdirs), tuple(sorted(largest, reverse=True)))